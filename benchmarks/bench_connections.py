@@ -0,0 +1,134 @@
+"""
+Benchmark: idle control connections held by the index server
+
+Starts the server as a subprocess in each serving mode, opens N registered
+idle connections and reports server RSS and thread count (Linux /proc).
+
+Usage:
+    python benchmarks/bench_connections.py [--counts 500 2000 5000] [--modes threaded event]
+"""
+
+import sys
+import os
+import time
+import socket
+import argparse
+import resource
+import subprocess
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from protocol import Protocol, MessageType, MessageStream
+
+
+def read_proc_status(pid):
+    """
+    Read RSS (KB) and thread count of a process
+
+    Args:
+        pid: Process id
+
+    Returns:
+        tuple: (rss_kb, threads)
+    """
+    rss_kb, threads = 0, 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+            elif line.startswith('Threads:'):
+                threads = int(line.split()[1])
+    return rss_kb, threads
+
+
+def wait_for_port(port, timeout=10):
+    """Wait until the server accepts connections"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def run_mode(mode, count, port):
+    """
+    Measure one serving mode holding `count` idle connections
+
+    Returns:
+        dict: Measurement results
+    """
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'run_server.py'), '--mode', mode, '--port', str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    sockets = []
+    try:
+        if not wait_for_port(port):
+            raise RuntimeError("server did not start")
+        time.sleep(0.5)
+        base_rss, base_threads = read_proc_status(proc.pid)
+
+        start = time.perf_counter()
+        for i in range(count):
+            sock = socket.create_connection(('127.0.0.1', port))
+            stream = MessageStream(sock)
+            stream.send(Protocol.build_message(MessageType.HELLO, f"bench{i}", 10000 + i))
+            stream.recv()
+            sockets.append(sock)
+        elapsed = time.perf_counter() - start
+
+        # Every connection must still answer
+        stream = MessageStream(sockets[-1])
+        stream.send(Protocol.build_message(MessageType.PING, f"bench{count - 1}:{10000 + count - 1}"))
+        stream.recv()
+
+        rss, threads = read_proc_status(proc.pid)
+        return {
+            'mode': mode,
+            'connections': len(sockets),
+            'setup_s': elapsed,
+            'rss_mb': rss / 1024,
+            'kb_per_conn': (rss - base_rss) / max(1, len(sockets)),
+            'threads': threads,
+        }
+    except Exception as e:
+        return {'mode': mode, 'connections': len(sockets), 'error': str(e)}
+    finally:
+        for sock in sockets:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[500, 2000, 5000])
+    parser.add_argument('--modes', nargs='+', default=['threaded', 'event'])
+    parser.add_argument('--port', type=int, default=5900)
+    args = parser.parse_args()
+
+    # Both ends of every connection live on this box
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    print(f"{'mode':<10} {'conns':>7} {'setup s':>8} {'RSS MB':>8} {'KB/conn':>8} {'threads':>8}")
+    for count in args.counts:
+        for mode in args.modes:
+            r = run_mode(mode, count, args.port)
+            if 'error' in r:
+                print(f"{r['mode']:<10} {r['connections']:>7}  failed: {r['error']}")
+            else:
+                print(f"{r['mode']:<10} {r['connections']:>7} {r['setup_s']:>8.2f} "
+                      f"{r['rss_mb']:>8.1f} {r['kb_per_conn']:>8.1f} {r['threads']:>8}")
+
+
+if __name__ == "__main__":
+    main()
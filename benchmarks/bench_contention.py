@@ -0,0 +1,120 @@
+"""
+Benchmark: FETCH lookup latency under UPDATE write pressure
+
+Reader threads issue IndexManager.lookup_providers at a fixed rate while
+a writer thread keeps replacing half of a large client's file list with
+full UPDATE syncs. Latency is measured from each lookup's scheduled start
+(open loop), so a lookup stuck behind a long write is counted together
+with every lookup queued up behind it. Compares unbatched writes (lookups
+wait for a whole sync, as with a single global lock) against batched writes.
+
+Usage:
+    python benchmarks/bench_contention.py [--files 50000] [--readers 4] [--rate 200] [--seconds 5]
+"""
+
+import sys
+import os
+import time
+import random
+import logging
+import argparse
+import threading
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.index_manager import IndexManager
+from config import INDEX_WRITE_BATCH
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[k]
+
+
+def run(write_batch, files, readers, rate, seconds):
+    """
+    Run one mixed FETCH/UPDATE load
+
+    Returns:
+        dict: Lookup latency percentiles (ms) and operation counts
+    """
+    index = IndexManager(write_batch=write_batch)
+    names_a = [f"a_{i:07d}" for i in range(files)]
+    names_b = [f"b_{i:07d}" for i in range(files // 2)]
+    set_one = names_a
+    set_two = names_a[:files // 2] + names_b
+
+    # A small stable peer keeps the looked-up files present
+    index.register_client('stable:1', 1)
+    index.sync_client_files('stable:1', names_a[:1000])
+    index.register_client('big:2', 2)
+    index.sync_client_files('big:2', set_one)
+
+    stop = threading.Event()
+    latencies = [[] for _ in range(readers)]
+    syncs = [0]
+
+    def reader(out):
+        rng = random.Random()
+        interval = 1.0 / rate
+        scheduled = time.perf_counter()
+        while not stop.is_set():
+            now = time.perf_counter()
+            if now < scheduled:
+                time.sleep(scheduled - now)
+            index.lookup_providers(names_a[rng.randrange(1000)])
+            out.append(time.perf_counter() - scheduled)
+            scheduled += interval
+
+    def writer():
+        flip = False
+        while not stop.is_set():
+            index.sync_client_files('big:2', set_two if flip else set_one)
+            flip = not flip
+            syncs[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(latencies[i],)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    all_latencies = sorted(x for lst in latencies for x in lst)
+    return {
+        'lookups': len(all_latencies),
+        'syncs': syncs[0],
+        'p50': percentile(all_latencies, 50) * 1000,
+        'p99': percentile(all_latencies, 99) * 1000,
+        'p999': percentile(all_latencies, 99.9) * 1000,
+        'max': (all_latencies[-1] if all_latencies else 0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=200, help="Lookups per second per reader")
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    # Measure locking, not the log handler
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'write batch':<12} {'lookups':>8} {'syncs':>6} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'p99.9 ms':>9} {'max ms':>8}")
+    for label, batch in (('unbatched', 0), (str(INDEX_WRITE_BATCH), INDEX_WRITE_BATCH)):
+        r = run(batch, args.files, args.readers, args.rate, args.seconds)
+        print(f"{label:<12} {r['lookups']:>8} {r['syncs']:>6} {r['p50']:>8.3f} {r['p99']:>8.3f} "
+              f"{r['p999']:>9.3f} {r['max']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
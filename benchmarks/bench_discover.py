@@ -0,0 +1,82 @@
+"""
+Benchmark: full-index DISCOVER with and without the response cache
+
+Builds a Server in-process (no sockets) holding N files with a few
+providers each and times Server._handle_message for DISCOVER plus the
+framing a send does. Uncached, every request walks file_index, joins
+every provider string and encodes the result; cached, repeat requests
+at the same index version reuse the framed bytes. --writes-every
+publishes a new file after every K requests, as a busy network would.
+
+Usage:
+    python benchmarks/bench_discover.py [--files 1000 10000 100000] [--requests 50]
+"""
+
+import sys
+import os
+import time
+import logging
+import argparse
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from server.server import Server
+from protocol import Protocol, MessageType
+
+
+def build_server(files, providers):
+    """Server with `files` files, each published by `providers` clients"""
+    server = Server()
+    server.logger.setLevel(logging.WARNING)
+    server.index_manager.logger.setLevel(logging.WARNING)
+
+    names = [f"library/track_{i:07d}.mp3" for i in range(files)]
+    for p in range(providers):
+        hostname = f"peer{p}:{6000 + p}"
+        server.index_manager.register_client(hostname, 6000 + p)
+        server.index_manager.sync_client_files(hostname, names)
+    return server
+
+
+def time_discover(server, requests, writes_every, tag):
+    """Mean seconds per DISCOVER (handler + framing); `tag` keeps published names unique"""
+    discover = Protocol.build_message(MessageType.DISCOVER)
+    publisher = 'peer0:6000'
+    start = time.perf_counter()
+    for i in range(requests):
+        if writes_every and i and i % writes_every == 0:
+            server.index_manager.register_file(f"new/{tag}_{i}.bin", publisher)
+        _, response, _ = server._handle_message(discover, None)
+        Protocol.frame(response)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--providers', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--writes-every', type=int, default=0,
+                        help="Publish a file after every K requests (0 = read-only)")
+    args = parser.parse_args()
+
+    print(f"{'files':>7} {'uncached ms':>12} {'cached ms':>10} {'speedup':>8} {'hit rate':>9}")
+    for files in args.files:
+        server = build_server(files, args.providers)
+
+        server.discover_cache.max_entries = 0
+        uncached = time_discover(server, args.requests, args.writes_every, 'uncached')
+
+        server.discover_cache.max_entries = 1
+        cached = time_discover(server, args.requests, args.writes_every, 'cached')
+        stats = server.discover_cache.stats()
+        hit_rate = stats['hits'] / max(1, stats['hits'] + stats['misses'])
+
+        print(f"{files:>7} {uncached * 1000:>12.2f} {cached * 1000:>10.3f} "
+              f"{uncached / cached:>7.0f}x {hit_rate:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: buffered vs streaming peer download
+
+Serves a file from a PeerServer on loopback and downloads it with a
+single whole-file GET, two ways:
+
+- buffered: the previous receive loop, `received_data += chunk` with
+  CHUNK_SIZE reads, then FileManager.write_file of the whole content
+- streaming: Client._receive_to_disk, recv_into a reused buffer and
+  written to the partial file as it arrives
+
+Reports throughput (untraced run) and peak Python heap allocated during
+the download (tracemalloc run).
+
+Usage:
+    python benchmarks/bench_download.py [--sizes 4 16 32]
+"""
+
+import sys
+import os
+import time
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client.client import Client
+from client.file_manager import FileManager
+from client.peer_server import PeerServer
+from protocol import Protocol, MessageType, MessageStream
+from config import CHUNK_SIZE
+
+FNAME = 'payload.bin'
+
+
+def request(port):
+    """Open a connection, send a whole-file GET and read the DATA header"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    stream = MessageStream(sock)
+    stream.send(Protocol.build_message(MessageType.GET, FNAME, 'bench:1'))
+    msg_type, msg_data = Protocol.parse_message(stream.recv())
+    assert msg_type == MessageType.DATA, msg_data
+    return stream, msg_data['size']
+
+
+def buffered(client, port):
+    """Previous receive path: whole file accumulated in memory"""
+    stream, file_size = request(port)
+    received_data = b''
+    while len(received_data) < file_size:
+        chunk = stream.recv_raw(CHUNK_SIZE)
+        if not chunk:
+            break
+        received_data += chunk
+    client.file_manager.write_file(FNAME, received_data)
+    stream.sock.close()
+
+
+def streaming(client, port):
+    """Current receive path: recv_into a reused buffer, written to disk"""
+    stream, file_size = request(port)
+    received, _ = client._receive_to_disk(stream, FNAME, file_size)
+    assert received == file_size
+    client.file_manager.commit_partial(FNAME)
+    stream.sock.close()
+
+
+def measure(method, client, port):
+    """
+    Returns:
+        tuple: (seconds, peak traced bytes)
+    """
+    start = time.perf_counter()
+    method(client, port)
+    elapsed = time.perf_counter() - start
+    client.file_manager.delete_file(FNAME)
+
+    tracemalloc.start()
+    method(client, port)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    client.file_manager.delete_file(FNAME)
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[4, 16, 32], help="File sizes in MB")
+    parser.add_argument('--port', type=int, default=7900)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    workdir = tempfile.mkdtemp(prefix='bench_download_')
+    try:
+        source = FileManager(os.path.join(workdir, 'provider'))
+        server = PeerServer('127.0.0.1', args.port, source)
+        server.start()
+        client = Client(hostname='bench', port=args.port + 1, repo_path=os.path.join(workdir, 'client'))
+
+        print(f"{'MB':>6} {'path':<10} {'seconds':>8} {'MB/s':>8} {'peak MB':>8}")
+        for size in args.sizes:
+            with open(source.get_file_path(FNAME), 'wb') as f:
+                f.write(os.urandom(int(size * 1024 * 1024)))
+            for name, method in (('buffered', buffered), ('streaming', streaming)):
+                elapsed, peak = measure(method, client, args.port)
+                print(f"{size:>6g} {name:<10} {elapsed:>8.2f} {size / elapsed:>8.1f} {peak / 1024 / 1024:>8.1f}")
+
+        server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: resolving many filenames with FETCH versus FETCH_MANY
+
+Starts run_server.py, publishes a dataset, then looks up the providers of
+N files either one FETCH round trip at a time or with a single FETCH_MANY.
+On a real network every FETCH round trip also pays the link latency, so
+the gap grows with the RTT (--rtt adds it to the per-request figure).
+
+Usage:
+    python benchmarks/bench_fetch_many.py [--files 100 500 2000] [--mode event] [--rtt 0.5]
+"""
+
+import sys
+import os
+import time
+import socket
+import argparse
+import subprocess
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from protocol import Protocol, MessageType, MessageStream
+
+
+def wait_for_port(port, timeout=10):
+    """Wait until the server accepts connections"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def connect(port, name):
+    """Open a registered control connection"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    stream = MessageStream(sock)
+    stream.send(Protocol.build_message(MessageType.HELLO, name, 1))
+    stream.recv()
+    return stream
+
+
+def time_fetch(stream, names, rounds):
+    """Best time of `rounds` passes issuing one FETCH per name"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for fname in names:
+            stream.send(Protocol.build_message(MessageType.FETCH, fname))
+            stream.recv()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_fetch_many(stream, names, rounds):
+    """Best time of `rounds` passes issuing one FETCH_MANY for all names"""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        stream.send(Protocol.build_message(MessageType.FETCH_MANY, names))
+        msg_type, msg_data = Protocol.parse_message(stream.recv())
+        best = min(best, time.perf_counter() - start)
+    assert msg_type == MessageType.RESULTS and len(msg_data['providers']) == len(names)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--mode', choices=['threaded', 'event'], default='event')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--rtt', type=float, default=0.0, help="Network round trip to add, in ms")
+    parser.add_argument('--port', type=int, default=5970)
+    args = parser.parse_args()
+
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'run_server.py'), '--mode', args.mode, '--port', str(args.port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_for_port(args.port):
+            raise RuntimeError("server did not start")
+
+        # Two providers per file, as in a small swarm
+        names = [f"dataset/part_{i:05d}.bin" for i in range(max(args.files))]
+        seeds = [connect(args.port, f"seed{i}") for i in range(2)]
+        for i, stream in enumerate(seeds):
+            stream.send(Protocol.build_message(MessageType.UPDATE, f"seed{i}:1", names))
+            stream.recv()
+
+        stream = connect(args.port, 'bench')
+        print(f"{'files':>6} {'FETCH ms':>10} {'FETCH_MANY ms':>14} {'speedup':>8}")
+        for count in args.files:
+            subset = names[:count]
+            single = time_fetch(stream, subset, args.rounds) * 1000 + count * args.rtt
+            batched = time_fetch_many(stream, subset, args.rounds) * 1000 + args.rtt
+            print(f"{count:>6} {single:>10.1f} {batched:>14.2f} {single / batched:>7.0f}x")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
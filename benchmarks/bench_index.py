@@ -0,0 +1,102 @@
+"""
+Benchmark: IndexManager register/deregister/sync cost as the index grows
+
+Reports per-operation cost for growing files-per-client and
+providers-per-file. With hash-based provider maps and per-client file
+sets the cost per operation should stay flat.
+
+Usage:
+    python benchmarks/bench_index.py [--sizes 1000 5000 20000 50000]
+"""
+
+import sys
+import os
+import time
+import logging
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.index_manager import IndexManager
+
+
+def per_op_us(elapsed, ops):
+    """Convert elapsed seconds to microseconds per operation"""
+    return elapsed / max(1, ops) * 1e6
+
+
+def bench_files_per_client(n):
+    """One client publishing n files, re-syncing, then leaving"""
+    index = IndexManager()
+    index.register_client('peer:1', 1)
+    files = [f"file_{i:07d}.dat" for i in range(n)]
+
+    start = time.perf_counter()
+    for fname in files:
+        index.register_file(fname, 'peer:1')
+    register = per_op_us(time.perf_counter() - start, n)
+
+    # Full UPDATE replacing 10% of the files
+    changed = max(1, n // 10)
+    new_files = files[changed:] + [f"new_{i:07d}.dat" for i in range(changed)]
+    start = time.perf_counter()
+    index.sync_client_files('peer:1', new_files)
+    sync = per_op_us(time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    index.deregister_client('peer:1')
+    deregister = per_op_us(time.perf_counter() - start, n)
+
+    return register, sync, deregister
+
+
+def bench_providers_per_file(n):
+    """n clients publishing the same file, then leaving one by one"""
+    index = IndexManager()
+    hosts = [f"peer{i}:{i}" for i in range(n)]
+    for host in hosts:
+        index.register_client(host, 1)
+
+    start = time.perf_counter()
+    for host in hosts:
+        index.register_file('popular.iso', host)
+    register = per_op_us(time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    for host in hosts:
+        index.register_file('popular.iso', host)
+    republish = per_op_us(time.perf_counter() - start, n)
+
+    start = time.perf_counter()
+    for host in hosts:
+        index.deregister_client(host)
+    deregister = per_op_us(time.perf_counter() - start, n)
+
+    return register, republish, deregister
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000, 50000])
+    args = parser.parse_args()
+
+    # Measure the data structures, not the log handler
+    logging.disable(logging.CRITICAL)
+
+    print("Files per client (us/op)")
+    print(f"{'files':>8} {'register':>10} {'sync':>10} {'deregister':>11}")
+    for n in args.sizes:
+        register, sync, deregister = bench_files_per_client(n)
+        print(f"{n:>8} {register:>10.2f} {sync:>10.2f} {deregister:>11.2f}")
+
+    print()
+    print("Providers per file (us/op)")
+    print(f"{'providers':>9} {'register':>10} {'republish':>10} {'deregister':>11}")
+    for n in args.sizes:
+        register, republish, deregister = bench_providers_per_file(n)
+        print(f"{n:>9} {register:>10.2f} {republish:>10.2f} {deregister:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Benchmark: FETCH throughput with different logging pipelines
+
+Starts the index server with its log written to a file, loads the index
+and drives pipelined FETCH requests from several load-generator
+processes. Every FETCH logs at INFO twice (IndexManager lookup and
+Server fetch). Server CPU per request is reported as well, since
+on a machine with few cores the load generators also bound throughput.
+With --sink-rate the log goes
+to a pipe read at that many bytes per second instead, like a slow
+terminal or log shipper: synchronous writes then block request threads.
+Compared logging setups:
+
+- off: LOG_LEVEL = WARNING, hot-path records are never created
+- sync: a StreamHandler writes every record in the request thread
+- async: records are queued and written by a background thread
+- async + sampled: as async, at most LOG_SAMPLE_PER_SECOND records per call site
+
+Usage:
+    python benchmarks/bench_logging.py [--workers 4] [--duration 5] [--mode threaded] [--sink-rate 100000]
+"""
+
+import sys
+import os
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from protocol import Protocol, MessageType, MessageStream
+
+# Config overrides applied before the server imports its logging setup
+SETUPS = [
+    ('off', {'LOG_LEVEL': 'WARNING'}),
+    ('sync', {'LOG_ASYNC': False, 'LOG_SAMPLE_PER_SECOND': 0}),
+    ('async', {'LOG_ASYNC': True, 'LOG_SAMPLE_PER_SECOND': 0}),
+    ('async + sampled', {'LOG_ASYNC': True}),
+]
+
+SERVER_CODE = """
+import sys
+sys.path.insert(0, {root!r})
+import config
+for key, value in {overrides!r}.items():
+    setattr(config, key, value)
+sys.argv = ['run_server.py'] + {argv!r}
+import run_server
+run_server.main()
+"""
+
+
+def wait_for_port(port, timeout=10):
+    """Wait until the server accepts connections"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def connect(port, name):
+    """Open a registered control connection"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    stream = MessageStream(sock)
+    stream.send(Protocol.build_message(MessageType.HELLO, name, 1))
+    stream.recv()
+    return stream
+
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process (Linux /proc)"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def drain(fd, rate, counts):
+    """Read a pipe at `rate` bytes per second, counting lines"""
+    while True:
+        data = os.read(fd, 4096)
+        if not data:
+            break
+        counts[0] += data.count(b'\n')
+        time.sleep(len(data) / rate)
+
+
+def fetch_worker(port, files, duration, batch, seed, results):
+    """Issue pipelined FETCH requests until the deadline"""
+    rng = random.Random(seed)
+    stream = connect(port, f"load{seed}")
+    names = [f"file_{i:07d}.dat" for i in range(files)]
+
+    done = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for _ in range(batch):
+            stream.send(Protocol.build_message(MessageType.FETCH, rng.choice(names)))
+        for _ in range(batch):
+            stream.recv()
+        done += batch
+
+    results.put(done)
+
+
+def run(overrides, args):
+    """
+    Measure FETCH throughput with one logging setup
+
+    Returns:
+        tuple: (requests per second, server CPU microseconds per request,
+                log lines written)
+    """
+    argv = ['--mode', args.mode, '--port', str(args.port)]
+    code = SERVER_CODE.format(root=ROOT, overrides=overrides, argv=argv)
+    with tempfile.TemporaryFile('w+') as log:
+        counts = [0]
+        if args.sink_rate:
+            proc = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            reader = threading.Thread(target=drain, args=(proc.stdout.fileno(), args.sink_rate, counts), daemon=True)
+            reader.start()
+        else:
+            proc = subprocess.Popen([sys.executable, '-c', code], stdout=log, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_for_port(args.port):
+                raise RuntimeError("server did not start")
+            seed = connect(args.port, 'seed')
+            seed.send(Protocol.build_message(MessageType.UPDATE, 'seed:1',
+                                             [f"file_{i:07d}.dat" for i in range(args.files)]))
+            seed.recv()
+
+            cpu_start = cpu_seconds(proc.pid)
+            results = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(target=fetch_worker,
+                                        args=(args.port, args.files, args.duration, args.batch, i, results))
+                for i in range(args.workers)
+            ]
+            for worker in workers:
+                worker.start()
+            total = sum(results.get() for _ in workers)
+            for worker in workers:
+                worker.join()
+            cpu = cpu_seconds(proc.pid) - cpu_start
+            seed.sock.close()
+        finally:
+            proc.terminate()
+            proc.wait()
+            time.sleep(0.5)
+
+        log.seek(0)
+        lines = counts[0] if args.sink_rate else sum(1 for _ in log)
+    return total / args.duration, cpu / total * 1e6, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help="Load generator processes")
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--batch', type=int, default=32, help="Pipelined requests per round")
+    parser.add_argument('--mode', choices=['threaded', 'event'], default='threaded')
+    parser.add_argument('--port', type=int, default=5960)
+    parser.add_argument('--sink-rate', type=float, default=0,
+                        help="Bytes per second the log is consumed at (default: a file)")
+    args = parser.parse_args()
+
+    print(f"{'logging':<16} {'FETCH/s':>9} {'server us/req':>14} {'log lines':>10}")
+    for name, overrides in SETUPS:
+        rate, cpu_us, lines = run(overrides, args)
+        print(f"{name:<16} {rate:>9.0f} {cpu_us:>14.1f} {lines:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: index snapshot write and restore time
+
+Builds an index with the requested number of provider entries, writes a
+snapshot, appends further mutations to the write-ahead log, then measures
+how long a fresh IndexManager takes to restore from disk.
+
+Usage:
+    python benchmarks/bench_persistence.py [--entries 2000000] [--clients 1000] [--log-ops 200000]
+"""
+
+import sys
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.index_manager import IndexManager
+from server.persistence import IndexStore
+
+
+def dir_size_mb(path):
+    """Total size of the files in a directory (MB)"""
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=2000000, help="Provider entries in the index")
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--log-ops', type=int, default=200000, help="Mutations logged after the snapshot")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    directory = tempfile.mkdtemp(prefix='index_store_')
+
+    try:
+        index = IndexManager(store=IndexStore(directory))
+        index.restore()
+
+        # Each file is shared by 4 clients on average
+        files_per_client = args.entries // args.clients
+        distinct = max(1, args.entries // 4)
+        start = time.perf_counter()
+        for c in range(args.clients):
+            hostname = f"peer{c}:{6000 + c}"
+            index.register_client(hostname, 6000 + c)
+            base = c * files_per_client // 4
+            index.sync_client_files(hostname, [f"file_{(base + i) % distinct:08d}.bin"
+                                               for i in range(files_per_client)])
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index.snapshot()
+        snapshot = time.perf_counter() - start
+        snapshot_mb = dir_size_mb(directory)
+
+        start = time.perf_counter()
+        for i in range(args.log_ops // 2):
+            hostname = f"peer{i % args.clients}:{6000 + i % args.clients}"
+            index.register_file(f"late_{i:08d}.bin", hostname)
+            index.remove_file_provider(f"late_{i:08d}.bin", hostname)
+        logging_time = time.perf_counter() - start
+        index.store.close()
+        entries = sum(len(p) for p in index.file_index.values())
+        del index
+
+        restored = IndexManager(store=IndexStore(directory))
+        start = time.perf_counter()
+        clients, files = restored.restore()
+        restore = time.perf_counter() - start
+        restored_entries = sum(len(p) for p in restored.file_index.values())
+        restored.store.close()
+
+        print(f"provider entries:     {entries:,} ({files:,} files, {clients:,} clients)")
+        print(f"build via API:        {build:.2f}s")
+        print(f"snapshot write:       {snapshot:.2f}s ({snapshot_mb:.1f} MB)")
+        print(f"log {args.log_ops:,} mutations: {logging_time:.2f}s")
+        print(f"restore:              {restore:.2f}s ({restored_entries:,} entries)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: text (v1) vs binary (v2) control protocol codec
+
+Encodes and decodes typical control messages with both codecs, the way
+the servers and clients do: encoding is build_message plus framing,
+decoding is payload decoding (UTF-8 for text) plus parse_message.
+Reports messages per second for each direction and the payload size.
+
+Usage:
+    python benchmarks/bench_protocol.py [--duration 0.5]
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from protocol import Protocol, BinaryProtocol, MessageType, FRAME_HEADER
+
+
+def build_cases(seed=7):
+    """(label, message type, args) for a mix of small and bulk messages"""
+    rng = random.Random(seed)
+    names = [f"music/album_{rng.randrange(1000):03d}/track {i:05d}.mp3" for i in range(1000)]
+    hosts = [f"10.0.{rng.randrange(256)}.{rng.randrange(256)}:{rng.randrange(5001, 6000)}" for _ in range(50)]
+
+    return [
+        ('FETCH', MessageType.FETCH, (names[0],)),
+        ('RESULT 5 providers', MessageType.RESULT, (hosts[:5],)),
+        ('PING', MessageType.PING, (hosts[0], 2, 1048576)),
+        ('UPDATE 1000 files', MessageType.UPDATE, (hosts[0], names)),
+        ('RESULTS 100 files', MessageType.RESULTS,
+         ({fname: rng.sample(hosts, 3) for fname in names[:100]},)),
+        ('PAGE 500 entries', MessageType.PAGE,
+         (names[500], [(fname, rng.sample(hosts, 3)) for fname in names[:500]])),
+        ('EVENTS 1000', MessageType.EVENTS,
+         ([(rng.choice('+-'), fname, rng.choice(hosts)) for fname in names],)),
+    ]
+
+
+def rate(func, duration):
+    """Calls of func per second, measured for about `duration` seconds"""
+    count = 0
+    batch = 1
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            func()
+        count += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return count / elapsed
+        batch = min(batch * 2, 1000)
+
+
+def measure(codec, msg_type, args, duration):
+    """
+    Returns:
+        tuple: (encodes per second, decodes per second, payload bytes)
+    """
+    frame = Protocol.frame(codec.build_message(msg_type, *args))
+    payload = frame[FRAME_HEADER.size:]
+
+    parsed = Protocol.parse_message(Protocol.decode_payload(payload))
+    assert parsed[0] == msg_type, parsed
+
+    encode = rate(lambda: Protocol.frame(codec.build_message(msg_type, *args)), duration)
+    decode = rate(lambda: Protocol.parse_message(Protocol.decode_payload(payload)), duration)
+    return encode, decode, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=0.5, help="Seconds per measurement")
+    args = parser.parse_args()
+
+    print(f"{'message':<20} {'codec':<6} {'encode/s':>11} {'decode/s':>11} {'bytes':>8}")
+    for label, msg_type, msg_args in build_cases():
+        for name, codec in (('text', Protocol), ('binary', BinaryProtocol)):
+            encode, decode, size = measure(codec, msg_type, msg_args, args.duration)
+            print(f"{label:<20} {name:<6} {encode:>11,.0f} {decode:>11,.0f} {size:>8}")
+
+
+if __name__ == "__main__":
+    main()
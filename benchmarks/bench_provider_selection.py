@@ -0,0 +1,144 @@
+"""
+Benchmark: fetch time with and without client-side provider scoring
+
+Starts a server and a network of heterogeneous providers on loopback,
+all holding the same files: a few fast ones (--fast-rate upload), many
+slow ones (--slow-rate) and some that are listed in the index but no
+longer listening. A client then fetches the files one after another,
+twice, each time against a fresh server:
+
+- server order: PeerStats disabled, providers used in the order FETCH
+  returns them (the server shuffles providers of equal rank)
+- scored: Client.peer_stats ranks providers by observed connect latency,
+  throughput and failures
+
+Reports median, p90 and max fetch time of each run.
+
+Usage:
+    python benchmarks/bench_provider_selection.py [--files 30] [--size 4] [--fast 2 --slow 10 --dead 4]
+"""
+
+import sys
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client.client import Client
+from client.file_manager import FileManager
+from client.peer_server import PeerServer
+from client.peer_stats import PeerStats
+from server.server import Server
+from config import SWARM_PIECE_SIZE
+from utils import leaf_hash, merkle_root
+
+
+def start_providers(args, names, data, workdir):
+    """
+    Peer servers on consecutive ports, each with a copy of every file
+
+    Returns:
+        tuple: ([provider hostnames], [running PeerServers])
+    """
+    rates = ([args.fast_rate] * args.fast + [args.slow_rate] * args.slow + [0] * args.dead)
+    hostnames, servers = [], []
+    for i, rate in enumerate(rates):
+        port = args.port + 10 + i
+        hostnames.append(f"p{i}:{port}")
+        if i >= args.fast + args.slow:
+            continue  # Dead: indexed but not listening
+        file_manager = FileManager(os.path.join(workdir, f"p{i}"))
+        for fname in names:
+            with open(file_manager.get_file_path(fname), 'wb') as f:
+                f.write(data)
+        server = PeerServer('127.0.0.1', port, file_manager, upload_rate=rate * 1024 * 1024)
+        server.start()
+        servers.append(server)
+    return hostnames, servers
+
+
+def start_server(port, names, providers, content):
+    """Server whose index lists every provider for every file"""
+    server = Server('127.0.0.1', port)
+    for hostname in providers:
+        server.index_manager.register_client(hostname, int(hostname.rsplit(':', 1)[1]))
+        for fname in names:
+            server.index_manager.register_file(fname, hostname, content)
+    threading.Thread(target=server.start, daemon=True).start()
+    time.sleep(0.3)
+    return server
+
+
+def run(mode, port, names, providers, content, workdir):
+    """
+    Returns:
+        list: Seconds per fetch, in fetch order
+    """
+    server = start_server(port, names, providers, content)
+    client = Client(hostname=f"bench-{mode.replace(' ', '-')}", port=port + 1,
+                    repo_path=os.path.join(workdir, mode.replace(' ', '_')))
+    if mode == 'server order':
+        client.peer_stats = PeerStats(size=0)
+    if not client.connect_to_server('127.0.0.1', port):
+        raise RuntimeError("cannot connect to server")
+
+    times = []
+    for fname in names:
+        start = time.perf_counter()
+        if not client.fetch(fname):
+            raise RuntimeError(f"fetch of {fname} failed")
+        times.append(time.perf_counter() - start)
+
+    client.disconnect_from_server()
+    server.stop()
+    return times
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=30, help="Files fetched per run")
+    parser.add_argument('--size', type=float, default=4, help="File size in MB")
+    parser.add_argument('--fast', type=int, default=2, help="Fast providers")
+    parser.add_argument('--slow', type=int, default=10, help="Slow providers")
+    parser.add_argument('--dead', type=int, default=4, help="Providers indexed but not listening")
+    parser.add_argument('--fast-rate', type=float, default=16, help="Upload MB/s of a fast provider")
+    parser.add_argument('--slow-rate', type=float, default=0.5, help="Upload MB/s of a slow provider")
+    parser.add_argument('--port', type=int, default=7700)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    data = os.urandom(int(args.size * 1024 * 1024))
+    leaves = [leaf_hash(data[offset:offset + SWARM_PIECE_SIZE]) for offset in range(0, len(data), SWARM_PIECE_SIZE)]
+    content = (len(data), SWARM_PIECE_SIZE, merkle_root(leaves).hex())
+    names = [f"file{i:03d}.bin" for i in range(args.files)]
+
+    workdir = tempfile.mkdtemp(prefix='bench_provider_selection_')
+    try:
+        providers, peer_servers = start_providers(args, names, data, workdir)
+
+        print(f"{'mode':<13} {'median s':>9} {'p90 s':>8} {'max s':>8} {'total s':>8}")
+        for index, mode in enumerate(('server order', 'scored')):
+            times = run(mode, args.port + 2 * index, names, providers, content, workdir)
+            print(f"{mode:<13} {percentile(times, 0.5):>9.3f} {percentile(times, 0.9):>8.3f} "
+                  f"{max(times):>8.3f} {sum(times):>8.2f}")
+
+        for server in peer_servers:
+            server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
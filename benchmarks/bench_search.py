@@ -0,0 +1,98 @@
+"""
+Benchmark: SEARCH latency against a large index
+
+Builds a SearchIndex over synthetic filenames and times prefix and
+substring queries of varying selectivity, compared with the old approach
+of scanning every filename in Python on each keystroke.
+
+Usage:
+    python benchmarks/bench_search.py [--files 1000000] [--limit 100]
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.search_index import SearchIndex
+
+WORDS = ['report', 'holiday', 'invoice', 'backup', 'photo', 'Lecture', 'draft',
+         'project', 'music', 'video', 'thesis', 'scan', 'notes', 'archive']
+EXTENSIONS = ['.pdf', '.jpg', '.txt', '.mp3', '.mp4', '.zip', '.docx']
+
+
+def make_names(n, seed=1):
+    """Generate n distinct, loosely realistic filenames"""
+    rng = random.Random(seed)
+    return [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i:07d}{rng.choice(EXTENSIONS)}"
+            for i in range(n)]
+
+
+def time_ms(func, repeat=20):
+    """Median wall time of func() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    names = make_names(args.files)
+
+    start = time.perf_counter()
+    index = SearchIndex()
+    index.rebuild(names)
+    print(f"Indexed {args.files} filenames in {time.perf_counter() - start:.1f}s "
+          f"({len(index.trigrams)} trigrams)")
+
+    rounds = 1000
+    start = time.perf_counter()
+    for i in range(rounds):
+        fname = f"incremental_{i}.bin"
+        index.add(fname)
+        index.remove(fname)
+    print(f"Incremental add+remove: {(time.perf_counter() - start) / rounds * 1e6:.1f} us/file")
+    print()
+
+    queries = [
+        ('prefix', 'holiday_music'),       # contiguous range
+        ('prefix', 'zz'),                  # no match
+        ('substring', 'lecture'),          # dense: ~14% of names
+        ('substring', 'thesis_scan'),      # medium
+        ('substring', '0012345'),          # rare: a handful of names
+        ('substring', '.mp3'),             # dense, via a common trigram
+        ('substring', 'xyzzy'),            # trigram absent
+        ('substring', 'ab'),               # shorter than a trigram, absent
+        ('substring', 'mp'),               # shorter than a trigram, dense
+    ]
+
+    print(f"{'mode':>10} {'query':>15} {'matches':>8} {'search ms':>10} {'page 50 ms':>11} {'scan ms':>9}")
+    for mode, query in queries:
+        result, _ = index.search(query, mode, args.limit)
+        search = time_ms(lambda: index.search(query, mode, args.limit))
+        page = time_ms(lambda: index.search(query, mode, args.limit, offset=50 * args.limit))
+
+        # What filter_network used to do with the full DISCOVER result
+        lowered = query.lower()
+        if mode == 'prefix':
+            scan = time_ms(lambda: [n for n in names if n.lower().startswith(lowered)][:args.limit], 3)
+        else:
+            scan = time_ms(lambda: [n for n in names if lowered in n.lower()][:args.limit], 3)
+
+        print(f"{mode:>10} {query:>15} {len(result):>8} {search:>10.3f} {page:>11.3f} {scan:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark: FETCH throughput of the sharded index server
+
+Starts run_server.py with 1, 2, 4... shards, loads the index, then drives
+FETCH requests from several load-generator processes. Each generator
+keeps one connection per shard, routes every filename to its owning
+shard and pipelines requests in small batches. Throughput should grow
+with the shard count until it reaches the number of cores (the load
+generators need cores too, so leave some headroom).
+
+Usage:
+    python benchmarks/bench_shards.py [--shards 1 2 4] [--workers 4] [--duration 5]
+"""
+
+import sys
+import os
+import time
+import random
+import socket
+import argparse
+import subprocess
+import multiprocessing
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from protocol import Protocol, MessageType, MessageStream
+
+
+def wait_for_port(port, timeout=10):
+    """Wait until a server accepts connections"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def connect(port, name):
+    """Open a registered control connection"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    stream = MessageStream(sock)
+    stream.send(Protocol.build_message(MessageType.HELLO, name, 1))
+    stream.recv()
+    return stream
+
+
+def load_index(port, shards, files):
+    """Publish `files` filenames, each to its owning shard"""
+    streams = [connect(port + i, 'seed') for i in range(shards)]
+    parts = [[] for _ in range(shards)]
+    for i in range(files):
+        fname = f"file_{i:07d}.dat"
+        parts[Protocol.shard_of(fname, shards)].append(fname)
+    for stream, names in zip(streams, parts):
+        stream.send(Protocol.build_message(MessageType.UPDATE, 'seed:1', names))
+        stream.recv()
+    # Keep the seed connections open so the files stay published
+    return streams
+
+
+def fetch_worker(port, shards, files, duration, batch, seed, results):
+    """Issue routed, pipelined FETCH requests until the deadline"""
+    rng = random.Random(seed)
+    streams = [connect(port + i, f"load{seed}") for i in range(shards)]
+    names = [f"file_{i:07d}.dat" for i in range(files)]
+
+    done = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        pending = [0] * shards
+        for _ in range(batch):
+            fname = rng.choice(names)
+            shard = Protocol.shard_of(fname, shards)
+            streams[shard].send(Protocol.build_message(MessageType.FETCH, fname))
+            pending[shard] += 1
+        for stream, count in zip(streams, pending):
+            for _ in range(count):
+                stream.recv()
+        done += batch
+
+    results.put(done)
+
+
+def run(shards, args):
+    """
+    Measure FETCH throughput with a given number of shards
+
+    Returns:
+        float: Requests per second
+    """
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'run_server.py'), '--mode', args.mode,
+         '--port', str(args.port), '--shards', str(shards)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for i in range(shards):
+            if not wait_for_port(args.port + i):
+                raise RuntimeError(f"shard {i} did not start")
+        seed_streams = load_index(args.port, shards, args.files)
+
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=fetch_worker,
+                                    args=(args.port, shards, args.files, args.duration,
+                                          args.batch, seed, results))
+            for seed in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        total = sum(results.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+
+        for stream in seed_streams:
+            stream.sock.close()
+        return total / args.duration
+    finally:
+        proc.terminate()
+        proc.wait()
+        time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--workers', type=int, default=4, help="Load generator processes")
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--batch', type=int, default=32, help="Pipelined requests per round")
+    parser.add_argument('--mode', choices=['threaded', 'event'], default='event')
+    parser.add_argument('--port', type=int, default=5950)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s), {args.workers} load generator(s), {args.files} files")
+    print(f"{'shards':>6} {'FETCH/s':>10} {'speedup':>8}")
+    base = None
+    for shards in args.shards:
+        rate = run(shards, args)
+        base = base or rate
+        print(f"{shards:>6} {rate:>10.0f} {rate / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
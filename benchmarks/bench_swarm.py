@@ -0,0 +1,116 @@
+"""
+Benchmark: swarm download throughput vs number of providers
+
+Starts N peer servers on loopback, each holding the same file and
+capped at --rate bytes per second of upload (PeerServer upload_rate),
+like peers on home uplinks, and downloads the file with SwarmDownload
+from 1..N of them. Aggregate throughput should grow with the provider
+count until the downloader itself is the bottleneck. With --slow, the
+first provider (the one the size is learned from) uploads at a tenth of
+the rate, to show that its pieces are taken over by the others. With
+--verify, pieces are checked against the file's Merkle root (piece
+hashes fetched from the first provider), as for files published with
+content hashes.
+
+Usage:
+    python benchmarks/bench_swarm.py [--providers 1 2 4 8] [--size 32] [--rate 4] [--verify]
+"""
+
+import sys
+import os
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client.file_manager import FileManager
+from client.peer_server import PeerServer
+from client.swarm import SwarmDownload
+from utils import leaf_hash, merkle_root
+
+FNAME = 'payload.bin'
+
+
+def start_providers(count, data, rate, slow, base_port, workdir):
+    """Peer servers on consecutive ports, each with a copy of the file"""
+    providers = []
+    for i in range(count):
+        file_manager = FileManager(os.path.join(workdir, f"provider{i}"))
+        with open(file_manager.get_file_path(FNAME), 'wb') as f:
+            f.write(data)
+        upload_rate = rate / 10 if slow and i == 0 else rate
+        server = PeerServer('127.0.0.1', base_port + i, file_manager, upload_rate=upload_rate)
+        server.logger.setLevel(logging.WARNING)
+        server.start()
+        providers.append((f"provider{i}:{base_port + i}", server))
+    return providers
+
+
+def resolve(provider):
+    """Every provider listens on loopback"""
+    return '127.0.0.1', int(provider.rsplit(':', 1)[1])
+
+
+def content_of(data, piece_size):
+    """(size, piece size, Merkle root) as published by the file's owner"""
+    leaves = [leaf_hash(data[offset:offset + piece_size]) for offset in range(0, len(data), piece_size)]
+    return len(data), piece_size, merkle_root(leaves or [leaf_hash(b'')])
+
+
+def download(providers, piece_size, workdir, content=None):
+    """
+    Returns:
+        float: Seconds to download the file from all `providers`
+    """
+    target = FileManager(tempfile.mkdtemp(dir=workdir))
+    swarm = SwarmDownload(FNAME, providers, target, 'bench:1', resolve, piece_size=piece_size, content=content)
+    swarm.logger.setLevel(logging.ERROR)
+    start = time.perf_counter()
+    if not swarm.run():
+        raise RuntimeError("download failed")
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(target.repo_path)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--providers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--size', type=float, default=32, help="File size in MB")
+    parser.add_argument('--rate', type=float, default=4, help="Upload MB/s per provider")
+    parser.add_argument('--piece-size', type=int, default=1024 * 1024)
+    parser.add_argument('--slow', action='store_true', help="First provider uploads at rate / 10")
+    parser.add_argument('--verify', action='store_true', help="Verify pieces against the Merkle root")
+    parser.add_argument('--port', type=int, default=7600)
+    args = parser.parse_args()
+
+    data = os.urandom(int(args.size * 1024 * 1024))
+    rate = args.rate * 1024 * 1024
+    content = content_of(data, args.piece_size) if args.verify else None
+
+    workdir = tempfile.mkdtemp(prefix='bench_swarm_')
+    try:
+        providers = start_providers(max(args.providers), data, rate, args.slow, args.port, workdir)
+        hostnames = [hostname for hostname, _ in providers]
+
+        print(f"{'providers':>9} {'seconds':>8} {'MB/s':>8} {'speedup':>8}")
+        baseline = None
+        for count in args.providers:
+            elapsed = download(hostnames[:count], args.piece_size, workdir, content)
+            throughput = len(data) / elapsed / (1024 * 1024)
+            baseline = baseline or throughput
+            print(f"{count:>9} {elapsed:>8.2f} {throughput:>8.1f} {throughput / baseline:>7.1f}x")
+
+        for _, server in providers:
+            server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Simulation: how downloads of a hot file spread across its providers
+
+Drives IndexManager.lookup_providers with a stream of download requests
+for one file published by many peers. The first peers to publish are
+unreachable, and some others are already busy uploading other files.
+Every requester downloads from the first provider that works, as
+Client.fetch does, and reports the ones that failed; downloads take an
+exponentially distributed time. Providers PING every --report-interval
+seconds. Compared strategies:
+
+- publish order: providers in the order they published (previous behavior)
+- ranked: health tiers and shuffling, PINGs without load figures
+- ranked + load: PINGs also report each provider's active uploads
+
+"contention" is the mean number of uploads the chosen provider is
+serving (this one included) when a download starts: lower is faster.
+
+Usage:
+    python benchmarks/sim_provider_load.py [--providers 10] [--failing 2] [--busy 3]
+"""
+
+import sys
+import os
+import heapq
+import random
+import logging
+import argparse
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from server.index_manager import IndexManager
+
+HOT_FILE = 'hot.iso'
+
+
+def simulate(args, ranked, load_reports, seed):
+    """
+    Run one strategy
+
+    Returns:
+        dict: Per-strategy results
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    index = IndexManager()
+    index.logger.setLevel(logging.WARNING)
+
+    providers = [f"peer{i}:{6000 + i}" for i in range(args.providers)]
+    for hostname in providers:
+        index.register_client(hostname, int(hostname.split(':')[1]))
+        index.register_file(HOT_FILE, hostname)
+    failing = set(providers[:args.failing])
+
+    # Uploads of other files, constant for the whole run
+    background = dict.fromkeys(providers, 0)
+    for hostname in providers[args.failing:args.failing + args.busy]:
+        background[hostname] = args.background
+
+    active = dict(background)
+    served = dict.fromkeys(providers, 0)
+    peak = dict.fromkeys(providers, 0)
+    failed_attempts = 0
+    contention = 0
+
+    # Event queue of (time, kind, provider)
+    events = [(rng.expovariate(args.rate), 'request', None), (args.report_interval, 'report', None)]
+    requests = 0
+
+    while events:
+        now, kind, provider = heapq.heappop(events)
+
+        if kind == 'done':
+            active[provider] -= 1
+
+        elif kind == 'report':
+            for hostname in providers:
+                index.update_client_liveness(hostname, uploads=active[hostname] if load_reports else None)
+            if requests < args.requests:
+                heapq.heappush(events, (now + args.report_interval, 'report', None))
+
+        else:
+            requests += 1
+            if ranked:
+                candidates = index.lookup_providers(HOT_FILE)
+            else:
+                candidates = list(index.file_index[HOT_FILE])
+            for hostname in candidates:
+                if hostname in failing:
+                    failed_attempts += 1
+                    if ranked:
+                        index.report_failure(hostname)
+                    continue
+                active[hostname] += 1
+                served[hostname] += 1
+                contention += active[hostname]
+                peak[hostname] = max(peak[hostname], active[hostname])
+                heapq.heappush(events, (now + rng.expovariate(1 / args.download_time), 'done', hostname))
+                break
+
+            if requests < args.requests:
+                heapq.heappush(events, (now + rng.expovariate(args.rate), 'request', None))
+
+    healthy = [served[hostname] for hostname in providers if hostname not in failing]
+    total = sum(healthy)
+    return {
+        'busiest_share': max(healthy) / total if total else 0.0,
+        'busiest_peak': max(peak.values()),
+        'contention': contention / total if total else 0.0,
+        'failed_attempts': failed_attempts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--providers', type=int, default=10)
+    parser.add_argument('--failing', type=int, default=2, help="Unreachable providers (published first)")
+    parser.add_argument('--busy', type=int, default=3, help="Providers already uploading other files")
+    parser.add_argument('--background', type=int, default=10, help="Other uploads of each busy provider")
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=20.0, help="Download requests per second")
+    parser.add_argument('--download-time', type=float, default=2.0, help="Mean seconds per download")
+    parser.add_argument('--report-interval', type=float, default=5.0, help="Seconds between PINGs")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.providers} providers ({args.failing} unreachable, {args.busy} busy with "
+          f"{args.background} other uploads), {args.requests} requests, "
+          f"~{args.rate * args.download_time:.0f} concurrent downloads")
+    print()
+    print(f"{'strategy':<15} {'busiest share':>14} {'peak uploads':>13} {'contention':>11} {'failed tries':>13}")
+    for name, ranked, load_reports in (('publish order', False, False),
+                                       ('ranked', True, False),
+                                       ('ranked + load', True, True)):
+        r = simulate(args, ranked, load_reports, args.seed)
+        print(f"{name:<15} {r['busiest_share']:>14.1%} {r['busiest_peak']:>13} "
+              f"{r['contention']:>11.2f} {r['failed_attempts']:>13}")
+
+
+if __name__ == "__main__":
+    main()
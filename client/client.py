@@ -7,15 +7,22 @@ import socket
 import threading
 import time
 import os
+import heapq
+import random
 from client.file_manager import FileManager
 from client.peer_server import PeerServer
-from protocol import Protocol, MessageType
+from client.peer_stats import PeerStats
+from client.server_connection import ServerConnection
+from client.swarm import SwarmDownload, PeerError, fetch_piece_hashes
+from protocol import Protocol, MessageType, MessageStream
 from config import (
     SERVER_HOST, SERVER_PORT, CLIENT_HOST, 
-    DEFAULT_CLIENT_PORT_RANGE, BUFFER_SIZE, ENCODING,
-    CHUNK_SIZE, PING_INTERVAL, DEFAULT_REPO_PATH
+    SERVER_REPLICAS, DEFAULT_CLIENT_PORT_RANGE,
+    RECEIVE_BUFFER_SIZE, PING_INTERVAL, DEFAULT_REPO_PATH, DISCOVER_PAGE_SIZE,
+    SEARCH_LIMIT, SUBSCRIBE_RETRY_INTERVAL, MAX_FETCH_MANY, PROTOCOL_VERSION,
+    SWARM_MAX_PEERS, SWARM_PIECE_SIZE
 )
-from utils import setup_logger
+from utils import setup_logger, file_leaves, leaf_hash, merkle_root
 
 
 class Client:
@@ -61,17 +68,36 @@ class Client:
         # Logger
         self.logger = setup_logger(f'Client-{self.hostname}')
         
-        # Server connection
-        self.server_socket = None
+        # Server connections, one per shard in shard order (a single entry
+        # when the server is not sharded). Each carries its own sync state.
+        self.servers = []
         self.server_connected = False
         
+        # Serializes file list synchronization
+        self.sync_lock = threading.Lock()
+        
+        # Local copy of the network index, kept current with DISCOVER_DELTA
+        self.network_index = {}
+        self.index_lock = threading.Lock()
+        
+        # Dedicated connections receiving pushed index events (subscribe())
+        self.subscriptions = []
+        
         # Peer server (for receiving requests)
         self.peer_server = PeerServer(CLIENT_HOST, self.port, self.file_manager)
         
+        # Observed speed and failures of providers, to choose whom to download from
+        self.peer_stats = PeerStats()
+        
         # Background threads
         self.running = False
         self.ping_thread = None
     
+    @property
+    def server_socket(self):
+        """Socket of the first server connection (None when disconnected)"""
+        return self.servers[0].sock if self.servers else None
+    
     def _find_available_port(self):
         """Find an available port in the range"""
         for port in range(*DEFAULT_CLIENT_PORT_RANGE):
@@ -120,66 +146,163 @@ class Client:
         
         self.logger.info("Client stopped")
     
-    def connect_to_server(self, server_host=SERVER_HOST, server_port=SERVER_PORT):
+    def connect_to_server(self, server_host=SERVER_HOST, server_port=SERVER_PORT, replicas=SERVER_REPLICAS):
         """
         Connect to centralized server and register
         Implements connect_to_server() function
         
+        With replicas the client starts at a random replica (spreading
+        clients across them) and fails over to the others when its server
+        becomes unreachable.
+        
         Args:
             server_host: Server hostname
             server_port: Server port
+            replicas: Additional replica addresses ("host:port")
             
         Returns:
             bool: True if successful
         """
+        addresses = [(server_host, server_port)]
+        for replica in replicas or ():
+            address = Protocol.parse_hostname(replica)
+            if address not in addresses:
+                addresses.append(address)
+        start = random.randrange(len(addresses))
+        addresses = addresses[start:] + addresses[:start]
+        
+        servers = []
         try:
-            # Create socket
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.connect((server_host, server_port))
+            seed = ServerConnection(*addresses[0], fallbacks=addresses[1:])
+            servers.append(seed)
+            if not self._hello(seed):
+                self._close_servers(servers)
+                return False
             
-            # Send HELLO message (server will create full hostname)
-            hello_msg = Protocol.build_message(MessageType.HELLO, self.hostname, self.port)
-            self.server_socket.send(hello_msg.encode(ENCODING))
+            # A sharded server lists every shard; connect to the others too
+            index, addresses = self._get_shard_map(seed)
+            if len(addresses) > 1:
+                servers = []
+                for i, address in enumerate(addresses):
+                    if i == index:
+                        servers.append(seed)
+                        continue
+                    
+                    host, port = Protocol.parse_hostname(address)
+                    if host in ('0.0.0.0', ''):
+                        host = server_host
+                    shard = ServerConnection(host, port)
+                    servers.append(shard)
+                    if not self._hello(shard):
+                        self._close_servers(servers + [seed])
+                        return False
+                
+                self.logger.info(f"Server is sharded across {len(servers)} process(es)")
             
-            # Wait for OK response
-            response = self.server_socket.recv(BUFFER_SIZE).decode(ENCODING)
-            msg_type, msg_data = Protocol.parse_message(response)
+            self.servers = servers
+            self.server_connected = True
+            self.logger.info(f"Connected to server at {seed.address}")
             
-            if msg_type == MessageType.OK:
-                self.server_connected = True
-                self.logger.info(f"Connected to server at {server_host}:{server_port}")
-                
-                # Sync initial file list
-                self.update_file_list()
-                
-                return True
-            else:
-                self.logger.error(f"Server connection failed: {response}")
-                return False
+            # Sync initial file list
+            self.update_file_list()
+            
+            return True
         
         except Exception as e:
             self.logger.error(f"Error connecting to server: {e}")
+            self._close_servers(servers)
             self.server_connected = False
             return False
     
+    def _hello(self, server):
+        """
+        Open a server connection and register with HELLO
+        
+        The HELLO is repeated automatically whenever the connection fails
+        over to another replica.
+        
+        Args:
+            server: ServerConnection to open
+            
+        Returns:
+            bool: True if the server accepted the registration
+        """
+        # Send HELLO message (server will create full hostname)
+        # (offering the binary protocol; the server picks the version it speaks)
+        server.hello_message = Protocol.build_message(MessageType.HELLO, self.hostname, self.port, PROTOCOL_VERSION)
+        if not server.connect():
+            self.logger.error("Server connection failed: no server accepted HELLO")
+            return False
+        return True
+    
+    def _get_shard_map(self, server):
+        """
+        Ask a server for the shard layout
+        
+        Returns:
+            tuple: (index of this server, list of shard addresses) - the list
+                   is empty for an unsharded server
+        """
+        response = server.request(server.protocol.build_message(MessageType.SHARDS))
+        msg_type, msg_data = Protocol.parse_message(response)
+        
+        if msg_type != MessageType.SHARD_MAP:
+            # Server predates sharding
+            return 0, []
+        return msg_data['index'], msg_data['addresses']
+    
+    def _server_for(self, fname):
+        """
+        Get the server connection that owns a filename
+        
+        Args:
+            fname: Filename
+            
+        Returns:
+            ServerConnection: Connection to the owning shard
+        """
+        servers = self.servers
+        if not servers:
+            raise ConnectionError("Not connected to server")
+        return servers[Protocol.shard_of(fname, len(servers))]
+    
+    def _partition(self, files):
+        """
+        Split filenames by owning shard
+        
+        Args:
+            files: Iterable of filenames
+            
+        Returns:
+            list: One set of filenames per server connection
+        """
+        count = len(self.servers)
+        parts = [set() for _ in range(count)]
+        for fname in files:
+            parts[Protocol.shard_of(fname, count)].add(fname)
+        return parts
+    
+    def _close_servers(self, servers):
+        """Close a list of server connections"""
+        for server in servers:
+            server.close()
+    
     def disconnect_from_server(self):
         """Disconnect from server"""
-        if self.server_socket:
-            try:
-                # Send BYE message before disconnecting
-                bye_msg = Protocol.build_message(MessageType.BYE)
-                self.server_socket.send(bye_msg.encode(ENCODING))
-                
-                # Wait for server to process BYE
-                time.sleep(0.5)
-            except:
-                pass
+        self.unsubscribe()
+        servers, self.servers = self.servers, []
+        if servers:
+            # Send BYE message before disconnecting
+            bye_msg = Protocol.build_message(MessageType.BYE)
+            for server in servers:
+                try:
+                    server.send(bye_msg)
+                except:
+                    pass
             
-            try:
-                self.server_socket.close()
-            except:
-                pass
-            self.server_socket = None
+            # Wait for server to process BYE
+            time.sleep(0.5)
+            self._close_servers(servers)
         
         self.server_connected = False
         self.logger.info("Disconnected from server")
@@ -208,18 +331,23 @@ class Client:
             # Send PUBLISH message (server knows our full hostname from registration)
             # We need to use full hostname here for index
             full_hostname = Protocol.format_hostname(self.hostname, self.port)
-            publish_msg = Protocol.build_message(MessageType.PUBLISH, fname, full_hostname)
-            self.server_socket.send(publish_msg.encode(ENCODING))
+            server = self._server_for(fname)
+            
+            # Content hashes let downloaders verify every piece
+            content = ()
+            leaves = self.file_manager.piece_hashes(lname, SWARM_PIECE_SIZE)
+            if leaves is not None:
+                content = (self.file_manager.get_file_size(lname), SWARM_PIECE_SIZE, merkle_root(leaves).hex())
             
-            # Wait for response
-            response = self.server_socket.recv(BUFFER_SIZE).decode(ENCODING)
+            publish_msg = server.protocol.build_message(MessageType.PUBLISH, fname, full_hostname, *content)
+            response = server.request(publish_msg)
             msg_type, msg_data = Protocol.parse_message(response)
             
             if msg_type == MessageType.OK:
                 self.logger.info(f"File published: {fname}")
                 return True
             else:
-                self.logger.error(f"Publish failed: {response}")
+                self.logger.error(f"Publish failed: {Protocol.as_text(response)}")
                 return False
         
         except Exception as e:
@@ -234,7 +362,7 @@ class Client:
         Workflow:
         1. Check if file already exists locally
         2. Send FETCH to server to get provider list
-        3. Connect to a provider peer
+        3. Connect to a provider peer (several at once for a swarm download)
         4. Send GET request to peer
         5. Receive file data via TCP stream
         
@@ -251,11 +379,9 @@ class Client:
                 return True
             
             # Step 1: Send FETCH request to server
-            fetch_msg = Protocol.build_message(MessageType.FETCH, fname)
-            self.server_socket.send(fetch_msg.encode(ENCODING))
-            
-            # Wait for RESULT with provider list
-            response = self.server_socket.recv(BUFFER_SIZE).decode(ENCODING)
+            server = self._server_for(fname)
+            fetch_msg = server.protocol.build_message(MessageType.FETCH, fname)
+            response = server.request(fetch_msg)
             msg_type, msg_data = Protocol.parse_message(response)
             
             if msg_type == MessageType.RESULT:
@@ -268,178 +394,822 @@ class Client:
                 self.logger.info(f"Found {len(providers)} provider(s) for {fname}: {providers}")
                 
                 # Step 2: Try to download from first available provider
-                full_hostname = Protocol.format_hostname(self.hostname, self.port)
-                for provider_hostname in providers:
-                    # Skip if provider is self
-                    if provider_hostname == full_hostname:
-                        self.logger.debug(f"Skipping self: {provider_hostname}")
-                        continue
-                    
-                    success = self._download_from_peer(fname, provider_hostname)
-                    if success:
-                        return True
-                
-                self.logger.error(f"Failed to download from any provider")
-                return False
+                return self._download_from_providers(fname, providers)
             
             else:
-                self.logger.error(f"Fetch failed: {response}")
+                self.logger.error(f"Fetch failed: {Protocol.as_text(response)}")
                 return False
         
         except Exception as e:
             self.logger.error(f"Error fetching file: {e}")
             return False
     
-    def _download_from_peer(self, fname, provider_hostname):
+    def fetch_many(self, fnames):
+        """
+        Fetch several files, resolving all their providers in one round trip
+        
+        The providers of every missing file are looked up with FETCH_MANY
+        (one request per shard) before any download starts; the files are
+        then downloaded one by one as fetch() does.
+        
+        Args:
+            fnames: Filenames to fetch
+            
+        Returns:
+            dict: {filename: True if the file is now available locally}
+        """
+        results = {fname: True for fname in fnames if self.file_manager.file_exists(fname)}
+        missing = [fname for fname in dict.fromkeys(fnames) if fname not in results]
+        
+        try:
+            providers = self.lookup_many(missing)
+        except Exception as e:
+            self.logger.error(f"Error fetching files: {e}")
+            providers = {}
+        
+        for fname in missing:
+            if not providers.get(fname):
+                self.logger.warning(f"No providers found for file: {fname}")
+                results[fname] = False
+                continue
+            try:
+                results[fname] = self._download_from_providers(fname, providers[fname])
+            except Exception as e:
+                self.logger.error(f"Error fetching file {fname}: {e}")
+                results[fname] = False
+        
+        self.logger.info(f"Fetched {sum(results.values())}/{len(results)} file(s)")
+        return results
+    
+    def lookup_many(self, fnames):
+        """
+        Get the providers of many files with FETCH_MANY
+        
+        Filenames are grouped by shard and sent in requests of at most
+        MAX_FETCH_MANY names, so a lookup costs one round trip per shard
+        for typical batch sizes.
+        
+        Args:
+            fnames: Filenames to lookup
+            
+        Returns:
+            dict: {filename: [providers]} (empty list if nobody has it)
+        """
+        providers = {}
+        for server, part in zip(self.servers, self._partition(fnames)):
+            part = sorted(part)
+            for start in range(0, len(part), MAX_FETCH_MANY):
+                fetch_msg = server.protocol.build_message(MessageType.FETCH_MANY, part[start:start + MAX_FETCH_MANY])
+                response = server.request(fetch_msg)
+                msg_type, msg_data = Protocol.parse_message(response)
+                if msg_type != MessageType.RESULTS:
+                    raise RuntimeError(f"Fetch failed: {Protocol.as_text(response)}")
+                providers.update(msg_data['providers'])
+        return providers
+    
+    def _download_from_providers(self, fname, providers):
+        """
+        Download a file from its providers
+        
+        With two or more chosen providers the file is downloaded in pieces
+        from up to SWARM_MAX_PEERS of them at once (SwarmDownload). Otherwise,
+        or if that fails, the providers are tried one by one. Either way,
+        pieces left on disk by an earlier attempt are not fetched again.
+        If the index has content hashes for the file, every piece is
+        verified against them (in a swarm download even from one provider).
+        
+        Providers are chosen by what this client observed of them before
+        (PeerStats: connect latency, throughput, recent failures): the
+        swarm uses the fastest known ones, much slower ones are only tried
+        if it fails, and recently failed ones are tried last.
+        
+        Args:
+            fname: Filename
+            providers: Provider hostnames in the server's order
+            
+        Returns:
+            bool: True if successful
+        """
+        full_hostname = Protocol.format_hostname(self.hostname, self.port)
+        
+        # Skip if provider is self
+        providers = [provider for provider in providers if provider != full_hostname]
+        content = self._content_info(fname) if providers else None
+        chosen, others = self.peer_stats.select(providers, SWARM_MAX_PEERS, content[0] if content else None)
+        providers = chosen + others
+        
+        if content or len(chosen) > 1:
+            swarm = SwarmDownload(fname, chosen, self.file_manager,
+                                  full_hostname, self._peer_address, content=content,
+                                  peer_stats=self.peer_stats)
+            success = swarm.run()
+            for provider_hostname in swarm.failed:
+                self._report_failure(fname, provider_hostname)
+            if success:
+                self.notify_files_changed(added=[fname])
+                return True
+            providers = [provider for provider in providers if provider not in swarm.failed]
+        
+        for provider_hostname in providers:
+            success = self._download_from_peer(fname, provider_hostname, content)
+            if success:
+                return True
+            self._report_failure(fname, provider_hostname)
+        
+        self.logger.error("Failed to download from any provider")
+        return False
+    
+    def _content_info(self, fname):
+        """
+        Get the published content hashes of a file (INFO)
+        
+        Args:
+            fname: Filename
+            
+        Returns:
+            tuple: (size, piece size, Merkle root bytes), or None if the
+                   server has none for the file
+        """
+        try:
+            server = self._server_for(fname)
+            response = server.request(server.protocol.build_message(MessageType.INFO, fname))
+            msg_type, msg_data = Protocol.parse_message(response)
+            if msg_type == MessageType.FILE_INFO and msg_data['piece_size'] > 0:
+                return msg_data['size'], msg_data['piece_size'], bytes.fromhex(msg_data['root'])
+        except Exception as e:
+            self.logger.debug(f"No content hashes for {fname}: {e}")
+        return None
+    
+    def _report_failure(self, fname, provider_hostname):
+        """
+        Tell the server a provider failed, so it ranks it lower for a while
+        
+        Args:
+            fname: Filename that could not be downloaded
+            provider_hostname: Provider that failed
+        """
+        try:
+            server = self._server_for(fname)
+            report_msg = server.protocol.build_message(MessageType.REPORT_FAILURE, provider_hostname)
+            server.request(report_msg)
+        except Exception as e:
+            self.logger.debug(f"Could not report failure of {provider_hostname}: {e}")
+    
+    def _peer_address(self, provider_hostname):
+        """
+        Get the address of a provider's peer server
+        
+        Args:
+            provider_hostname: Provider hostname (format: "hostname:port")
+            
+        Returns:
+            tuple: (host, port)
+        """
+        host, port = provider_hostname.rsplit(':', 1)  # Split from right
+        
+        # If host doesn't look like an IP address, assume it's a client name on localhost
+        # IP addresses have dots (e.g., 192.168.1.1), client names don't
+        if '.' not in host:
+            # It's a client name, use localhost
+            self.logger.debug(f"Converting client name '{host}' to localhost")
+            host = '127.0.0.1'
+        return host, int(port)
+    
+    def _download_from_peer(self, fname, provider_hostname, content=None):
         """
         Download file from a specific peer
         
+        If an earlier attempt left a partial file, only its missing pieces
+        are requested (ranged GETs); peers that do not serve ranges send
+        the whole file again. With `content`, the piece hashes are fetched
+        from the peer first and every piece of a whole file is checked as
+        it arrives: pieces that do not match are left out of the piece map,
+        so the next attempt fetches only those. A peer that serves no
+        hashes has its whole file checked against the root instead.
+        
         Args:
             fname: Filename
             provider_hostname: Provider hostname (format: "hostname:port")
+            content: (size, piece size, Merkle root bytes) to verify
+                     against, or None
             
         Returns:
             bool: True if successful
         """
         try:
             # Parse provider hostname
-            if ':' in provider_hostname:
-                parts = provider_hostname.rsplit(':', 1)  # Split from right
-                host = parts[0]
-                port = int(parts[1])
-            else:
+            if ':' not in provider_hostname:
                 self.logger.error(f"Invalid provider hostname format: {provider_hostname}")
                 return False
+            actual_host, port = self._peer_address(provider_hostname)
+            full_hostname = Protocol.format_hostname(self.hostname, self.port)
             
-            # If host doesn't look like an IP address, assume it's a client name on localhost
-            # IP addresses have dots (e.g., 192.168.1.1), client names don't
-            if '.' not in host:
-                # It's a client name, use localhost
-                actual_host = '127.0.0.1'
-                self.logger.debug(f"Converting client name '{host}' to localhost")
-            else:
-                actual_host = host
+            # Resume: fetch only the pieces not on disk yet
+            if self.file_manager.has_partial(fname):
+                swarm = SwarmDownload(fname, [provider_hostname], self.file_manager,
+                                      full_hostname, self._peer_address, content=content,
+                                      peer_stats=self.peer_stats)
+                if swarm.run():
+                    self.notify_files_changed(added=[fname])
+                    return True
+                if swarm.failed:
+                    return False
+                self.logger.info(f"{provider_hostname} cannot resume {fname}, downloading it whole")
             
             self.logger.info(f"Downloading {fname} from {actual_host}:{port}")
             
             # Connect to peer
-            peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            peer_socket.connect((actual_host, port))
+            peer_socket, peer_stream = self._connect_peer(provider_hostname)
+            leaves = None
+            if content:
+                try:
+                    leaves = fetch_piece_hashes(peer_stream, fname, full_hostname, content)
+                except PeerError as e:
+                    # The peer closes the connection after refusing
+                    self.logger.info(f"{provider_hostname} serves no piece hashes ({e}), checking {fname} whole")
+                    peer_socket.close()
+                    peer_socket, peer_stream = self._connect_peer(provider_hostname)
+            
+            # The whole file is sent again: start over, so the piece map
+            # only ever holds pieces of this transfer
+            self.file_manager.discard_partial(fname)
             
             # Send GET request with our full hostname
-            full_hostname = Protocol.format_hostname(self.hostname, self.port)
             get_msg = Protocol.build_message(MessageType.GET, fname, full_hostname)
-            peer_socket.send(get_msg.encode(ENCODING))
+            requested_at = time.monotonic()
+            peer_stream.send(get_msg)
             
-            # Receive DATA header
-            header_data = peer_socket.recv(BUFFER_SIZE).decode(ENCODING)
+            # Receive DATA header (file bytes may already be buffered behind it)
+            header_data = peer_stream.recv()
             msg_type, msg_data = Protocol.parse_message(header_data)
             
-            if msg_type == MessageType.DATA:
+            if msg_type == MessageType.DATA and content and msg_data['size'] != content[0]:
+                self.logger.error(f"File from {provider_hostname} has the wrong size: {fname} "
+                                  f"({msg_data['size']} bytes, published {content[0]})")
+            
+            elif msg_type == MessageType.DATA:
                 file_size = msg_data['size']
                 self.logger.info(f"Receiving file: {fname} ({file_size} bytes)")
                 
-                # Receive file content
-                received_data = b''
-                while len(received_data) < file_size:
-                    chunk = peer_socket.recv(CHUNK_SIZE)
-                    if not chunk:
-                        break
-                    received_data += chunk
+                # Receive file content straight into the partial file
+                received, corrupt = self._receive_to_disk(peer_stream, fname, file_size, content, leaves)
+                self.peer_stats.record_transfer(provider_hostname, received, time.monotonic() - requested_at)
                 
-                # Save file
-                if len(received_data) == file_size:
-                    self.file_manager.write_file(fname, received_data)
+                # Move the file into place
+                if received != file_size:
+                    self.logger.error(f"Incomplete file transfer: {received}/{file_size} bytes (kept for resume)")
+                elif corrupt:
+                    self.logger.error(f"{len(corrupt)} piece(s) of {fname} from {provider_hostname} do not match "
+                                      f"the published hashes (the others are kept for resume)")
+                elif content and leaves is None and not self._verify_partial(fname, content):
+                    self.logger.error(f"File from {provider_hostname} does not match the published hashes: {fname}")
+                    self.file_manager.discard_partial(fname)
+                elif self.file_manager.commit_partial(fname):
                     self.logger.info(f"File downloaded successfully: {fname}")
+                    if leaves is not None:
+                        self.file_manager.remember_piece_hashes(fname, content[1], leaves)
                     
-                    # Update file list with server
-                    self.update_file_list()
+                    # Tell the server about the new file only
+                    self.notify_files_changed(added=[fname])
                     
                     peer_socket.close()
                     return True
-                else:
-                    self.logger.error(f"Incomplete file transfer: {len(received_data)}/{file_size} bytes")
             
             elif msg_type == MessageType.ERROR:
                 self.logger.error(f"Peer error: {msg_data}")
             
             peer_socket.close()
+            self.peer_stats.record_failure(provider_hostname)
             return False
         
         except Exception as e:
             self.logger.error(f"Error downloading from peer: {e}")
+            self.peer_stats.record_failure(provider_hostname)
             return False
     
+    def _connect_peer(self, provider_hostname):
+        """
+        Open a connection to a provider's peer server
+        
+        Args:
+            provider_hostname: Provider hostname (format: "hostname:port")
+            
+        Returns:
+            tuple: (socket, MessageStream)
+        """
+        start = time.monotonic()
+        peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        peer_socket.connect(self._peer_address(provider_hostname))
+        self.peer_stats.record_connect(provider_hostname, time.monotonic() - start)
+        return peer_socket, MessageStream(peer_socket)
+    
+    def _verify_partial(self, fname, content):
+        """
+        Check a complete partial file against published content hashes
+        
+        Args:
+            fname: Filename
+            content: (size, piece size, Merkle root bytes)
+            
+        Returns:
+            bool: True if the file matches
+        """
+        size, piece_size, root = content
+        path = self.file_manager.partial_path(fname)
+        try:
+            return os.path.getsize(path) == size and merkle_root(file_leaves(path, piece_size)) == root
+        except OSError as e:
+            self.logger.error(f"Error verifying {fname}: {e}")
+            return False
+    
+    def _receive_to_disk(self, peer_stream, fname, file_size, content=None, leaves=None):
+        """
+        Receive a file's bytes into its partial file
+        
+        Bytes are read with recv_into into one reused buffer and written
+        out as they arrive, so memory use does not grow with file size.
+        Each completed piece is checked against its leaf hash and recorded
+        in the piece map only if it matches; the map is saved if the
+        transfer breaks off or pieces failed, so a later attempt fetches
+        only what is missing. With content but no leaves nothing is
+        recorded, as the pieces can only be checked once the file is whole.
+        
+        Args:
+            peer_stream: MessageStream positioned after the DATA header
+            fname: Filename
+            file_size: Bytes to receive
+            content: (size, piece size, Merkle root bytes) the piece map is
+                     laid out for, or None
+            leaves: Leaf hash per piece, checked against the root, or None
+            
+        Returns:
+            tuple: (bytes received and written - less than file_size if the
+                   transfer broke off, [pieces that failed their hash])
+        """
+        piece_size, root = (content[1], content[2]) if content else (SWARM_PIECE_SIZE, None)
+        fd, piece_map = self.file_manager.open_partial(fname, file_size, piece_size, root)
+        if fd is None:
+            return 0, []
+        
+        view = memoryview(bytearray(RECEIVE_BUFFER_SIZE))
+        received = 0
+        complete = 0  # Pieces received (and checked) so far
+        corrupt = []
+        try:
+            while received < file_size:
+                count = peer_stream.recv_into(view[:file_size - received])
+                if not count:
+                    break
+                self.file_manager.write_at(fd, view[:count], received)
+                received += count
+                
+                while complete < piece_map.pieces and received >= min((complete + 1) * piece_size, file_size):
+                    offset = complete * piece_size
+                    if leaves is not None:
+                        data = self.file_manager.read_at(fd, min(piece_size, file_size - offset), offset)
+                        if leaf_hash(data) == leaves[complete]:
+                            piece_map.add(complete)
+                        else:
+                            corrupt.append(complete)
+                    elif content is None:
+                        piece_map.add(complete)
+                    complete += 1
+                piece_map.save_if_due(fd)
+        except OSError as e:
+            self.logger.error(f"Transfer of {fname} interrupted: {e}")
+        finally:
+            if received < file_size or corrupt:
+                piece_map.save(fd)
+            os.close(fd)
+        return received, corrupt
+    
     def update_file_list(self):
         """
         Synchronize file list with server
         Implements update_file_list() function
         
+        After the first full UPDATE only the difference against the last
+        list the server acknowledged is sent (UPDATE_DELTA). With a sharded
+        server each shard receives only the filenames it owns.
+        
         Returns:
             bool: True if successful
         """
         try:
             # Get current files in repository
-            files = self.file_manager.list_files()
-            
-            # Use full hostname for update
-            full_hostname = Protocol.format_hostname(self.hostname, self.port)
+            files = set(self.file_manager.list_files())
             
-            # Send UPDATE message
-            update_msg = Protocol.build_message(MessageType.UPDATE, full_hostname, files)
-            self.server_socket.send(update_msg.encode(ENCODING))
-            
-            # Wait for response
-            response = self.server_socket.recv(BUFFER_SIZE).decode(ENCODING)
-            msg_type, msg_data = Protocol.parse_message(response)
+            with self.sync_lock:
+                success = True
+                for server, shard_files in zip(self.servers, self._partition(files)):
+                    if server.synced_files is None:
+                        success &= self._send_full_update(server, shard_files)
+                        continue
+                    
+                    added = shard_files - server.synced_files
+                    removed = server.synced_files - shard_files
+                    if added or removed:
+                        success &= self._send_update_delta(server, added, removed)
+                return success
+        
+        except Exception as e:
+            self.logger.error(f"Error updating file list: {e}")
+            return False
+    
+    def notify_files_changed(self, added=(), removed=()):
+        """
+        Tell the server about known repository changes without rescanning
+        
+        Args:
+            added: Filenames added to the repository
+            removed: Filenames removed from the repository
             
-            if msg_type == MessageType.OK:
-                self.logger.info(f"File list updated: {len(files)} file(s)")
-                return True
-            else:
-                self.logger.error(f"Update failed: {response}")
-                return False
+        Returns:
+            bool: True if successful
+        """
+        try:
+            with self.sync_lock:
+                success = True
+                all_files = None
+                parts = zip(self.servers, self._partition(added), self._partition(removed))
+                for shard, (server, shard_added, shard_removed) in enumerate(parts):
+                    if server.synced_files is None:
+                        if all_files is None:
+                            all_files = self._partition(self.file_manager.list_files())
+                        success &= self._send_full_update(server, all_files[shard])
+                        continue
+                    
+                    shard_added -= server.synced_files
+                    shard_removed &= server.synced_files
+                    if shard_added or shard_removed:
+                        success &= self._send_update_delta(server, shard_added, shard_removed)
+                return success
         
         except Exception as e:
             self.logger.error(f"Error updating file list: {e}")
             return False
     
-    def discover(self):
+    def _send_full_update(self, server, files):
+        """
+        Send the complete file list (UPDATE) and restart the delta sequence
+        
+        Args:
+            server: ServerConnection to update
+            files: Set of filenames the server should index for this client
+            
+        Returns:
+            bool: True if successful
+        """
+        # Use full hostname for update
+        full_hostname = Protocol.format_hostname(self.hostname, self.port)
+        
+        # Send UPDATE message
+        update_msg = server.protocol.build_message(MessageType.UPDATE, full_hostname, list(files))
+        response = server.request(update_msg)
+        msg_type, msg_data = Protocol.parse_message(response)
+        
+        if msg_type == MessageType.OK:
+            server.synced_files = set(files)
+            server.update_seq = 0
+            self.logger.info(f"File list updated: {len(files)} file(s)")
+            return True
+        else:
+            server.synced_files = None
+            self.logger.error(f"Update failed: {Protocol.as_text(response)}")
+            return False
+    
+    def _send_update_delta(self, server, added, removed):
+        """
+        Send only the changed filenames (UPDATE_DELTA)
+        
+        Falls back to a full UPDATE when the server reports a sequence gap,
+        or when the request failed over to another replica (which has no
+        delta sequence for us and may not have seen the delta applied).
+        
+        Args:
+            server: ServerConnection to update
+            added: Set of added filenames
+            removed: Set of removed filenames
+            
+        Returns:
+            bool: True if successful
+        """
+        full_hostname = Protocol.format_hostname(self.hostname, self.port)
+        seq = server.update_seq + 1
+        generation = server.generation
+        
+        delta_msg = server.protocol.build_message(MessageType.UPDATE_DELTA, full_hostname, seq, added, removed)
+        response = server.request(delta_msg)
+        msg_type, msg_data = Protocol.parse_message(response)
+        
+        if server.generation != generation or server.synced_files is None:
+            # Reconnected meanwhile: the sync state was reset
+            self.logger.warning(f"Reconnected to {server.address}, sending full file list")
+            return self._send_full_update(server, self._local_files_for(server))
+        
+        if msg_type == MessageType.OK:
+            server.synced_files |= added
+            server.synced_files -= removed
+            server.update_seq = seq
+            self.logger.info(f"File list delta sent: +{len(added)} -{len(removed)}")
+            return True
+        
+        if msg_type == MessageType.ERROR and msg_data.get('code') == 'RESYNC':
+            self.logger.warning("Server requested full resync")
+            return self._send_full_update(server, (server.synced_files | added) - removed)
+        
+        self.logger.error(f"Update failed: {Protocol.as_text(response)}")
+        return False
+    
+    def _local_files_for(self, server):
+        """
+        Get the repository files a server (shard) should index for us
+        
+        Args:
+            server: ServerConnection
+            
+        Returns:
+            set: Filenames owned by the server's shard
+        """
+        shards = self._partition(self.file_manager.list_files())
+        return shards[self.servers.index(server)]
+    
+    def discover(self, on_page=None):
         """
         Discover all files in the network
         Implements discover command
         
+        Only the changes since the last call are transferred; a full
+        paged snapshot is loaded the first time or when the server's
+        change log no longer reaches back far enough.
+        
+        Args:
+            on_page: Optional callback receiving each page of a snapshot load
+            
         Returns:
             dict: Dictionary of {filename: [providers]}
         """
         try:
-            # Send DISCOVER message
-            discover_msg = Protocol.build_message(MessageType.DISCOVER)
-            self.server_socket.send(discover_msg.encode(ENCODING))
-            
-            # Receive response
-            response = self.server_socket.recv(BUFFER_SIZE).decode(ENCODING)
-            
-            # Parse multi-line response
-            lines = response.split('\n')
-            if lines[0].startswith('RESULT'):
-                file_dict = {}
-                for line in lines[1:]:
-                    if ':' in line:
-                        parts = line.split(':', 1)
-                        fname = parts[0].strip()
-                        providers = [p.strip() for p in parts[1].split(',')]
-                        file_dict[fname] = providers
-                
-                self.logger.info(f"Discovery: found {len(file_dict)} file(s)")
-                return file_dict
+            with self.index_lock:
+                self.sync_index(on_page)
+                file_dict = {fname: list(providers) for fname, providers in self.network_index.items()}
             
-            return {}
+            self.logger.info(f"Discovery: found {len(file_dict)} file(s)")
+            return file_dict
         
         except Exception as e:
             self.logger.error(f"Error discovering files: {e}")
             return {}
     
+    def sync_index(self, on_page=None):
+        """
+        Bring the local network index up to date (caller holds index_lock)
+        
+        Args:
+            on_page: Optional callback receiving each page of a snapshot load
+            
+        Returns:
+            int: Number of changes applied, or -1 if a snapshot was loaded
+        """
+        applied = 0
+        for shard, server in enumerate(self.servers):
+            changes = self._sync_server_index(shard, server, on_page)
+            applied = -1 if changes < 0 or applied < 0 else applied + changes
+        return applied
+    
+    def _sync_server_index(self, shard, server, on_page=None):
+        """
+        Apply one server's index changes to the local network index
+        
+        Args:
+            shard: Shard number of the server
+            server: ServerConnection
+            on_page: Optional callback receiving each page of a snapshot load
+            
+        Returns:
+            int: Number of changes applied, or -1 if a snapshot was loaded
+        """
+        delta_msg = server.protocol.build_message(MessageType.DISCOVER_DELTA, server.index_epoch, server.index_version)
+        response = server.request(delta_msg)
+        msg_type, msg_data = Protocol.parse_message(response)
+        
+        if msg_type == MessageType.DELTA:
+            self.apply_changes(self.network_index, msg_data['changes'])
+            server.index_version = msg_data['version']
+            return len(msg_data['changes'])
+        
+        if msg_type == MessageType.SNAPSHOT:
+            # Pages are read after the snapshot version was taken, so any change
+            # that races with the listing is replayed by the next delta.
+            # Only this shard's filenames are replaced.
+            count = len(self.servers)
+            index = {fname: providers for fname, providers in self.network_index.items()
+                     if Protocol.shard_of(fname, count) != shard}
+            for page in self._server_pages(server, DISCOVER_PAGE_SIZE):
+                index.update(page)
+                if on_page:
+                    on_page(page)
+            
+            self.network_index = index
+            server.index_epoch = msg_data['epoch']
+            server.index_version = msg_data['version']
+            return -1
+        
+        raise RuntimeError(f"Discover failed: {Protocol.as_text(response)}")
+    
+    @staticmethod
+    def apply_changes(index, changes):
+        """
+        Apply index changes to a {filename: [providers]} mapping
+        
+        Args:
+            index: Mapping to update in place
+            changes: (op, filename, hostname) tuples, op '+' or '-'
+        """
+        for op, fname, hostname in changes:
+            providers = index.setdefault(fname, [])
+            if op == '+':
+                if hostname not in providers:
+                    providers.append(hostname)
+            elif hostname in providers:
+                providers.remove(hostname)
+            if not providers:
+                del index[fname]
+    
+    def subscribe(self, on_events, pattern=None):
+        """
+        Have the server push index changes instead of polling DISCOVER
+        
+        A dedicated connection is opened to every server (shard), failing
+        over between replicas like the control connection. `on_events` is
+        called from a background thread with a list of (op, filename,
+        hostname) changes - '+' published, '-' removed - or with None when
+        events may have been missed (the server dropped this subscriber's
+        backlog, or the connection was re-established); the caller should
+        then reload with discover().
+        
+        Args:
+            on_events: Callback receiving a list of changes or None
+            pattern: Optional case-insensitive filename glob (e.g. "*.mp3")
+            
+        Returns:
+            bool: True if every server accepted the subscription
+        """
+        self.unsubscribe()
+        subscribe_msg = Protocol.build_message(MessageType.SUBSCRIBE, pattern)
+        
+        channels = []
+        for server in self.servers:
+            channel = ServerConnection(*server.addresses[server.current], fallbacks=server.addresses)
+            channel.hello_message = subscribe_msg
+            channels.append(channel)
+            if not channel.connect():
+                self.logger.error(f"Subscription rejected by {channel.address}")
+                self._close_servers(channels)
+                return False
+        
+        self.subscriptions = channels
+        for channel in channels:
+            threading.Thread(target=self._subscription_worker, args=(channel, on_events), daemon=True).start()
+        
+        self.logger.info(f"Subscribed to index events (pattern: {pattern or '*'})")
+        return True
+    
+    def unsubscribe(self):
+        """Close the connections opened by subscribe()"""
+        channels, self.subscriptions = self.subscriptions, []
+        self._close_servers(channels)
+    
+    def _subscription_worker(self, channel, on_events):
+        """
+        Deliver events pushed on one subscription connection until unsubscribed
+        
+        Args:
+            channel: Subscribed ServerConnection
+            on_events: Callback passed to subscribe()
+        """
+        while channel in self.subscriptions:
+            try:
+                msg_type, msg_data = Protocol.parse_message(channel.receive())
+            except (OSError, ConnectionError) as e:
+                if channel not in self.subscriptions:
+                    break
+                self.logger.warning(f"Subscription to {channel.address} lost: {e}")
+                time.sleep(SUBSCRIBE_RETRY_INTERVAL)
+                if channel in self.subscriptions and channel.connect():
+                    on_events(None)
+                continue
+            
+            try:
+                if msg_type == MessageType.EVENTS:
+                    on_events(msg_data['changes'])
+                elif msg_type == MessageType.SNAPSHOT:
+                    on_events(None)
+            except Exception as e:
+                self.logger.error(f"Event callback error: {e}")
+    
+    def iter_discover(self, page_size=DISCOVER_PAGE_SIZE):
+        """
+        Stream the network file list one entry at a time
+        
+        Args:
+            page_size: Number of files requested per round trip
+            
+        Yields:
+            tuple: (filename, [providers])
+        """
+        for page in self.discover_pages(page_size):
+            yield from page
+    
+    def discover_pages(self, page_size=DISCOVER_PAGE_SIZE):
+        """
+        Stream the network file list page by page using DISCOVER_PAGE
+        
+        The control channel is only held for one page at a time, so pings
+        and other requests interleave with a long listing. Shards are
+        listed one after another.
+        
+        Args:
+            page_size: Number of files requested per round trip
+            
+        Yields:
+            list: List of (filename, [providers]) tuples
+        """
+        for server in self.servers:
+            yield from self._server_pages(server, page_size)
+    
+    def _server_pages(self, server, page_size):
+        """
+        Stream one server's file list page by page
+        
+        Args:
+            server: ServerConnection
+            page_size: Number of files requested per round trip
+            
+        Yields:
+            list: List of (filename, [providers]) tuples
+        """
+        cursor = None
+        while True:
+            page_msg = server.protocol.build_message(MessageType.DISCOVER_PAGE, page_size, cursor)
+            response = server.request(page_msg)
+            msg_type, msg_data = Protocol.parse_message(response)
+            
+            if msg_type != MessageType.PAGE:
+                raise RuntimeError(f"Discover failed: {Protocol.as_text(response)}")
+            
+            if msg_data['files']:
+                yield msg_data['files']
+            
+            cursor = msg_data['cursor']
+            if cursor is None:
+                return
+    
+    def search(self, query, mode='substring', limit=SEARCH_LIMIT, offset=0):
+        """
+        Search the network file list on the server
+        
+        Only the requested slice of matches is transferred, so this is
+        cheap enough to call on every keystroke. With a sharded server the
+        query goes to every shard and the sorted results are merged.
+        
+        Args:
+            query: Text to match (case-insensitive)
+            mode: 'prefix' or 'substring'
+            limit: Maximum number of matches to return
+            offset: Number of matches to skip
+            
+        Returns:
+            tuple: (list of (filename, [providers]), next offset or None when done)
+        """
+        if len(self.servers) == 1:
+            return self._search_server(self.servers[0], query, mode, limit, offset)
+        
+        # Every shard must return its first offset + limit matches for the
+        # merged slice to be exact
+        window = offset + limit
+        results = []
+        more = False
+        for server in self.servers:
+            files, next_offset = self._search_server(server, query, mode, window, 0)
+            results.append(files)
+            more = more or next_offset is not None
+        
+        merged = list(heapq.merge(*results, key=lambda entry: (entry[0].lower(), entry[0])))
+        next_offset = window if more or len(merged) > window else None
+        return merged[offset:window], next_offset
+    
+    def _search_server(self, server, query, mode, limit, offset):
+        """Run SEARCH against one server connection"""
+        search_msg = server.protocol.build_message(MessageType.SEARCH, mode, limit, offset, query)
+        response = server.request(search_msg)
+        msg_type, msg_data = Protocol.parse_message(response)
+        
+        if msg_type != MessageType.MATCHES:
+            raise RuntimeError(f"Search failed: {Protocol.as_text(response)}")
+        
+        return msg_data['files'], msg_data['next_offset']
+    
     def ping_server(self):
         """
         Ping server for liveness check
@@ -452,24 +1222,42 @@ class Client:
             # Use full hostname for ping
             full_hostname = Protocol.format_hostname(self.hostname, self.port)
             
-            # Send PING message
-            ping_msg = Protocol.build_message(MessageType.PING, full_hostname)
-            self.server_socket.send(ping_msg.encode(ENCODING))
-            
-            # Wait for ALIVE response
-            response = self.server_socket.recv(BUFFER_SIZE).decode(ENCODING)
-            msg_type, msg_data = Protocol.parse_message(response)
+            # Send PING message with the current upload load, used by the
+            # server to rank providers (every shard tracks liveness separately)
+            uploads, upload_rate = self.peer_server.load_report()
+            if not self.servers:
+                return False
             
-            if msg_type == MessageType.ALIVE:
-                self.logger.debug("Server is alive")
-                return True
+            for server in self.servers:
+                ping_msg = server.protocol.build_message(MessageType.PING, full_hostname, uploads, upload_rate)
+                response = server.request(ping_msg)
+                msg_type, msg_data = Protocol.parse_message(response)
+                if msg_type != MessageType.ALIVE:
+                    return False
             
-            return False
+            self.logger.debug("Server is alive")
+            return True
         
         except Exception as e:
             self.logger.error(f"Error pinging server: {e}")
             return False
     
+    def server_stats(self):
+        """
+        Get the metrics of every connected index server (STATS)
+        
+        Returns:
+            list: One stats dict per shard, in shard order (see Server.get_stats)
+        """
+        stats = []
+        for server in self.servers:
+            response = server.request(server.protocol.build_message(MessageType.STATS))
+            msg_type, msg_data = Protocol.parse_message(response)
+            if msg_type != MessageType.METRICS:
+                raise RuntimeError(f"Stats failed: {Protocol.as_text(response)}")
+            stats.append(msg_data['stats'])
+        return stats
+    
     def _ping_worker(self):
         """Background worker to ping server periodically"""
         while self.running:
@@ -498,7 +1286,7 @@ class Client:
         
         if success:
             # Update server
-            self.update_file_list()
+            self.notify_files_changed(added=[fname])
         
         return success
 
@@ -533,7 +1321,7 @@ def main():
         print(f"{'='*60}\n")
         print("Commands:")
         print("  publish <lname> [fname]  - Publish a file")
-        print("  fetch <fname>            - Fetch a file from network")
+        print("  fetch <fname...>         - Fetch files from network")
         print("  discover                 - List all files in network")
         print("  list                     - List local files")
         print("  ping                     - Ping server")
@@ -564,7 +1352,9 @@ def main():
                 
                 elif command == 'fetch':
                     if len(parts) < 2:
-                        print("Usage: fetch <fname>")
+                        print("Usage: fetch <fname...>")
+                    elif len(parts) > 2:
+                        client.fetch_many(parts[1:])
                     else:
                         fname = parts[1]
                         client.fetch(fname)
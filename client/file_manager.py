@@ -5,7 +5,16 @@ Manages local file repository
 
 import os
 import hashlib
-from utils import setup_logger
+import threading
+from client.piece_map import PieceMap
+from config import PARTIAL_SUFFIX, PIECE_MAP_SUFFIX
+from utils import setup_logger, file_leaves
+
+# Open files as binary on Windows (no-op elsewhere)
+O_BINARY = getattr(os, 'O_BINARY', 0)
+
+# Serializes seek + write where os.pwrite is unavailable (Windows)
+_write_lock = threading.Lock()
 
 
 class FileManager:
@@ -20,6 +29,10 @@ class FileManager:
         self.repo_path = repo_path
         self.logger = setup_logger('FileManager')
         
+        # Merkle leaf hashes: {filename: ((size, mtime_ns, piece size), [leaf digests])}
+        self.hash_cache = {}
+        self.hash_lock = threading.Lock()
+        
         # Create repository directory if not exists
         if not os.path.exists(repo_path):
             os.makedirs(repo_path)
@@ -46,7 +59,8 @@ class FileManager:
         """
         try:
             files = [f for f in os.listdir(self.repo_path) 
-                    if os.path.isfile(os.path.join(self.repo_path, f))]
+                    if os.path.isfile(os.path.join(self.repo_path, f))
+                    and not self.is_partial(f)]
             return files
         except Exception as e:
             self.logger.error(f"Error listing files: {e}")
@@ -123,6 +137,218 @@ class FileManager:
             self.logger.error(f"Error writing file {fname}: {e}")
             return False
     
+    def partial_path(self, fname):
+        """
+        Get the path a file is written to while it is being downloaded
+        
+        Args:
+            fname: Filename
+            
+        Returns:
+            str: Full path of the partial file
+        """
+        return self.get_file_path(fname) + PARTIAL_SUFFIX
+    
+    def piece_map_path(self, fname):
+        """
+        Get the path of the piece map saved beside a partial file
+        
+        Args:
+            fname: Filename
+            
+        Returns:
+            str: Full path of the piece map
+        """
+        return self.partial_path(fname) + PIECE_MAP_SUFFIX
+    
+    @staticmethod
+    def is_partial(fname):
+        """
+        Check if a repository entry belongs to an unfinished download
+        
+        Args:
+            fname: Filename
+            
+        Returns:
+            bool: True for partial files and their piece maps
+        """
+        return fname.endswith(PARTIAL_SUFFIX) or fname.endswith(PARTIAL_SUFFIX + PIECE_MAP_SUFFIX)
+    
+    def has_partial(self, fname):
+        """
+        Check if an unfinished download of a file can be resumed
+        
+        Args:
+            fname: Filename
+            
+        Returns:
+            bool: True if a partial file and its piece map exist
+        """
+        return os.path.isfile(self.partial_path(fname)) and os.path.isfile(self.piece_map_path(fname))
+    
+    def open_partial(self, fname, size, piece_size, root=None):
+        """
+        Open the partial file of a download, resuming an earlier attempt
+        
+        The existing partial file is kept if its piece map is for the same
+        size, piece size and Merkle root, so pieces already on disk need
+        not be fetched again. Otherwise a new partial file is created, sparse and sized to
+        the whole file, with an empty map. Pieces are written into it in
+        any order with write_at.
+        
+        Args:
+            fname: Filename
+            size: Final file size in bytes
+            piece_size: Bytes per piece
+            root: Merkle root (bytes) of the expected content, or None if unknown
+            
+        Returns:
+            tuple: (OS file descriptor open for reading and writing,
+                    PieceMap), or (None, None) if error
+        """
+        path = self.partial_path(fname)
+        map_path = self.piece_map_path(fname)
+        try:
+            piece_map = PieceMap.load(map_path)
+            if (piece_map is not None and piece_map.size == size and piece_map.piece_size == piece_size
+                    and piece_map.root == root and os.path.isfile(path) and os.path.getsize(path) == size):
+                self.logger.info(f"Resuming {fname}: {piece_map.pieces - len(piece_map.missing())}"
+                                 f"/{piece_map.pieces} piece(s) on disk")
+                return os.open(path, os.O_RDWR | O_BINARY), piece_map
+            
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o644)
+            os.ftruncate(fd, size)
+            piece_map = PieceMap(map_path, size, piece_size, root)
+            piece_map.save(fd)
+            return fd, piece_map
+        except Exception as e:
+            self.logger.error(f"Error creating partial file {fname}: {e}")
+            return None, None
+    
+    @staticmethod
+    def write_at(fd, data, offset):
+        """
+        Write bytes at an offset of an open file (os.pwrite where available)
+        
+        Args:
+            fd: OS file descriptor
+            data: Bytes-like data
+            offset: File offset
+        """
+        if hasattr(os, 'pwrite'):
+            os.pwrite(fd, data, offset)
+            return
+        with _write_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, data)
+    
+    @staticmethod
+    def read_at(fd, length, offset):
+        """
+        Read bytes at an offset of an open file (os.pread where available)
+        
+        Args:
+            fd: OS file descriptor
+            length: Number of bytes
+            offset: File offset
+            
+        Returns:
+            bytes: Data read (shorter at end of file)
+        """
+        if hasattr(os, 'pread'):
+            return os.pread(fd, length, offset)
+        with _write_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, length)
+    
+    def commit_partial(self, fname):
+        """
+        Move a completed partial file into place and drop its piece map
+        
+        Args:
+            fname: Filename
+            
+        Returns:
+            bool: True if successful
+        """
+        try:
+            os.replace(self.partial_path(fname), self.get_file_path(fname))
+            self._remove(self.piece_map_path(fname))
+            self.logger.info(f"File written: {fname} ({self.get_file_size(fname)} bytes)")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error completing file {fname}: {e}")
+            return False
+    
+    def discard_partial(self, fname):
+        """
+        Remove the partial file and piece map of an abandoned download
+        
+        Args:
+            fname: Filename
+        """
+        try:
+            self._remove(self.partial_path(fname))
+            self._remove(self.piece_map_path(fname))
+        except Exception as e:
+            self.logger.error(f"Error removing partial file {fname}: {e}")
+    
+    @staticmethod
+    def _remove(path):
+        """Remove a file if it exists"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    
+    def piece_hashes(self, fname, piece_size):
+        """
+        Get the Merkle leaf hashes of a file's pieces
+        
+        Computed on first use and cached until the file's size or
+        modification time changes, so peers answer GET_HASHES without
+        rereading the file.
+        
+        Args:
+            fname: Filename
+            piece_size: Bytes per piece
+            
+        Returns:
+            list: Leaf digests in piece order, or None if error
+        """
+        path = self.get_file_path(fname)
+        try:
+            stat = os.stat(path)
+            key = (stat.st_size, stat.st_mtime_ns, piece_size)
+            with self.hash_lock:
+                cached = self.hash_cache.get(fname)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            
+            leaves = file_leaves(path, piece_size)
+            with self.hash_lock:
+                self.hash_cache[fname] = (key, leaves)
+            return leaves
+        except Exception as e:
+            self.logger.error(f"Error hashing file {fname}: {e}")
+            return None
+    
+    def remember_piece_hashes(self, fname, piece_size, leaves):
+        """
+        Cache leaf hashes already verified for a file, e.g. after a download
+        
+        Args:
+            fname: Filename
+            piece_size: Bytes per piece
+            leaves: Leaf digests in piece order
+        """
+        try:
+            stat = os.stat(self.get_file_path(fname))
+        except OSError:
+            return
+        with self.hash_lock:
+            self.hash_cache[fname] = ((stat.st_size, stat.st_mtime_ns, piece_size), list(leaves))
+    
     def delete_file(self, fname):
         """
         Delete file from repository
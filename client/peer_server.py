@@ -5,10 +5,14 @@ Handles P2P file transfer requests from other peers
 
 import socket
 import threading
-from protocol import Protocol, MessageType
-from config import BUFFER_SIZE, ENCODING, CHUNK_SIZE
+import time
+from protocol import Protocol, MessageType, MessageStream
+from config import CHUNK_SIZE, PEER_UPLOAD_RATE
 from utils import setup_logger
 
+# Seconds of unused upload budget a rate-limited peer server may catch up on
+PACE_BURST = 0.05
+
 
 class PeerServer:
     """
@@ -18,15 +22,32 @@ class PeerServer:
     This implements the receive_request() function from requirements
     """
     
-    def __init__(self, host, port, file_manager):
+    def __init__(self, host, port, file_manager, upload_rate=PEER_UPLOAD_RATE):
+        """
+        Args:
+            host: Listening address
+            port: Listening port
+            file_manager: FileManager of the files served
+            upload_rate: Upload bytes/s shared by all uploads (0 = unlimited)
+        """
         self.host = host
         self.port = port
         self.file_manager = file_manager
+        self.upload_rate = upload_rate
         self.logger = setup_logger('PeerServer')
         
         # Server socket
         self.server_socket = None
         self.running = False
+        
+        # Upload load, reported to the index server with every PING
+        self.active_uploads = 0
+        self.bytes_sent = 0
+        self.stats_lock = threading.Lock()
+        self.rate_mark = (time.time(), 0)
+        
+        # Time (monotonic) at which the upload budget is spent, for upload_rate
+        self.pace_time = 0.0
     
     def start(self):
         """Start the peer server"""
@@ -59,12 +80,29 @@ class PeerServer:
         
         self.logger.info("Peer server stopped")
     
+    def load_report(self):
+        """
+        Get the current upload load
+        
+        Returns:
+            tuple: (uploads in progress, bytes/s sent since the previous report)
+        """
+        now = time.time()
+        with self.stats_lock:
+            uploads, sent = self.active_uploads, self.bytes_sent
+            mark_time, mark_sent = self.rate_mark
+            self.rate_mark = (now, sent)
+        
+        elapsed = now - mark_time
+        rate = int((sent - mark_sent) / elapsed) if elapsed > 0 else 0
+        return uploads, rate
+    
     def _accept_connections(self):
         """Accept incoming connections from peers"""
         while self.running:
             try:
                 peer_socket, peer_address = self.server_socket.accept()
-                self.logger.info(f"Peer connected: {peer_address}")
+                self.logger.info("Peer connected: %s", peer_address)
                 
                 # Handle peer request in new thread
                 handler_thread = threading.Thread(
@@ -87,64 +125,84 @@ class PeerServer:
         - Validate file existence
         - Send file using TCP data stream
         
+        A GET for the whole file closes the connection once it is sent. A
+        GET with a byte range (swarm downloads) or a GET_HASHES keeps it
+        open for the peer's next request.
+        
         Args:
             peer_socket: Peer socket
             peer_address: Peer address
         """
         try:
-            # Receive GET request
-            data = peer_socket.recv(BUFFER_SIZE)
-            if not data:
-                return
-            
-            message = data.decode(ENCODING).strip()
-            self.logger.info(f"Received request from {peer_address}: {message}")
-            
-            # Parse message
-            msg_type, msg_data = Protocol.parse_message(message)
-            
-            if msg_type == MessageType.GET:
+            stream = MessageStream(peer_socket)
+            while self.running:
+                # Receive GET request
+                message = stream.recv()
+                if not message:
+                    return
+                
+                message = message.strip()
+                self.logger.info("Received request from %s: %s", peer_address, message)
+                
+                # Parse message
+                msg_type, msg_data = Protocol.parse_message(message)
+                
+                if msg_type not in (MessageType.GET, MessageType.GET_HASHES):
+                    # Unknown request
+                    error_msg = Protocol.build_message(MessageType.ERROR, "INVALID", "Invalid request")
+                    stream.send(error_msg)
+                    return
+                
                 fname = msg_data['fname']
                 requesting_hostname = msg_data.get('hostname', 'unknown')
                 
-                self.logger.info(f"Peer {requesting_hostname} requesting file: {fname}")
+                self.logger.info("Peer %s requesting file: %s", requesting_hostname, fname)
                 
-                # Check if file exists
-                if not self.file_manager.file_exists(fname):
+                # Check if file exists (files still downloading are not served)
+                if self.file_manager.is_partial(fname) or not self.file_manager.file_exists(fname):
                     # Send error
                     error_msg = Protocol.build_message(MessageType.ERROR, "NOT_FOUND", "File not found")
-                    peer_socket.send(error_msg.encode(ENCODING))
+                    stream.send(error_msg)
                     self.logger.warning(f"File not found: {fname}")
                     return
                 
+                if msg_type == MessageType.GET_HASHES:
+                    # Merkle leaves, checked by the peer against the published root
+                    piece_size = msg_data['piece_size']
+                    leaves = self.file_manager.piece_hashes(fname, piece_size) if piece_size > 0 else None
+                    if leaves is None:
+                        error_msg = Protocol.build_message(MessageType.ERROR, "INVALID", "Cannot hash file")
+                        stream.send(error_msg)
+                        return
+                    stream.send(Protocol.build_message(MessageType.HASHES, fname, piece_size, leaves))
+                    continue
+                
                 # Get file size
                 file_size = self.file_manager.get_file_size(fname)
+                offset, length = msg_data['offset'], msg_data['length']
                 
-                # Send DATA header
-                data_header = Protocol.build_message(MessageType.DATA, fname, file_size)
-                peer_socket.send(data_header.encode(ENCODING))
+                if offset is None:
+                    # Whole file: send DATA header and content, then close
+                    data_header = Protocol.build_message(MessageType.DATA, fname, file_size)
+                    stream.send(data_header)
+                    self._send_range(peer_socket, fname, 0, file_size)
+                    self.logger.info("File sent to %s: %s (%d bytes)", requesting_hostname, fname, file_size)
+                    return
                 
-                # Small delay to ensure header is processed
-                import time
-                time.sleep(0.1)
+                if offset < 0 or length <= 0 or offset > file_size:
+                    error_msg = Protocol.build_message(MessageType.ERROR, "INVALID", "Invalid range")
+                    stream.send(error_msg)
+                    return
                 
-                # Send file content in chunks
-                file_content = self.file_manager.read_file(fname)
-                if file_content:
-                    total_sent = 0
-                    while total_sent < len(file_content):
-                        chunk = file_content[total_sent:total_sent + CHUNK_SIZE]
-                        sent = peer_socket.send(chunk)
-                        total_sent += sent
-                    
-                    self.logger.info(f"File sent to {requesting_hostname}: {fname} ({file_size} bytes)")
-                else:
-                    self.logger.error(f"Error reading file: {fname}")
-            
-            else:
-                # Unknown request
-                error_msg = Protocol.build_message(MessageType.ERROR, "INVALID", "Invalid request")
-                peer_socket.send(error_msg.encode(ENCODING))
+                length = min(length, file_size - offset)
+                data_header = Protocol.build_message(MessageType.DATA, fname, length, offset, file_size)
+                stream.send(data_header)
+                self._send_range(peer_socket, fname, offset, length)
+                self.logger.debug("Range sent to %s: %s [%d, +%d)", requesting_hostname, fname, offset, length)
+        
+        except (BrokenPipeError, ConnectionResetError):
+            # Swarm downloaders drop a range another peer delivered first
+            self.logger.info("Peer %s closed the connection", peer_address)
         
         except Exception as e:
             self.logger.error(f"Error handling peer request: {e}")
@@ -154,3 +212,50 @@ class PeerServer:
                 peer_socket.close()
             except:
                 pass
+    
+    def _send_range(self, peer_socket, fname, offset, length):
+        """
+        Send part of a file straight from disk
+        
+        The bytes go out with socket.sendfile (zero-copy where the OS
+        supports it), CHUNK_SIZE at a time when uploads are rate limited.
+        
+        Args:
+            peer_socket: Peer socket
+            fname: Filename
+            offset: First byte to send
+            length: Number of bytes to send
+        """
+        step = CHUNK_SIZE if self.upload_rate else length
+        with self.stats_lock:
+            self.active_uploads += 1
+        position, end = offset, offset + length
+        try:
+            with open(self.file_manager.get_file_path(fname), 'rb') as f:
+                while position < end:
+                    sent = peer_socket.sendfile(f, position, min(step, end - position))
+                    if not sent:
+                        raise ConnectionError(f"File truncated while sending: {fname}")
+                    position += sent
+                    if self.upload_rate:
+                        self._pace(sent)
+        finally:
+            with self.stats_lock:
+                self.active_uploads -= 1
+                self.bytes_sent += position - offset
+    
+    def _pace(self, nbytes):
+        """
+        Hold an upload back so all uploads together stay under upload_rate
+        
+        Args:
+            nbytes: Bytes just sent
+        """
+        with self.stats_lock:
+            now = time.monotonic()
+            # Up to PACE_BURST seconds of unused budget carry over, so
+            # oversleeping does not lower the rate
+            self.pace_time = max(self.pace_time, now - PACE_BURST) + nbytes / self.upload_rate
+            delay = self.pace_time - now
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,226 @@
+"""
+Provider performance record for Client
+Observed connect latency, throughput and failures per provider, used to
+choose which providers a download uses
+"""
+
+import time
+import random
+import threading
+from collections import OrderedDict
+from config import (
+    PEER_STATS_SIZE, PEER_STATS_HALF_LIFE, PEER_EXPLORE_RATE, PEER_SLOW_FACTOR, SWARM_PIECE_SIZE
+)
+
+# Decaying sums kept per provider
+_SUMS = ('connects', 'connect_time', 'transfers', 'bytes', 'seconds', 'failures')
+
+
+class PeerStats:
+    """
+    What this client has seen of each provider it downloaded from
+
+    Every observation is weighted by its age: sums of connect times, bytes
+    and transfer seconds and the failure count all lose half their weight
+    every `half_life` seconds, so a peer that was slow or dead a while ago
+    gets another chance and a recent measurement outweighs old ones. At
+    most `size` providers are remembered; the one seen longest ago is
+    forgotten first.
+
+    rank() orders providers by the expected time to download `size` bytes
+    from them (connect latency plus size over throughput), with providers
+    that failed recently last. Providers without measurements are ranked
+    as a typical measured one, in the order the server gave them, so the
+    server's load balancing still applies to them. With probability
+    `explore` the least measured candidate is moved to the front, so new
+    or recovered peers keep being tried. select() also leaves out
+    providers much slower than the best one.
+    """
+
+    def __init__(self, size=PEER_STATS_SIZE, half_life=PEER_STATS_HALF_LIFE, explore=PEER_EXPLORE_RATE,
+                 slow_factor=PEER_SLOW_FACTOR):
+        """
+        Args:
+            size: Providers remembered (0 = no record, providers keep the
+                  given order)
+            half_life: Seconds for an observation to lose half its weight
+            explore: Chance that the least measured provider is put first
+            slow_factor: select() leaves out providers expected to take
+                         this many times as long as the best one
+        """
+        self.size = size
+        self.half_life = half_life
+        self.explore = explore
+        self.slow_factor = slow_factor
+
+        # {provider: {'time': t, 'connects': weight, 'connect_time': s,
+        #             'transfers': weight, 'bytes': n, 'seconds': s,
+        #             'failures': weight}}
+        self.peers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record_connect(self, provider, seconds):
+        """Record the time a connection to a provider took to open"""
+        with self.lock:
+            peer = self._peer(provider)
+            if peer is not None:
+                peer['connects'] += 1
+                peer['connect_time'] += seconds
+
+    def record_transfer(self, provider, nbytes, seconds):
+        """Record `nbytes` received from a provider in `seconds` (request to last byte)"""
+        if nbytes <= 0 or seconds <= 0:
+            return
+        with self.lock:
+            peer = self._peer(provider)
+            if peer is not None:
+                peer['transfers'] += 1
+                peer['bytes'] += nbytes
+                peer['seconds'] += seconds
+
+    def record_failure(self, provider):
+        """Record that a provider could not be connected to or failed a transfer"""
+        with self.lock:
+            peer = self._peer(provider)
+            if peer is not None:
+                peer['failures'] += 1
+
+    def rank(self, providers, size=None):
+        """
+        Order providers for a download, best first
+
+        Args:
+            providers: Provider hostnames in the server's order
+            size: Bytes to download, or None if unknown (one piece is assumed)
+
+        Returns:
+            list: The same providers, best first
+        """
+        return self._rank(providers, size)[0]
+
+    def select(self, providers, count, size=None):
+        """
+        Choose the providers to download from in parallel
+
+        The `count` best providers, leaving out those expected to take more
+        than `slow_factor` times as long as the best measured one (a piece
+        held by a slow provider holds up the end of a swarm download). An
+        explored provider is always chosen.
+
+        Args:
+            providers: Provider hostnames in the server's order
+            count: Most providers to choose
+            size: Bytes to download, or None if unknown
+
+        Returns:
+            tuple: (chosen providers, the others), each best first
+        """
+        ranked, expected, explored = self._rank(providers, size)
+        measured = [seconds for seconds in expected.values() if seconds is not None]
+        limit = min(measured) * self.slow_factor if measured else None
+
+        chosen, others = [], []
+        for provider in ranked:
+            fast = limit is None or expected[provider] is None or expected[provider] <= limit
+            if len(chosen) < count and (fast or provider == explored):
+                chosen.append(provider)
+            else:
+                others.append(provider)
+        return chosen, others
+
+    def _rank(self, providers, size):
+        """
+        Returns:
+            tuple: (providers best first, {provider: expected seconds or
+                   None if unmeasured or failing}, provider moved to the
+                   front to explore or None)
+        """
+        providers = list(providers)
+        if not self.size or len(providers) < 2:
+            return providers, dict.fromkeys(providers), None
+        size = size or SWARM_PIECE_SIZE
+
+        now = time.monotonic()
+        with self.lock:
+            scores = {provider: self._score(provider, size, now) for provider in providers}
+
+        # Unmeasured providers count as the median measured one
+        measured = sorted(score[1] for score in scores.values() if score[1] is not None and not score[0])
+        typical = measured[len(measured) // 2] if measured else 0.0
+
+        def key(provider):
+            failing, expected, _ = scores[provider]
+            return failing, typical if expected is None else expected
+
+        # Stable: ties keep the server's order
+        ranked = sorted(providers, key=key)
+        expected = {provider: None if failing else seconds for provider, (failing, seconds, _) in scores.items()}
+
+        explored = None
+        if random.random() < self.explore:
+            healthy = [provider for provider in ranked[1:] if not scores[provider][0]]
+            if healthy:
+                least = min(scores[provider][2] for provider in healthy)
+                explored = random.choice([provider for provider in healthy if scores[provider][2] == least])
+                ranked.remove(explored)
+                ranked.insert(0, explored)
+        return ranked, expected, explored
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {provider: {'connect_ms', 'throughput' (bytes/s),
+                  'failures'}} with current decayed values
+        """
+        now = time.monotonic()
+        result = {}
+        with self.lock:
+            for provider, peer in self.peers.items():
+                self._decay(peer, now)
+                result[provider] = {
+                    'connect_ms': peer['connect_time'] / peer['connects'] * 1000 if peer['connects'] else None,
+                    'throughput': peer['bytes'] / peer['seconds'] if peer['seconds'] else None,
+                    'failures': round(peer['failures'], 2),
+                }
+        return result
+
+    def _peer(self, provider):
+        """Get a provider's record, decayed to now (caller holds lock)"""
+        if not self.size:
+            return None
+        peer = self.peers.get(provider)
+        if peer is None:
+            peer = self.peers[provider] = dict.fromkeys(_SUMS, 0.0)
+            peer['time'] = time.monotonic()
+            while len(self.peers) > self.size:
+                self.peers.popitem(last=False)
+        else:
+            self.peers.move_to_end(provider)
+            self._decay(peer, time.monotonic())
+        return peer
+
+    def _decay(self, peer, now):
+        """Age a record's sums to `now` (caller holds lock)"""
+        factor = 0.5 ** ((now - peer['time']) / self.half_life)
+        for key in _SUMS:
+            peer[key] *= factor
+        peer['time'] = now
+
+    def _score(self, provider, size, now):
+        """
+        Ranking key of a provider (caller holds lock)
+
+        Returns:
+            tuple: (failed recently, expected seconds for `size` bytes or
+                   None if never measured, weight of the measurements)
+        """
+        peer = self.peers.get(provider)
+        if peer is None:
+            return False, None, 0.0
+        self._decay(peer, now)
+
+        failing = peer['failures'] >= 0.5
+        if not peer['seconds']:
+            return failing, None, peer['connects']
+        connect = peer['connect_time'] / peer['connects'] if peer['connects'] else 0.0
+        return failing, connect + size * peer['seconds'] / peer['bytes'], peer['connects'] + peer['transfers']
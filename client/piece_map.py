@@ -0,0 +1,134 @@
+"""
+Piece map for partial downloads
+Records which pieces of a partial file are on disk, so a download can resume
+"""
+
+import os
+import time
+import struct
+import threading
+from config import PIECE_MAP_SAVE_INTERVAL
+
+# Map file: magic, file size, piece size, Merkle root of the expected
+# content (zeros if unknown), then one bit per piece (MSB first)
+MAP_HEADER = struct.Struct('!4sQQ32s')
+MAP_MAGIC = b'P2PM'
+
+# Flush file data to disk (fdatasync where available)
+_datasync = getattr(os, 'fdatasync', os.fsync)
+
+
+class PieceMap:
+    """
+    Completed pieces of one partial download
+
+    Saved to a small sidecar file next to the partial file. Before a save
+    the partial file's data is flushed to disk, so a piece marked done in
+    the saved map is really there after a crash or restart. During a
+    transfer pieces only go from missing to done, so even a torn write of
+    the map never claims a piece that is not on disk. Saves during a transfer are batched to one
+    per PIECE_MAP_SAVE_INTERVAL seconds; a restart refetches at most the
+    pieces completed since the last save.
+    """
+
+    def __init__(self, path, size, piece_size, root=None):
+        """
+        Args:
+            path: Sidecar file path
+            size: File size in bytes
+            piece_size: Bytes per piece
+            root: Merkle root (bytes) of the expected content, or None
+        """
+        self.path = path
+        self.size = size
+        self.piece_size = piece_size
+        self.root = root
+        self.pieces = max(1, -(-size // piece_size))
+        self.bits = bytearray(-(-self.pieces // 8))
+
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.saved_at = 0.0
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a saved piece map
+
+        Args:
+            path: Sidecar file path
+
+        Returns:
+            PieceMap: The saved map, or None if there is no valid one
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            magic, size, piece_size, root = MAP_HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return None
+        if magic != MAP_MAGIC or piece_size <= 0:
+            return None
+
+        piece_map = cls(path, size, piece_size, root if any(root) else None)
+        bits = data[MAP_HEADER.size:]
+        if len(bits) != len(piece_map.bits):
+            return None
+        piece_map.bits[:] = bits
+        return piece_map
+
+    def __contains__(self, piece):
+        return bool(self.bits[piece >> 3] & (0x80 >> (piece & 7)))
+
+    def add(self, piece):
+        """Mark a piece as written to the partial file"""
+        with self.lock:
+            self.bits[piece >> 3] |= 0x80 >> (piece & 7)
+            self.dirty = True
+
+    def discard(self, piece):
+        """Mark a piece as missing again (e.g. it failed verification)"""
+        with self.lock:
+            self.bits[piece >> 3] &= ~(0x80 >> (piece & 7))
+            self.dirty = True
+
+    def missing(self):
+        """
+        Returns:
+            list: Indices of the pieces not on disk yet, in order
+        """
+        return [piece for piece in range(self.pieces) if piece not in self]
+
+    def save(self, data_fd, wait=True):
+        """
+        Flush the partial file's data, then write the map
+
+        Args:
+            data_fd: File descriptor of the partial file
+            wait: Wait for a save in progress in another thread (False
+                  skips this save instead)
+        """
+        if not self.save_lock.acquire(blocking=wait):
+            return
+        try:
+            _datasync(data_fd)
+            with self.lock:
+                header = MAP_HEADER.pack(MAP_MAGIC, self.size, self.piece_size, self.root or bytes(32))
+                data = header + bytes(self.bits)
+                self.dirty = False
+
+            # Same length every time: overwrite in place
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            self.saved_at = time.monotonic()
+        finally:
+            self.save_lock.release()
+
+    def save_if_due(self, data_fd):
+        """Save the map if it changed and the last save is PIECE_MAP_SAVE_INTERVAL old"""
+        if self.dirty and time.monotonic() - self.saved_at >= PIECE_MAP_SAVE_INTERVAL:
+            self.save(data_fd, wait=False)
@@ -0,0 +1,251 @@
+"""
+Control channel to one index server
+"""
+
+import socket
+import threading
+import time
+from protocol import Protocol, BinaryProtocol, MessageType, MessageStream
+from config import BUSY_MAX_RETRIES, BUSY_MAX_WAIT
+from utils import setup_logger
+
+
+class ServerConnection:
+    """
+    One control connection to an index server (or one shard of it)
+
+    Besides the socket it carries the per-server sync state: the file
+    list last acknowledged by this server with its UPDATE_DELTA sequence
+    number, and the index epoch/version reached with DISCOVER_DELTA.
+
+    With several replica addresses the connection fails over: when a
+    request hits a dead socket it reconnects to the next replica, repeats
+    the HELLO and retries the request once. The sync state is reset, so
+    the next update and discover start with a full UPDATE and snapshot.
+
+    A server that answers ERROR BUSY (rate limit or connection cap) is
+    retried after its retry-after hint, up to BUSY_MAX_RETRIES times.
+
+    `protocol` is the codec requests should be built with: BinaryProtocol
+    once the server accepted version 2 in its HELLO response, else the
+    text Protocol. It is renegotiated on every (re)connect.
+    """
+
+    def __init__(self, host, port, fallbacks=()):
+        self.addresses = [(host, port)] + [a for a in fallbacks if a != (host, port)]
+        self.current = 0
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.stream = None
+        self.logger = setup_logger('ServerConnection')
+
+        # HELLO sent after every (re)connect
+        self.hello_message = None
+
+        # Codec agreed in the HELLO exchange
+        self.protocol = Protocol
+
+        # Serializes request/response exchanges on this connection
+        # (the ping worker and the caller share one socket)
+        self.lock = threading.Lock()
+
+        # Last file list acknowledged by the server and the UPDATE_DELTA
+        # sequence number; None forces a full UPDATE
+        self.synced_files = None
+        self.update_seq = 0
+
+        # Position in this server's index change log
+        self.index_epoch = None
+        self.index_version = None
+
+        # Retry-after hint of the last HELLO rejected with ERROR BUSY
+        self.retry_after = None
+
+        # Bumped by every (re)connect, so a caller can tell that a request
+        # failed over to another replica (and the sync state was reset)
+        self.generation = 0
+
+    @property
+    def address(self):
+        """Server address as "host:port\""""
+        return f"{self.host}:{self.port}"
+
+    def connect(self):
+        """
+        Connect to the first reachable address and send the HELLO
+
+        Addresses are tried in order starting with the current one.
+
+        Returns:
+            bool: True if a server accepted the HELLO
+        """
+        for attempt in range(BUSY_MAX_RETRIES + 1):
+            with self.lock:
+                self.retry_after = None
+                if self._connect_any():
+                    return True
+                retry_after = self.retry_after
+            if retry_after is None or attempt == BUSY_MAX_RETRIES:
+                return False
+            self.logger.warning(f"Servers busy, reconnecting in {retry_after:.2f}s")
+            time.sleep(retry_after)
+        return False
+
+    def _connect_any(self):
+        """Try every address once (caller holds the lock)"""
+        for _ in range(len(self.addresses)):
+            host, port = self.addresses[self.current]
+            try:
+                if self._open(host, port):
+                    return True
+            except (OSError, ConnectionError) as e:
+                self.logger.warning(f"Cannot reach server {host}:{port}: {e}")
+            self._close_socket()
+            self.current = (self.current + 1) % len(self.addresses)
+        return False
+
+    def _open(self, host, port):
+        """Open the TCP connection, reset the sync state and send the HELLO"""
+        self.host, self.port = host, port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.connect((host, port))
+        self.stream = MessageStream(self.sock)
+        self.generation += 1
+        self.protocol = Protocol
+        self.synced_files = None
+        self.update_seq = 0
+        self.index_epoch = None
+        self.index_version = None
+
+        if self.hello_message is None:
+            return True
+
+        response = self._exchange(self.hello_message)
+        msg_type, msg_data = Protocol.parse_message(response)
+        if msg_type != MessageType.OK:
+            retry_after = self._busy_delay(response)
+            if retry_after is not None:
+                self.logger.warning(f"Server {host}:{port} is busy: {response}")
+                self.retry_after = retry_after
+            else:
+                self.logger.error(f"Server {host}:{port} rejected HELLO: {response}")
+            return False
+
+        if Protocol.accepted_version(msg_data) >= BinaryProtocol.VERSION:
+            self.protocol = BinaryProtocol
+        return True
+
+    @staticmethod
+    def _busy_delay(response):
+        """
+        Get the wait requested by an ERROR BUSY response
+
+        Returns:
+            float: Seconds to wait (capped at BUSY_MAX_WAIT), or None if the
+                   response is not ERROR BUSY
+        """
+        if not Protocol.is_error(response):
+            return None
+        msg_type, msg_data = Protocol.parse_message(response)
+        if msg_data.get('code') != "BUSY":
+            return None
+        return min(msg_data.get('retry_after') or 1.0, BUSY_MAX_WAIT)
+
+    def _exchange(self, message):
+        """Send a message and read its response (caller holds the lock)"""
+        if self.stream is None:
+            raise ConnectionError(f"Not connected to {self.address}")
+        self.stream.send(message)
+        response = self.stream.recv()
+        if response is None:
+            raise ConnectionError(f"Server {self.address} closed the connection")
+        return response
+
+    def request(self, message):
+        """
+        Send a control message and wait for its response
+
+        Args:
+            message: Message string, or a payload built with self.protocol
+
+        Returns:
+            str: Response message (bytes if binary)
+        """
+        for attempt in range(BUSY_MAX_RETRIES + 1):
+            response = self._request_once(message)
+            retry_after = self._busy_delay(response)
+            if retry_after is None or attempt == BUSY_MAX_RETRIES:
+                return response
+            self.logger.warning(f"Server {self.address} busy, retrying in {retry_after:.2f}s")
+            time.sleep(retry_after)
+        return response
+
+    def _request_once(self, message):
+        """Exchange one request/response, failing over on a dead socket"""
+        with self.lock:
+            try:
+                return self._exchange(message)
+            except (OSError, ConnectionError) as e:
+                if len(self.addresses) < 2:
+                    raise
+                self.logger.warning(f"Lost server {self.address} ({e}), failing over")
+
+            self._close_socket()
+            self.current = (self.current + 1) % len(self.addresses)
+            if not self._connect_any():
+                raise ConnectionError("No server replica reachable")
+            self.logger.info(f"Failed over to server {self.address}")
+            if self.protocol is Protocol and isinstance(message, bytes):
+                # The replica only speaks text
+                message = BinaryProtocol.to_text(message)
+            return self._exchange(message)
+
+    def send(self, message):
+        """
+        Send a control message without waiting for a response
+
+        Args:
+            message: Message string
+        """
+        with self.lock:
+            if self.stream is not None:
+                self.stream.send(message)
+
+    def receive(self):
+        """
+        Wait for a message pushed by the server
+
+        Used on subscription connections, which carry no requests; the
+        socket is read without the lock so close() can interrupt it.
+
+        Returns:
+            str: Pushed message
+        """
+        stream = self.stream
+        if stream is None:
+            raise ConnectionError(f"Not connected to {self.address}")
+        message = stream.recv()
+        if message is None:
+            raise ConnectionError(f"Server {self.address} closed the connection")
+        return message
+
+    def _close_socket(self):
+        """Close the socket (caller holds the lock)"""
+        if self.sock:
+            try:
+                # Wakes a thread blocked in receive()
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+            try:
+                self.sock.close()
+            except:
+                pass
+        self.sock = None
+        self.stream = None
+
+    def close(self):
+        """Close the connection"""
+        with self.lock:
+            self._close_socket()
@@ -0,0 +1,431 @@
+"""
+Swarm downloads for Client
+Pieces of one file fetched in parallel from several providers
+"""
+
+import os
+import socket
+import threading
+import time
+from collections import deque
+from client.piece_map import PieceMap
+from protocol import Protocol, MessageType, MessageStream
+from config import CONNECTION_TIMEOUT, RECEIVE_BUFFER_SIZE, SWARM_PIECE_SIZE
+from utils import setup_logger, leaf_hash, merkle_root
+
+
+class PeerError(Exception):
+    """A provider refused a range request or answered it wrongly"""
+
+
+class Superseded(Exception):
+    """The piece being received was completed by another provider first (args: bytes received)"""
+
+
+class CorruptData(Exception):
+    """A provider sent data that does not match the published content hashes"""
+
+
+def fetch_piece_hashes(stream, fname, hostname, content):
+    """
+    Get a file's piece hashes from a provider and check them against the root
+
+    Args:
+        stream: MessageStream to the provider
+        fname: Filename
+        hostname: Our full hostname, sent with the request
+        content: (size, piece size, Merkle root bytes) from the index
+
+    Returns:
+        list: Leaf hash per piece
+
+    Raises:
+        PeerError: The provider does not serve hashes
+        CorruptData: The hashes do not match the published content
+    """
+    size, piece_size, root = content
+    get_msg = Protocol.build_message(MessageType.GET_HASHES, fname, hostname, piece_size)
+    stream.send(get_msg)
+
+    reply = stream.recv()
+    if reply is None:
+        raise ConnectionError("connection closed")
+    msg_type, msg_data = Protocol.parse_message(reply)
+    if msg_type != MessageType.HASHES:
+        raise PeerError(f"unexpected reply: {Protocol.as_text(reply)}")
+
+    leaves = msg_data['leaves']
+    if (msg_data['piece_size'] != piece_size or len(leaves) != max(1, -(-size // piece_size))
+            or merkle_root(leaves) != root):
+        raise CorruptData("piece hashes do not match the published root")
+    return leaves
+
+
+class SwarmDownload:
+    """
+    One file downloaded in pieces from several providers at once
+
+    The file is split into pieces of piece_size bytes, written in place
+    into a partial file that is renamed when every piece has arrived.
+    Pieces already on disk from an earlier attempt (see PieceMap) are not
+    fetched again, and a failed download leaves its partial file and
+    piece map behind for the next attempt. Each provider gets a worker thread with one connection that
+    pulls the next missing piece and asks for it with a ranged GET, so
+    fast providers take more pieces than slow ones. A provider that fails
+    gives its piece back and drops out. Once no piece is left unrequested,
+    idle workers also request the pieces in flight longest (end game),
+    so a slow provider cannot hold up the end of the download; the first
+    copy to arrive is kept and the slower transfer is cut off.
+
+    When the index knows the file's content (size, piece size and Merkle
+    root, published by the file's owner), the piece hashes are fetched
+    from the first provider and checked against the root, and every piece
+    is checked against its hash before it is written. A piece that does
+    not match is fetched again from another provider and the provider
+    that sent it drops out, so one bad copy cannot corrupt the download.
+    """
+
+    def __init__(self, fname, providers, file_manager, hostname, resolve, piece_size=SWARM_PIECE_SIZE,
+                 content=None, peer_stats=None):
+        """
+        Args:
+            fname: Filename
+            providers: Provider hostnames, best first
+            file_manager: FileManager the file is written into
+            hostname: Our full hostname, sent with every GET
+            resolve: Callable mapping a provider hostname to (host, port)
+            piece_size: Bytes per range request
+            content: (size, piece size, Merkle root bytes) from the index to
+                     verify against, or None to trust the providers; its
+                     piece size replaces `piece_size`
+            peer_stats: PeerStats that connect times, piece throughput and
+                        failures are recorded in, or None
+        """
+        self.fname = fname
+        self.providers = list(providers)
+        self.file_manager = file_manager
+        self.hostname = hostname
+        self.resolve = resolve
+        self.piece_size = content[1] if content else piece_size
+        self.content = content
+        self.peer_stats = peer_stats
+        self.logger = setup_logger('Swarm')
+
+        # Leaf hash per piece, once fetched and checked against the root
+        self.leaves = None
+
+        # Providers that failed during the download, to be reported
+        self.failed = []
+
+        # Bytes received per provider (duplicate end-game pieces included)
+        self.received = {}
+
+        # Set once the size is known (first ranged reply, or the index)
+        self.size = content[0] if content else None
+        self.fd = None
+        self.piece_map = None
+        self.done = bytearray()
+        self.remaining = 0
+
+        # Piece scheduling, guarded by cond: pieces nobody requested yet,
+        # {piece: providers requesting it} and {piece: first request time}
+        self.missing = deque()
+        self.holders = {}
+        self.started = {}
+        self.cond = threading.Condition()
+
+    def run(self):
+        """
+        Download the file
+
+        Returns:
+            bool: True if the file is complete and in place
+        """
+        start = time.perf_counter()
+        try:
+            streams = self._start()
+            if streams is None:
+                return False
+
+            workers = [
+                threading.Thread(target=self._worker, args=(provider, stream, piece), daemon=True)
+                for provider, (stream, piece) in streams.items()
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+            if self.remaining:
+                # Keep what arrived for the next attempt
+                self.piece_map.save(self.fd)
+        finally:
+            if self.fd is not None:
+                os.close(self.fd)
+
+        if self.remaining:
+            self.logger.error(f"Swarm download of {self.fname} failed: {self.remaining} piece(s) missing")
+            return False
+
+        if not self.file_manager.commit_partial(self.fname):
+            return False
+        if self.leaves is not None:
+            self.file_manager.remember_piece_hashes(self.fname, self.piece_size, self.leaves)
+
+        elapsed = time.perf_counter() - start
+        self.logger.info("Downloaded %s (%d bytes) from %d provider(s) in %.2fs: %s",
+                         self.fname, self.size, len(self.received), elapsed, self.received)
+        return True
+
+    def _start(self):
+        """
+        Learn the file size from the first provider serving ranges
+
+        The first piece not on disk yet (piece 0 for a new download) is
+        requested from the providers in order until one answers with a
+        ranged DATA header; its total size lays out the pieces and the
+        partial file. That provider's worker then receives the piece while
+        the others start on the rest. With known content, the piece hashes
+        are fetched from that provider first.
+
+        Returns:
+            dict: {provider: (open MessageStream or None, piece requested
+                  on it or None)} for the workers, or None if no provider
+                  could be used
+        """
+        root = self.content[2] if self.content else None
+        first = 0
+        saved = PieceMap.load(self.file_manager.piece_map_path(self.fname))
+        if saved is not None and saved.piece_size == self.piece_size and saved.root == root:
+            first = next(iter(saved.missing()), 0)
+
+        for index, provider in enumerate(self.providers):
+            stream = None
+            try:
+                stream = self._connect(provider)
+                if self.content and self.leaves is None:
+                    self.leaves = fetch_piece_hashes(stream, self.fname, self.hostname, self.content)
+                requested_at = time.monotonic()
+                header = self._request(stream, first * self.piece_size, self.piece_size)
+            except Exception as e:
+                self.logger.warning(f"Provider {provider} cannot serve {self.fname} in pieces: {e}")
+                if stream is not None:
+                    stream.sock.close()
+                if not isinstance(e, PeerError):
+                    self._fail(provider)
+                continue
+
+            self._layout(header['total'], first)
+            if self.fd is None:
+                stream.sock.close()
+                return None
+
+            # Already on disk if the saved map was for another size: the
+            # worker then drops the reply as superseded
+            self.holders[first] = {provider}
+            self.started[first] = requested_at
+            streams = {provider: (stream, first)}
+            streams.update((other, (None, None)) for other in self.providers[index + 1:])
+            return streams
+        return None
+
+    def _layout(self, size, first):
+        """
+        Open the partial file and the piece bookkeeping for `size` bytes
+
+        Args:
+            size: File size in bytes
+            first: Piece already requested (left out of the missing queue)
+        """
+        self.size = size
+        root = self.content[2] if self.content else None
+        self.fd, self.piece_map = self.file_manager.open_partial(self.fname, size, self.piece_size, root)
+        if self.fd is None:
+            return
+
+        pieces = self.piece_map.pieces
+        if self.leaves is not None:
+            self._recheck()
+        self.done = bytearray(piece in self.piece_map for piece in range(pieces))
+        self.remaining = pieces - sum(self.done)
+        self.missing.extend(piece for piece in range(pieces) if not self.done[piece] and piece != first)
+
+    def _recheck(self):
+        """Verify the pieces a resumed partial file already has, dropping bad ones"""
+        for piece in range(self.piece_map.pieces):
+            if piece not in self.piece_map:
+                continue
+            offset = piece * self.piece_size
+            data = self.file_manager.read_at(self.fd, min(self.piece_size, self.size - offset), offset)
+            if leaf_hash(data) != self.leaves[piece]:
+                self.logger.warning(f"Piece {piece} of partial {self.fname} is corrupt, fetching it again")
+                self.piece_map.discard(piece)
+
+    def _worker(self, provider, stream, piece):
+        """
+        Download pieces from one provider until none are left or it fails
+
+        Args:
+            provider: Provider hostname
+            stream: Open connection, or None to connect on first use
+            piece: Piece already requested on `stream`, or None
+        """
+        requested = piece is not None
+        try:
+            while True:
+                if not requested:
+                    piece = self._claim(provider)
+                    if piece is None:
+                        return
+
+                offset = piece * self.piece_size
+                length = min(self.piece_size, self.size - offset)
+                # The piece requested by _start went out when it started
+                sent = self.started.get(piece, time.monotonic()) if requested else time.monotonic()
+                try:
+                    if not requested:
+                        if stream is None:
+                            stream = self._connect(provider)
+                        self._request(stream, offset, length)
+                    requested = False
+                    self._receive(stream, piece, length)
+                except Superseded as e:
+                    # The rest of the range is still on the wire
+                    stream.sock.close()
+                    stream = None
+                    self._release(provider, piece)
+                    if self.peer_stats is not None:
+                        self.peer_stats.record_transfer(provider, e.args[0], time.monotonic() - sent)
+                    continue
+                except CorruptData as e:
+                    self.logger.error(f"Provider {provider} sent a corrupt piece {piece} of {self.fname}: {e}")
+                    self._release(provider, piece)
+                    self._fail(provider)
+                    return
+                except Exception as e:
+                    self.logger.warning(f"Provider {provider} failed on {self.fname} piece {piece}: {e}")
+                    self._release(provider, piece)
+                    self._fail(provider)
+                    return
+
+                if self.peer_stats is not None:
+                    self.peer_stats.record_transfer(provider, length, time.monotonic() - sent)
+                self._complete(provider, piece, length)
+        finally:
+            if stream is not None:
+                stream.sock.close()
+
+    def _claim(self, provider):
+        """
+        Pick the next piece for a provider, waiting while none is available
+
+        Returns:
+            int: Piece index, or None once the download is complete
+        """
+        with self.cond:
+            while self.remaining:
+                if self.missing:
+                    piece = self.missing.popleft()
+                else:
+                    # End game: join the piece in flight longest that no
+                    # second provider is helping with yet
+                    waiting = [p for p, holders in self.holders.items()
+                               if provider not in holders and len(holders) < 2]
+                    if not waiting:
+                        self.cond.wait()
+                        continue
+                    piece = min(waiting, key=self.started.__getitem__)
+
+                self.holders.setdefault(piece, set()).add(provider)
+                self.started.setdefault(piece, time.monotonic())
+                return piece
+            return None
+
+    def _release(self, provider, piece):
+        """Give a piece back, making it missing again if nobody else has it"""
+        with self.cond:
+            holders = self.holders.get(piece)
+            if holders is None:
+                return
+            holders.discard(provider)
+            if not holders:
+                del self.holders[piece]
+                del self.started[piece]
+                if not self.done[piece]:
+                    self.missing.appendleft(piece)
+            self.cond.notify_all()
+
+    def _complete(self, provider, piece, length):
+        """Record a piece written to disk"""
+        with self.cond:
+            self.received[provider] = self.received.get(provider, 0) + length
+            self.holders.pop(piece, None)
+            self.started.pop(piece, None)
+            if not self.done[piece]:
+                self.done[piece] = 1
+                self.remaining -= 1
+                self.piece_map.add(piece)
+            self.cond.notify_all()
+        self.piece_map.save_if_due(self.fd)
+
+    def _fail(self, provider):
+        """Drop a provider that failed, to be reported"""
+        self.failed.append(provider)
+        if self.peer_stats is not None:
+            self.peer_stats.record_failure(provider)
+
+    def _connect(self, provider):
+        """Open a connection to a provider"""
+        start = time.monotonic()
+        sock = socket.create_connection(self.resolve(provider), timeout=CONNECTION_TIMEOUT)
+        if self.peer_stats is not None:
+            self.peer_stats.record_connect(provider, time.monotonic() - start)
+        return MessageStream(sock)
+
+    def _request(self, stream, offset, length):
+        """
+        Ask for a byte range and read the DATA header of the reply
+
+        Returns:
+            dict: Parsed DATA header
+
+        Raises:
+            PeerError: The provider refused or does not serve ranges
+        """
+        get_msg = Protocol.build_message(MessageType.GET, self.fname, self.hostname, offset, length)
+        stream.send(get_msg)
+
+        header = stream.recv()
+        if header is None:
+            raise ConnectionError("connection closed")
+        msg_type, msg_data = Protocol.parse_message(header)
+        if msg_type != MessageType.DATA:
+            raise PeerError(f"unexpected reply: {Protocol.as_text(header)}")
+        if msg_data['offset'] is None:
+            raise PeerError("ranged GET not supported")
+        if msg_data['offset'] != offset or (self.size is not None and msg_data['total'] != self.size):
+            raise PeerError(f"range mismatch: {Protocol.as_text(header)}")
+        if msg_data['size'] != min(length, msg_data['total'] - offset):
+            raise PeerError(f"range mismatch: {Protocol.as_text(header)}")
+        return msg_data
+
+    def _receive(self, stream, piece, length):
+        """
+        Receive a piece's bytes and write them in place
+
+        Raises:
+            Superseded: Another provider completed the piece meanwhile
+            CorruptData: The piece does not match its hash
+        """
+        view = memoryview(bytearray(length))
+        received = 0
+        while received < length:
+            if self.done[piece]:
+                raise Superseded(received)
+            count = stream.recv_into(view[received:received + RECEIVE_BUFFER_SIZE])
+            if not count:
+                raise ConnectionError(f"connection closed after {received}/{length} bytes")
+            received += count
+        if self.leaves is not None and leaf_hash(view) != self.leaves[piece]:
+            raise CorruptData("hash mismatch")
+        self.file_manager.write_at(self.fd, view, piece * self.piece_size)
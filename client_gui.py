@@ -297,6 +297,7 @@ class ClientGUI:
         
         # Store all network files for filtering
         self.all_network_files = {}
+        self.search_generation = 0
     
     def setup_logs_tab(self, parent):
         """Setup logs tab"""
@@ -372,6 +373,10 @@ class ClientGUI:
             # Initial refresh
             self.refresh_my_files()
             
+            # Network files are kept current by events the server pushes
+            self.client.subscribe(
+                lambda changes: self.root.after(0, lambda: self.on_network_events(changes)))
+            
         except Exception as e:
             messagebox.showerror("Connection Error", f"Failed to connect:\n{str(e)}")
             self.hostname_entry.config(state=tk.NORMAL)
@@ -548,15 +553,48 @@ class ClientGUI:
             self.log(f"✗ Error refreshing files: {e}")
     
     def filter_network_files(self):
-        """Filter network files by search term"""
-        search_term = self.search_entry.get().lower()
+        """Filter network files by search term (matched on the server)"""
+        search_term = self.search_entry.get()
+        
+        if not search_term or not self.connected:
+            self.show_network_files(self.all_network_files)
+            return
+        
+        # Only the latest keystroke's result is shown
+        self.search_generation += 1
+        generation = self.search_generation
+        
+        def search_thread():
+            try:
+                matches, _ = self.client.search(search_term)
+                if generation == self.search_generation:
+                    self.root.after(0, lambda: self.show_network_files(dict(matches)))
+            except Exception as e:
+                self.log(f"✗ Search error: {e}")
+        
+        threading.Thread(target=search_thread, daemon=True).start()
+    
+    def on_network_events(self, changes):
+        """Apply index changes pushed by the server to the network tab"""
+        if not self.connected:
+            return
+        
+        if changes is None:
+            # Events were missed: reload the whole list
+            self.discover_files()
+            return
         
+        Client.apply_changes(self.all_network_files, changes)
+        if not self.search_entry.get():
+            self.show_network_files(self.all_network_files)
+    
+    def show_network_files(self, files):
+        """Display a {filename: [providers]} mapping in the network tab"""
         self.network_files_tree.delete(*self.network_files_tree.get_children())
         
-        for filename, providers in self.all_network_files.items():
-            if search_term in filename.lower():
-                providers_str = ', '.join(providers)
-                self.network_files_tree.insert('', tk.END, values=(filename, providers_str))
+        for filename, providers in files.items():
+            providers_str = ', '.join(providers)
+            self.network_files_tree.insert('', tk.END, values=(filename, providers_str))
     
     def format_size(self, size):
         """Format file size"""
@@ -303,6 +303,7 @@ class ClientGUI:
         scroll.pack(side='right', fill='y')
         
         self.all_network_files = {}
+        self.search_generation = 0
     
     def _create_activity(self, parent):
         log_frame = tk.Frame(parent, bg=Theme.WHITE)
@@ -361,6 +362,11 @@ class ClientGUI:
                 self.log(f"✓ Connected as {name} on port {port}", 'SUCCESS')
                 self.refresh_my_files()
                 
+                # The server pushes index changes; no need to poll DISCOVER
+                self.client.subscribe(
+                    lambda changes: self.root.after(0, lambda: self._on_network_events(changes)))
+                self.discover_files()
+                
             except Exception as start_error:
                 # Connection failed - clean up client
                 self.client = None
@@ -477,7 +483,11 @@ class ClientGUI:
         
         def disc():
             try:
-                files = self.client.discover()
+                # A full reload fills the network tab page by page; later
+                # refreshes only pull the changes since the last one
+                self.root.after(0, lambda: self._display_network({}))
+                files = self.client.discover(
+                    on_page=lambda page: self.root.after(0, lambda p=page: self._append_network(p)))
                 self.all_network_files = files
                 self.root.after(0, lambda: self._display_network(files))
                 self.log(f"✓ Found {len(files)} file(s)", 'SUCCESS')
@@ -492,11 +502,43 @@ class ClientGUI:
             providers_str = ', '.join(providers)
             self.network_tree.insert('', 'end', values=(filename, providers_str))
     
+    def _append_network(self, entries):
+        for filename, providers in entries:
+            providers_str = ', '.join(providers)
+            self.network_tree.insert('', 'end', values=(filename, providers_str))
+    
+    def _on_network_events(self, changes):
+        if not self.connected:
+            return
+        
+        if changes is None:
+            # Events were missed: reload the whole list
+            self.discover_files()
+            return
+        
+        Client.apply_changes(self.all_network_files, changes)
+        if not self.search_entry.get():
+            self._display_network(self.all_network_files)
+    
     def filter_network(self, event=None):
-        search = self.search_entry.get().lower()
-        filtered = {k: v for k, v in self.all_network_files.items()
-                   if search in k.lower()}
-        self._display_network(filtered)
+        search = self.search_entry.get()
+        if not search or not self.connected:
+            self._display_network(self.all_network_files)
+            return
+        
+        # Matching runs on the server; only the latest keystroke's result is shown
+        self.search_generation += 1
+        generation = self.search_generation
+        
+        def srch():
+            try:
+                matches, _ = self.client.search(search)
+                if generation == self.search_generation:
+                    self.root.after(0, lambda: self._display_network(dict(matches)))
+            except Exception as e:
+                self.log(f"✗ Search failed: {e}", 'ERROR')
+        
+        threading.Thread(target=srch, daemon=True).start()
     
     def download_file(self):
         if not self.connected:
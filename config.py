@@ -5,20 +5,89 @@ Configuration file for File Sharing Application
 # Server Configuration
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 5000
+SERVER_BACKLOG = 1024  # Pending connection queue for the listening socket
+SERVER_MODE = 'threaded'  # 'threaded' (thread per connection) or 'event' (selector loops)
+SERVER_EVENT_LOOPS = 1  # Number of selector loops in 'event' mode
+SERVER_OUTBUF_LIMIT = 1024 * 1024  # Unsent response bytes per connection before 'event' mode pauses reading it (plus one read's responses)
+SERVER_SHARDS = 1  # Index server processes; >1 partitions filenames across ports SERVER_PORT..+N-1
+SERVER_REPLICAS = []  # Extra "host:port" replicas clients may use and fail over to
+SERVER_MAX_CONNECTIONS = 10000  # Concurrent control connections per server process (0 = unlimited)
+BUSY_RETRY_AFTER = 1.0  # Retry-after hint (seconds, jittered) sent to connections over the cap
+
+# Admission control: per-client token buckets {message type: (requests/s, burst)}
+# Every request that lists, searches or rewrites part of the index is limited;
+# a snapshot is one DISCOVER_PAGE per DISCOVER_PAGE_SIZE files, so pages get
+# a burst of 200 (100k files) before the rate applies
+RATE_LIMITS = {
+    'DISCOVER': (2, 10), 'DISCOVER_DELTA': (5, 20), 'DISCOVER_PAGE': (50, 200),
+    'UPDATE': (2, 10), 'UPDATE_DELTA': (10, 50), 'SEARCH': (10, 50), 'FETCH_MANY': (10, 50),
+}
+RATE_LIMIT_DEFAULT = None  # Limit for message types not in RATE_LIMITS (None = unlimited)
+
+# Replication between index server replicas
+REPLICA_PEERS = []  # "host:port" of the other replicas this server streams its mutations to
+REPLICA_BATCH = 1000  # Mutation records per MUTATIONS message
+REPLICA_QUEUE_LIMIT = 100000  # Unsent records per peer before the stream is restarted from a snapshot
+REPLICA_HEARTBEAT_INTERVAL = 2.0  # Seconds between empty MUTATIONS messages on an idle stream
+REPLICA_TIMEOUT = 10.0  # Silence after which a peer's clients are adopted by this replica
+REPLICA_RETRY_INTERVAL = 2.0  # Seconds between reconnect attempts to a peer
 
 # Client Configuration
 CLIENT_HOST = '0.0.0.0'  # Listen on all interfaces for P2P connections
 DEFAULT_CLIENT_PORT_RANGE = (5001, 6000)  # Range for client listening ports
+SUBSCRIBE_RETRY_INTERVAL = 2.0  # Seconds before a lost subscription connection is re-established
+BUSY_MAX_RETRIES = 3  # Times a request rejected with ERROR BUSY is retried after the hinted delay
+BUSY_MAX_WAIT = 10.0  # Longest retry-after hint the client honours (seconds)
+
+# Peer transfers
+PEER_UPLOAD_RATE = 0  # Upload bytes/s of a client's peer server, shared by all its uploads (0 = unlimited)
+SWARM_MAX_PEERS = 8  # Providers a file is downloaded from in parallel (1 = one provider at a time)
+SWARM_PIECE_SIZE = 1024 * 1024  # Bytes per piece: unit of range GETs and of download resume
+PARTIAL_SUFFIX = '.part'  # Suffix of files still being downloaded (not listed or published)
+PIECE_MAP_SUFFIX = '.pieces'  # Appended to a partial file's name for its map of completed pieces
+PIECE_MAP_SAVE_INTERVAL = 1.0  # Seconds between saves of a download's piece map (resume point)
+PEER_STATS_SIZE = 256  # Providers whose observed speed and failures a client remembers (0 = no record)
+PEER_STATS_HALF_LIFE = 120  # Seconds for a provider's observed speed and failures to lose half their weight
+PEER_EXPLORE_RATE = 0.1  # Chance a download tries the least measured provider first
+PEER_SLOW_FACTOR = 4  # Providers expected to take this many times as long as the best are left out of a swarm
 
 # Protocol Configuration
 BUFFER_SIZE = 4096
 ENCODING = 'utf-8'
 CHUNK_SIZE = 10240  # 10KB chunks for file transfer
+RECEIVE_BUFFER_SIZE = 256 * 1024  # Bytes read per recv_into while downloading a file to disk
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024  # Largest accepted control frame (64MB)
+PROTOCOL_VERSION = 2  # Highest control protocol version offered/accepted in HELLO (1 = text only, 2 = binary)
+DISCOVER_CACHE_ENTRIES = 1024  # Encoded DISCOVER responses cached per index version (0 = no cache)
+DISCOVER_PAGE_SIZE = 500  # Files per DISCOVER_PAGE response requested by clients
+MAX_DISCOVER_PAGE_SIZE = 5000  # Upper bound the server enforces on page size
+MAX_FETCH_MANY = 10000  # Filenames accepted in one FETCH_MANY request
+FETCH_PROVIDER_LIMIT = 20  # Providers returned per file by FETCH/FETCH_MANY (0 = all)
+PROVIDER_SHUFFLE = True  # Randomize providers of equal rank so requests spread across them
+PROVIDER_RATE_STEP = 1024 * 1024  # Reported upload bytes/s per load step when ranking providers
+PROVIDER_FAILURE_HALF_LIFE = 60  # Seconds for a provider's failure reports to lose half their weight
+SEARCH_LIMIT = 100  # Default number of SEARCH matches per response
+MAX_SEARCH_LIMIT = 1000  # Upper bound on client-requested SEARCH limit
+CHANGE_LOG_SIZE = 10000  # Index changes kept for DISCOVER_DELTA before a full snapshot is needed
+INDEX_WRITE_BATCH = 256  # Files changed per write-lock hold in bulk index updates (0 = no batching)
+SUBSCRIBE_QUEUE_LIMIT = 10000  # Undelivered events per subscriber before it is told to reload (SNAPSHOT)
+SUBSCRIBE_BATCH = 1000  # Events per pushed EVENTS message
+SUBSCRIBE_COALESCE_DELAY = 0.05  # Seconds events are gathered before a push
+
+# Metrics (STATS message is always available)
+METRICS_PORT = None  # HTTP port serving Prometheus text at /metrics (None = disabled)
+
+# Index persistence (None = keep the index in memory only)
+PERSIST_DIR = None
+PERSIST_SNAPSHOT_INTERVAL = 300  # Seconds between index snapshots
+PERSIST_FLUSH_INTERVAL = 1.0  # Seconds between write-ahead log flushes
 
 # Timeouts
 CONNECTION_TIMEOUT = 30
 PING_INTERVAL = 60  # Ping every 60 seconds
 PING_TIMEOUT = 10
+CLIENT_TIMEOUT = 300  # Server drops clients not seen for this long (5 minutes)
+CLEANUP_MAX_SLEEP = 1.0  # Longest the expiry worker sleeps between deadline checks
 
 # Repository
 DEFAULT_REPO_PATH = './repository'  # Default local repository path
@@ -26,3 +95,6 @@ DEFAULT_REPO_PATH = './repository'  # Default local repository path
 # Logging
 LOG_LEVEL = 'INFO'
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_ASYNC = False  # Queue log records and write them from a background thread (opt-in, e.g. for a busy server)
+LOG_QUEUE_SIZE = 10000  # Records waiting for the writer thread; further records are dropped, never waited for
+LOG_SAMPLE_PER_SECOND = 20  # INFO/DEBUG records per logging call site per second (0 = no sampling)
@@ -1,32 +1,87 @@
 """
 Protocol definitions for File Sharing Application
 Based on Table 5: Control and Data Plane Message Formats
+
+Every message travels as a frame: a 4-byte big-endian payload length
+followed by the payload. Version 1 payloads are UTF-8 message text;
+version 2 payloads are binary (see BinaryProtocol) and start with the
+byte 0x02, which no text message starts with. Raw file bytes after a
+DATA header are not framed.
 """
 
+import sys
+import json
+import struct
+import zlib
+from array import array
+from itertools import zip_longest
+from config import ENCODING, BUFFER_SIZE, MAX_MESSAGE_SIZE
+
+# Frame header: unsigned 32-bit payload length, network byte order
+FRAME_HEADER = struct.Struct('!I')
+
+# Binary (v2) payload header: protocol version, message type code
+BINARY_HEADER = struct.Struct('!BB')
+BINARY_VERSION = 2
+
+
+class ProtocolError(Exception):
+    """Raised when a peer violates the framing rules"""
+
+
+class EncodedFrame(bytes):
+    """A complete frame (header and payload), written to sockets as is"""
+
+
 class MessageType:
     """Message types for the protocol"""
     # Client -> Server
     HELLO = "HELLO"
     PUBLISH = "PUBLISH"
     UPDATE = "UPDATE"
+    UPDATE_DELTA = "UPDATE_DELTA"
     FETCH = "FETCH"
+    FETCH_MANY = "FETCH_MANY"
     PING = "PING"
+    REPORT_FAILURE = "REPORT_FAILURE"
     DISCOVER = "DISCOVER"
+    DISCOVER_PAGE = "DISCOVER_PAGE"
+    DISCOVER_DELTA = "DISCOVER_DELTA"
+    SEARCH = "SEARCH"
+    SHARDS = "SHARDS"
+    REPLICA_HELLO = "REPLICA_HELLO"
+    MUTATIONS = "MUTATIONS"
+    SUBSCRIBE = "SUBSCRIBE"
+    STATS = "STATS"
+    INFO = "INFO"
     BYE = "BYE"
     
     # Server -> Client
     OK = "OK"
     ERROR = "ERROR"
     RESULT = "RESULT"
+    RESULTS = "RESULTS"
     ALIVE = "ALIVE"
+    PAGE = "PAGE"
+    DELTA = "DELTA"
+    SNAPSHOT = "SNAPSHOT"
+    MATCHES = "MATCHES"
+    SHARD_MAP = "SHARD_MAP"
+    EVENTS = "EVENTS"
+    METRICS = "METRICS"
+    FILE_INFO = "FILE_INFO"
     
     # Client -> Client (P2P)
     GET = "GET"
     DATA = "DATA"
+    GET_HASHES = "GET_HASHES"
+    HASHES = "HASHES"
 
 
 class Protocol:
-    """Protocol message builder and parser"""
+    """Protocol message builder and parser (text, version 1)"""
+    
+    VERSION = 1
     
     @staticmethod
     def build_message(msg_type, *args):
@@ -41,14 +96,19 @@ class Protocol:
             str: Formatted message
         """
         if msg_type == MessageType.HELLO:
-            # HELLO <hostname> <port>
-            hostname, port = args
+            # HELLO <hostname> <port> [<highest protocol version>]
+            hostname, port = args[:2]
+            if len(args) > 2 and args[2] and args[2] > 1:
+                return f"HELLO {hostname} {port} {args[2]}"
             return f"HELLO {hostname} {port}"
         
         elif msg_type == MessageType.PUBLISH:
-            # PUBLISH <fname>|||<hostname>
+            # PUBLISH <fname>|||<hostname>[|||<size>|||<piece size>|||<merkle root>]
             # Use ||| as separator to handle filenames with spaces
-            fname, hostname = args
+            fname, hostname = args[:2]
+            if len(args) > 4 and args[4]:
+                size, piece_size, root = args[2:]
+                return f"PUBLISH {fname}|||{hostname}|||{size}|||{piece_size}|||{root}"
             return f"PUBLISH {fname}|||{hostname}"
         
         elif msg_type == MessageType.UPDATE:
@@ -59,6 +119,12 @@ class Protocol:
             files_str = '|||'.join(files) if files else ''
             return f"UPDATE {hostname} {files_str}".strip()
         
+        elif msg_type == MessageType.UPDATE_DELTA:
+            # UPDATE_DELTA <hostname> <seq> +<added1>|||-<removed1>|||...
+            hostname, seq, added, removed = args
+            entries = [f"+{f}" for f in added] + [f"-{f}" for f in removed]
+            return f"UPDATE_DELTA {hostname} {seq} {'|||'.join(entries)}".strip()
+        
         elif msg_type == MessageType.FETCH:
             # FETCH <fname>
             fname = args[0]
@@ -70,25 +136,50 @@ class Protocol:
             hostnames_str = ' '.join(hostnames) if hostnames else ''
             return f"RESULT {hostnames_str}".strip()
         
+        elif msg_type == MessageType.FETCH_MANY:
+            # FETCH_MANY <fname1>|||<fname2>|||...
+            fnames = args[0]
+            return f"FETCH_MANY {'|||'.join(fnames)}"
+        
+        elif msg_type == MessageType.RESULTS:
+            # RESULTS <count>
+            # <fname>|||<hostname1> <hostname2> ...
+            providers = args[0]
+            lines = [f"RESULTS {len(providers)}"]
+            lines.extend(f"{fname}|||{' '.join(hostnames)}" for fname, hostnames in providers.items())
+            return "\n".join(lines)
+        
         elif msg_type == MessageType.GET:
-            # GET <fname>|||<hostname>
-            # Use ||| as separator to handle filenames with spaces
-            fname, hostname = args
+            # GET <fname>|||<hostname>[|||<offset>|||<length>]
+            # Use ||| as separator to handle filenames with spaces; the
+            # optional byte range asks for part of the file only
+            fname, hostname = args[:2]
+            if len(args) > 2:
+                offset, length = args[2:]
+                return f"GET {fname}|||{hostname}|||{offset}|||{length}"
             return f"GET {fname}|||{hostname}"
         
         elif msg_type == MessageType.DATA:
-            # DATA <fname>|||<size> + [binary stream]
-            # Use ||| as separator to handle filenames with spaces
-            fname, size = args
+            # DATA <fname>|||<size>[|||<offset>|||<total>] + [binary stream]
+            # Use ||| as separator to handle filenames with spaces; a ranged
+            # reply carries `size` bytes from `offset` of a `total`-byte file
+            fname, size = args[:2]
+            if len(args) > 2:
+                offset, total = args[2:]
+                return f"DATA {fname}|||{size}|||{offset}|||{total}"
             return f"DATA {fname}|||{size}"
         
         elif msg_type == MessageType.PING:
-            # PING <hostname> / ALIVE
+            # PING <hostname> [<active_uploads> <upload_bytes_per_sec>] / ALIVE
             if args:
-                hostname = args[0]
-                return f"PING {hostname}"
+                return f"PING {' '.join(str(arg) for arg in args)}"
             return "PING"
         
+        elif msg_type == MessageType.REPORT_FAILURE:
+            # REPORT_FAILURE <hostname>
+            hostname = args[0]
+            return f"REPORT_FAILURE {hostname}"
+        
         elif msg_type == MessageType.ALIVE:
             return "ALIVE"
         
@@ -99,6 +190,115 @@ class Protocol:
                 return f"DISCOVER {hostname}"
             return "DISCOVER"
         
+        elif msg_type == MessageType.DISCOVER_PAGE:
+            # DISCOVER_PAGE <limit> <cursor>
+            limit = args[0]
+            cursor = args[1] if len(args) > 1 else None
+            return f"DISCOVER_PAGE {limit} {Protocol.encode_cursor(cursor)}"
+        
+        elif msg_type == MessageType.PAGE:
+            # PAGE <next_cursor>
+            # <fname1>: <provider1>, <provider2>
+            next_cursor, entries = args
+            lines = [f"PAGE {Protocol.encode_cursor(next_cursor)}"]
+            lines.extend(Protocol.format_file_entries(entries))
+            return "\n".join(lines)
+        
+        elif msg_type == MessageType.DISCOVER_DELTA:
+            # DISCOVER_DELTA <epoch> <version>
+            epoch, version = args
+            return f"DISCOVER_DELTA {epoch or '-'} {version or 0}"
+        
+        elif msg_type == MessageType.DELTA:
+            # DELTA <epoch> <version>
+            # +<fname>|||<hostname>
+            # -<fname>|||<hostname>
+            epoch, version, changes = args
+            lines = [f"DELTA {epoch} {version}"]
+            lines.extend(Protocol.format_changes(changes))
+            return "\n".join(lines)
+        
+        elif msg_type == MessageType.SNAPSHOT:
+            # SNAPSHOT <epoch> <version>
+            epoch, version = args
+            return f"SNAPSHOT {epoch} {version}"
+        
+        elif msg_type == MessageType.SEARCH:
+            # SEARCH <prefix|substring> <limit> <offset> <query>
+            mode, limit, offset, query = args
+            return f"SEARCH {mode} {limit} {offset} {query}"
+        
+        elif msg_type == MessageType.MATCHES:
+            # MATCHES <next_offset>
+            # <fname1>: <provider1>, <provider2>
+            next_offset, entries = args
+            lines = [f"MATCHES {'-' if next_offset is None else next_offset}"]
+            lines.extend(Protocol.format_file_entries(entries))
+            return "\n".join(lines)
+        
+        elif msg_type == MessageType.SHARDS:
+            return "SHARDS"
+        
+        elif msg_type == MessageType.SUBSCRIBE:
+            # SUBSCRIBE [pattern]
+            pattern = args[0] if args else None
+            return f"SUBSCRIBE {pattern}" if pattern else "SUBSCRIBE"
+        
+        elif msg_type == MessageType.EVENTS:
+            # EVENTS <count>
+            # +<fname>|||<hostname>
+            # -<fname>|||<hostname>
+            changes = args[0]
+            lines = [f"EVENTS {len(changes)}"]
+            lines.extend(Protocol.format_changes(changes))
+            return "\n".join(lines)
+        
+        elif msg_type == MessageType.STATS:
+            return "STATS"
+        
+        elif msg_type == MessageType.INFO:
+            # INFO <fname>
+            fname = args[0]
+            return f"INFO {fname}"
+        
+        elif msg_type == MessageType.FILE_INFO:
+            # FILE_INFO <fname>|||<size>|||<piece size>|||<merkle root>
+            fname, size, piece_size, root = args
+            return f"FILE_INFO {fname}|||{size}|||{piece_size}|||{root}"
+        
+        elif msg_type == MessageType.GET_HASHES:
+            # GET_HASHES <fname>|||<hostname>|||<piece size>
+            fname, hostname, piece_size = args
+            return f"GET_HASHES {fname}|||{hostname}|||{piece_size}"
+        
+        elif msg_type == MessageType.HASHES:
+            # HASHES <fname>|||<piece size>|||<leaf hash hex> <leaf hash hex> ...
+            fname, piece_size, leaves = args
+            return f"HASHES {fname}|||{piece_size}|||{' '.join(leaf.hex() for leaf in leaves)}"
+        
+        elif msg_type == MessageType.METRICS:
+            # METRICS <json stats>
+            stats = args[0]
+            return f"METRICS {json.dumps(stats, ensure_ascii=False, separators=(',', ':'))}"
+        
+        elif msg_type == MessageType.BYE:
+            return "BYE"
+        
+        elif msg_type == MessageType.REPLICA_HELLO:
+            # REPLICA_HELLO <replica id>
+            replica_id = args[0]
+            return f"REPLICA_HELLO {replica_id}"
+        
+        elif msg_type == MessageType.MUTATIONS:
+            # MUTATIONS <origin> <json list of records>
+            origin, records = args
+            return f"MUTATIONS {origin} {json.dumps(records, ensure_ascii=False, separators=(',', ':'))}"
+        
+        elif msg_type == MessageType.SHARD_MAP:
+            # SHARD_MAP <index> <address0> <address1> ...
+            index, addresses = args
+            return f"SHARD_MAP {index} {' '.join(addresses)}".strip()
+        
         elif msg_type == MessageType.OK:
             # OK <message>
             message = args[0] if args else "published"
@@ -106,7 +306,10 @@ class Protocol:
         
         elif msg_type == MessageType.ERROR:
             # ERROR <code> <description>
-            code, description = args
+            # ERROR BUSY <retry_after> <description>
+            code, description = args[:2]
+            if len(args) > 2:
+                return f"ERROR {code} {args[2]:.3f} {description}"
             return f"ERROR {code} {description}"
         
         else:
@@ -118,11 +321,14 @@ class Protocol:
         Parse protocol message
         
         Args:
-            message: Raw message string
+            message: Raw message string, or a binary (v2) payload
             
         Returns:
             tuple: (message_type, parsed_data)
         """
+        if isinstance(message, (bytes, bytearray)):
+            return BinaryProtocol.parse_message(message)
+        
         if not message:
             return None, None
         
@@ -134,20 +340,25 @@ class Protocol:
         data = parts[1] if len(parts) > 1 else None
         
         if msg_type == MessageType.HELLO:
-            # HELLO <hostname> <port>
+            # HELLO <hostname> <port> [<highest protocol version>]
             if data:
                 parts = data.split()
                 hostname = parts[0]
                 port = int(parts[1]) if len(parts) > 1 else None
-                return msg_type, {'hostname': hostname, 'port': port}
+                version = int(parts[2]) if len(parts) > 2 else 1
+                return msg_type, {'hostname': hostname, 'port': port, 'version': version}
         
         elif msg_type == MessageType.PUBLISH:
-            # PUBLISH <fname>|||<hostname>
+            # PUBLISH <fname>|||<hostname>[|||<size>|||<piece size>|||<merkle root>]
             if data:
                 parts = data.split('|||')
                 fname = parts[0]
                 hostname = parts[1] if len(parts) > 1 else None
-                return msg_type, {'fname': fname, 'hostname': hostname}
+                size = piece_size = root = None
+                if len(parts) > 4:
+                    size, piece_size, root = int(parts[2]), int(parts[3]), parts[4]
+                return msg_type, {'fname': fname, 'hostname': hostname,
+                                  'size': size, 'piece_size': piece_size, 'root': root}
         
         elif msg_type == MessageType.UPDATE:
             # UPDATE <hostname> <file1>|||<file2>|||<file3>...
@@ -157,6 +368,21 @@ class Protocol:
                 files = parts[1].split('|||') if len(parts) > 1 and parts[1] else []
                 return msg_type, {'hostname': hostname, 'files': files}
         
+        elif msg_type == MessageType.UPDATE_DELTA:
+            # UPDATE_DELTA <hostname> <seq> +<added1>|||-<removed1>|||...
+            if data:
+                parts = data.split(maxsplit=2)
+                hostname = parts[0]
+                seq = int(parts[1]) if len(parts) > 1 else 0
+                added, removed = [], []
+                if len(parts) > 2:
+                    for entry in parts[2].split('|||'):
+                        if entry.startswith('+'):
+                            added.append(entry[1:])
+                        elif entry.startswith('-'):
+                            removed.append(entry[1:])
+                return msg_type, {'hostname': hostname, 'seq': seq, 'added': added, 'removed': removed}
+        
         elif msg_type == MessageType.FETCH:
             # FETCH <fname>
             if data:
@@ -167,32 +393,168 @@ class Protocol:
             hostnames = data.split() if data else []
             return msg_type, {'hostnames': hostnames}
         
+        elif msg_type == MessageType.FETCH_MANY:
+            # FETCH_MANY <fname1>|||<fname2>|||...
+            if data:
+                return msg_type, {'fnames': [f for f in data.strip().split('|||') if f]}
+        
+        elif msg_type == MessageType.RESULTS:
+            # RESULTS <count>\n<fname>|||<hostname1> <hostname2>...
+            providers = {}
+            for line in (data.split('\n')[1:] if data else []):
+                if '|||' in line:
+                    fname, hostnames = line.split('|||', 1)
+                    providers[fname] = hostnames.split()
+            return msg_type, {'providers': providers}
+        
         elif msg_type == MessageType.GET:
-            # GET <fname>|||<hostname>
+            # GET <fname>|||<hostname>[|||<offset>|||<length>]
             if data:
                 parts = data.split('|||')
                 fname = parts[0]
                 hostname = parts[1] if len(parts) > 1 else None
-                return msg_type, {'fname': fname, 'hostname': hostname}
+                offset = length = None
+                if len(parts) > 3:
+                    offset, length = int(parts[2]), int(parts[3])
+                return msg_type, {'fname': fname, 'hostname': hostname, 'offset': offset, 'length': length}
         
         elif msg_type == MessageType.DATA:
-            # DATA <fname>|||<size>
+            # DATA <fname>|||<size>[|||<offset>|||<total>]
             if data:
                 parts = data.split('|||')
                 fname = parts[0]
                 size = int(parts[1]) if len(parts) > 1 else 0
-                return msg_type, {'fname': fname, 'size': size}
+                offset = total = None
+                if len(parts) > 3:
+                    offset, total = int(parts[2]), int(parts[3])
+                return msg_type, {'fname': fname, 'size': size, 'offset': offset, 'total': total}
         
         elif msg_type == MessageType.PING:
-            # PING <hostname> (optional)
-            hostname = data.strip() if data else None
-            return msg_type, {'hostname': hostname}
+            # PING <hostname> [<active_uploads> <upload_bytes_per_sec>] (all optional)
+            parts = data.split() if data else []
+            hostname = parts[0] if parts else None
+            uploads = int(parts[1]) if len(parts) > 1 else None
+            upload_rate = int(parts[2]) if len(parts) > 2 else None
+            return msg_type, {'hostname': hostname, 'uploads': uploads, 'upload_rate': upload_rate}
+        
+        elif msg_type == MessageType.REPORT_FAILURE:
+            # REPORT_FAILURE <hostname>
+            if data:
+                return msg_type, {'hostname': data.strip()}
         
         elif msg_type == MessageType.DISCOVER:
             # DISCOVER <hostname> (optional)
             hostname = data.strip() if data else None
             return msg_type, {'hostname': hostname}
         
+        elif msg_type == MessageType.DISCOVER_PAGE:
+            # DISCOVER_PAGE <limit> <cursor>
+            if data:
+                parts = data.split()
+                limit = int(parts[0])
+                cursor = Protocol.decode_cursor(parts[1]) if len(parts) > 1 else None
+                return msg_type, {'limit': limit, 'cursor': cursor}
+        
+        elif msg_type == MessageType.PAGE:
+            # PAGE <next_cursor>\n<fname>: <providers>...
+            if data:
+                lines = data.split('\n')
+                cursor = Protocol.decode_cursor(lines[0].strip())
+                entries = Protocol.parse_file_entries(lines[1:])
+                return msg_type, {'cursor': cursor, 'files': entries}
+        
+        elif msg_type in (MessageType.DISCOVER_DELTA, MessageType.SNAPSHOT):
+            # <type> <epoch> <version>
+            if data:
+                parts = data.split()
+                epoch = parts[0] if parts[0] != '-' else None
+                version = int(parts[1]) if len(parts) > 1 else 0
+                return msg_type, {'epoch': epoch, 'version': version}
+        
+        elif msg_type == MessageType.DELTA:
+            # DELTA <epoch> <version>\n[+|-]<fname>|||<hostname>...
+            if data:
+                lines = data.split('\n')
+                epoch, version = lines[0].split()
+                changes = Protocol.parse_changes(lines[1:])
+                return msg_type, {'epoch': epoch, 'version': int(version), 'changes': changes}
+        
+        elif msg_type == MessageType.SUBSCRIBE:
+            # SUBSCRIBE [pattern]
+            pattern = data.strip() if data else None
+            return msg_type, {'pattern': pattern or None}
+        
+        elif msg_type == MessageType.EVENTS:
+            # EVENTS <count>\n[+|-]<fname>|||<hostname>...
+            lines = data.split('\n') if data else []
+            return msg_type, {'changes': Protocol.parse_changes(lines[1:])}
+        
+        elif msg_type == MessageType.SEARCH:
+            # SEARCH <mode> <limit> <offset> <query>
+            if data:
+                parts = data.split(' ', 3)
+                if len(parts) >= 3:
+                    query = parts[3] if len(parts) > 3 else ''
+                    return msg_type, {'mode': parts[0], 'limit': int(parts[1]),
+                                      'offset': int(parts[2]), 'query': query}
+        
+        elif msg_type == MessageType.MATCHES:
+            # MATCHES <next_offset>\n<fname>: <providers>...
+            if data:
+                lines = data.split('\n')
+                token = lines[0].strip()
+                next_offset = int(token) if token and token != '-' else None
+                entries = Protocol.parse_file_entries(lines[1:])
+                return msg_type, {'next_offset': next_offset, 'files': entries}
+        
+        elif msg_type == MessageType.REPLICA_HELLO:
+            # REPLICA_HELLO <replica id>
+            if data:
+                return msg_type, {'replica_id': data.strip()}
+        
+        elif msg_type == MessageType.MUTATIONS:
+            # MUTATIONS <origin> <json list of records>
+            if data:
+                parts = data.split(maxsplit=1)
+                records = json.loads(parts[1]) if len(parts) > 1 else []
+                return msg_type, {'origin': parts[0], 'records': records}
+        
+        elif msg_type == MessageType.METRICS:
+            # METRICS <json stats>
+            if data:
+                return msg_type, {'stats': json.loads(data)}
+        
+        elif msg_type == MessageType.INFO:
+            # INFO <fname>
+            if data:
+                return msg_type, {'fname': data.strip()}
+        
+        elif msg_type == MessageType.FILE_INFO:
+            # FILE_INFO <fname>|||<size>|||<piece size>|||<merkle root>
+            if data:
+                fname, size, piece_size, root = data.rsplit('|||', 3)
+                return msg_type, {'fname': fname, 'size': int(size), 'piece_size': int(piece_size),
+                                  'root': root.strip()}
+        
+        elif msg_type == MessageType.GET_HASHES:
+            # GET_HASHES <fname>|||<hostname>|||<piece size>
+            if data:
+                fname, hostname, piece_size = data.rsplit('|||', 2)
+                return msg_type, {'fname': fname, 'hostname': hostname, 'piece_size': int(piece_size)}
+        
+        elif msg_type == MessageType.HASHES:
+            # HASHES <fname>|||<piece size>|||<leaf hash hex> <leaf hash hex> ...
+            if data:
+                fname, piece_size, leaves = data.rsplit('|||', 2)
+                return msg_type, {'fname': fname, 'piece_size': int(piece_size),
+                                  'leaves': [bytes.fromhex(leaf) for leaf in leaves.split()]}
+        
+        elif msg_type == MessageType.SHARD_MAP:
+            # SHARD_MAP <index> <address0> <address1> ...
+            if data:
+                parts = data.split()
+                return msg_type, {'index': int(parts[0]), 'addresses': parts[1:]}
+        
         elif msg_type == MessageType.ALIVE:
             return msg_type, {}
         
@@ -207,10 +569,182 @@ class Protocol:
                 parts = data.split(maxsplit=1)
                 code = parts[0]
                 description = parts[1] if len(parts) > 1 else "Unknown error"
+                if code == "BUSY":
+                    # Overloaded server: retry after the hinted number of seconds
+                    parts = description.split(maxsplit=1)
+                    try:
+                        retry_after = float(parts[0])
+                        description = parts[1] if len(parts) > 1 else "Server busy"
+                    except ValueError:
+                        retry_after = None
+                    return msg_type, {'code': code, 'description': description, 'retry_after': retry_after}
                 return msg_type, {'code': code, 'description': description}
         
         return msg_type, {}
     
+    @staticmethod
+    def codec_of(message):
+        """
+        Get the codec a received message was encoded with
+        
+        Servers answer each request in the codec it arrived in.
+        
+        Returns:
+            class: BinaryProtocol for a binary payload, else Protocol
+        """
+        return BinaryProtocol if isinstance(message, (bytes, bytearray)) else Protocol
+    
+    @staticmethod
+    def message_type(message):
+        """
+        Get the type of a message without parsing its body
+        
+        Returns:
+            str: Message type (None if it cannot be determined)
+        """
+        if not message:
+            return None
+        if isinstance(message, (bytes, bytearray)):
+            return BinaryProtocol.message_type(message)
+        head = message[:32].split(None, 1)
+        return head[0].upper() if head else None
+    
+    @staticmethod
+    def is_error(response):
+        """True if a built response is an ERROR message (in either codec)"""
+        if not response or isinstance(response, EncodedFrame):
+            return False
+        return Protocol.message_type(response) == MessageType.ERROR
+    
+    @staticmethod
+    def as_text(message):
+        """
+        Readable form of a message for logs and error text
+        
+        Returns:
+            str: The message in the text protocol (a repr if it is malformed)
+        """
+        if isinstance(message, (bytes, bytearray)):
+            try:
+                return BinaryProtocol.to_text(message)
+            except (ProtocolError, ValueError):
+                return repr(message)
+        return message
+    
+    @staticmethod
+    def accepted_version(ok_data):
+        """
+        Get the protocol version a server agreed to in its HELLO response
+        
+        Args:
+            ok_data: Parsed OK response ("OK registered [<version>]")
+            
+        Returns:
+            int: Agreed version (1 for servers that predate negotiation)
+        """
+        tokens = (ok_data.get('message') or '').split()
+        if len(tokens) > 1 and tokens[-1].isdigit():
+            return int(tokens[-1])
+        return 1
+    
+    @staticmethod
+    def decode_payload(payload):
+        """
+        Decode a frame payload
+        
+        Returns:
+            str or bytes: Message text, or the payload itself if it is binary
+        """
+        if payload and payload[0] == BINARY_VERSION:
+            return payload
+        return payload.decode(ENCODING)
+    
+    @staticmethod
+    def encode_cursor(cursor):
+        """
+        Encode a pagination cursor as an opaque whitespace-free token
+        
+        Args:
+            cursor: Filename to resume after, or None for start/end of listing
+        """
+        if cursor is None:
+            return "-"
+        return cursor.encode(ENCODING).hex()
+    
+    @staticmethod
+    def decode_cursor(token):
+        """Decode a token produced by encode_cursor (None for "-")"""
+        if not token or token == "-":
+            return None
+        return bytes.fromhex(token).decode(ENCODING)
+    
+    @staticmethod
+    def format_file_entries(entries):
+        """
+        Format (fname, providers) pairs as listing lines
+        
+        Returns:
+            list: Lines of the form "<fname>: <provider1>, <provider2>"
+        """
+        return [f"{fname}: {', '.join(providers)}" for fname, providers in entries]
+    
+    @staticmethod
+    def format_changes(changes):
+        """
+        Format (op, fname, hostname) index changes as lines
+        
+        Returns:
+            list: Lines of the form "+<fname>|||<hostname>" (published)
+                  or "-<fname>|||<hostname>" (removed)
+        """
+        return [f"{op}{fname}|||{hostname}" for op, fname, hostname in changes]
+    
+    @staticmethod
+    def parse_changes(lines):
+        """
+        Parse lines produced by format_changes
+        
+        Returns:
+            list: (op, fname, hostname) tuples
+        """
+        changes = []
+        for line in lines:
+            if line[:1] in ('+', '-') and '|||' in line:
+                fname, hostname = line[1:].split('|||', 1)
+                changes.append((line[0], fname, hostname))
+        return changes
+    
+    @staticmethod
+    def parse_file_entries(lines):
+        """
+        Parse listing lines produced by format_file_entries
+        
+        Returns:
+            list: List of (fname, providers) tuples
+        """
+        entries = []
+        for line in lines:
+            if ':' in line:
+                fname, providers = line.split(':', 1)
+                entries.append((fname.strip(), [p.strip() for p in providers.split(',') if p.strip()]))
+        return entries
+    
+    @staticmethod
+    def shard_of(fname, shard_count):
+        """
+        Index of the shard that owns a filename
+        
+        Args:
+            fname: Filename
+            shard_count: Number of shards
+            
+        Returns:
+            int: Shard index in [0, shard_count)
+        """
+        if shard_count <= 1:
+            return 0
+        return zlib.crc32(fname.encode(ENCODING)) % shard_count
+    
     @staticmethod
     def format_hostname(hostname, port):
         """Format hostname with port"""
@@ -223,3 +757,531 @@ class Protocol:
             parts = hostname_str.split(':')
             return parts[0], int(parts[1])
         return hostname_str, None
+
+    @staticmethod
+    def frame(message):
+        """
+        Encode a message as a length-prefixed frame
+        
+        Args:
+            message: Message string, already encoded bytes, or an
+                     EncodedFrame (returned unchanged)
+            
+        Returns:
+            bytes: Frame ready to be written to a socket
+        """
+        if isinstance(message, EncodedFrame):
+            return message
+        payload = message.encode(ENCODING) if isinstance(message, str) else message
+        if len(payload) > MAX_MESSAGE_SIZE:
+            raise ProtocolError(f"Message too large: {len(payload)} bytes")
+        return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def _put_varint(out, value):
+    """Append an unsigned LEB128 varint"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data, pos):
+    """Read an unsigned LEB128 varint; returns (value, next position)"""
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        pos += 1
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos + 1
+        shift += 7
+
+
+def _put_uint(out, value):
+    _put_varint(out, int(value or 0))
+
+
+def _put_opt_uint(out, value):
+    # 0 = None, else value + 1
+    _put_varint(out, 0 if value is None else int(value) + 1)
+
+
+def _get_opt_uint(data, pos):
+    value, pos = _get_varint(data, pos)
+    return (value - 1 if value else None), pos
+
+
+def _put_str(out, value):
+    raw = (value or '').encode(ENCODING)
+    if len(raw) < 0x80:
+        out.append(len(raw))
+    else:
+        _put_varint(out, len(raw))
+    out += raw
+
+
+def _get_str(data, pos):
+    size = data[pos]
+    if size < 0x80:
+        pos += 1
+    else:
+        size, pos = _get_varint(data, pos)
+    end = pos + size
+    if end > len(data):
+        raise ValueError("truncated string")
+    return data[pos:end].decode(ENCODING), end
+
+
+def _put_opt_str(out, value):
+    # Length + 1, 0 = None
+    if value is None:
+        out.append(0)
+        return
+    raw = value.encode(ENCODING)
+    _put_varint(out, len(raw) + 1)
+    out += raw
+
+
+def _get_opt_str(data, pos):
+    size, pos = _get_varint(data, pos)
+    if not size:
+        return None, pos
+    end = pos + size - 1
+    if end > len(data):
+        raise ValueError("truncated string")
+    return data[pos:end].decode(ENCODING), end
+
+
+def _put_opt_float(out, value):
+    if value is None:
+        out.append(0)
+    else:
+        out.append(1)
+        out += _DOUBLE.pack(value)
+
+
+def _get_opt_float(data, pos):
+    if not data[pos]:
+        return None, pos + 1
+    return _DOUBLE.unpack_from(data, pos + 1)[0], pos + 1 + _DOUBLE.size
+
+
+def _put_sizes(out, sizes):
+    """Append non-negative ints as one fixed-width array (width byte, then items)"""
+    largest = max(sizes)
+    if largest <= 0xFF:
+        out.append(1)
+        out += bytes(sizes)
+        return
+    width = 2 if largest <= 0xFFFF else 4
+    items = array(_SIZE_CODES[width], sizes)
+    if sys.byteorder == 'little':
+        items.byteswap()
+    out.append(width)
+    out += items.tobytes()
+
+
+def _get_sizes(data, pos, count):
+    """Read a _put_sizes array of `count` items; returns (sequence of ints, next position)"""
+    width = data[pos]
+    start = pos + 1
+    end = start + width * count
+    if end > len(data):
+        raise ValueError("truncated size array")
+    if width == 1:
+        return data[start:end], end
+    items = array(_SIZE_CODES[width])
+    items.frombytes(data[start:end])
+    if sys.byteorder == 'little':
+        items.byteswap()
+    return items, end
+
+
+def _put_strs(out, items):
+    # Count, then the items NUL-separated in one length-prefixed UTF-8 block,
+    # so decoding is a single decode and split. NUL cannot occur in filenames
+    # or hostnames; an item containing one fails the count check on decode
+    # instead of being mis-split
+    if not isinstance(items, (list, tuple)):
+        items = list(items or ())
+    _put_varint(out, len(items))
+    if items:
+        _put_str(out, '\0'.join(items))
+
+
+def _get_strs(data, pos):
+    count, pos = _get_varint(data, pos)
+    if not count:
+        return [], pos
+    text, pos = _get_str(data, pos)
+    items = text.split('\0')
+    if len(items) != count:
+        raise ValueError("String list count does not match")
+    return items, pos
+
+
+def _put_entries(out, entries):
+    # (name, [values]) pairs: names, values per name, all values
+    names, counts, flat = [], [], []
+    for name, values in entries:
+        names.append(name)
+        counts.append(len(values))
+        flat.extend(values)
+    _put_strs(out, names)
+    if names:
+        _put_sizes(out, counts)
+    _put_strs(out, flat)
+
+
+def _get_entries(data, pos):
+    names, pos = _get_strs(data, pos)
+    counts = ()
+    if names:
+        counts, pos = _get_sizes(data, pos, len(names))
+    values, pos = _get_strs(data, pos)
+    entries = []
+    start = 0
+    for name, count in zip(names, counts):
+        entries.append((name, values[start:start + count]))
+        start += count
+    return entries, pos
+
+
+def _put_map(out, mapping):
+    _put_entries(out, mapping.items())
+
+
+def _get_map(data, pos):
+    entries, pos = _get_entries(data, pos)
+    return dict(entries), pos
+
+
+def _put_changes(out, changes):
+    # (op, fname, hostname) triples: ops as one '+'/'-' string, then both columns
+    changes = list(changes)
+    _put_str(out, ''.join(op for op, _, _ in changes))
+    _put_strs(out, [fname for _, fname, _ in changes])
+    _put_strs(out, [hostname for _, _, hostname in changes])
+
+
+def _get_changes(data, pos):
+    ops, pos = _get_str(data, pos)
+    fnames, pos = _get_strs(data, pos)
+    hostnames, pos = _get_strs(data, pos)
+    if not len(ops) == len(fnames) == len(hostnames):
+        raise ValueError("change columns do not match")
+    return list(zip(ops, fnames, hostnames)), pos
+
+
+def _put_json(out, value):
+    _put_str(out, json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+
+
+def _get_json(data, pos):
+    text, pos = _get_str(data, pos)
+    return json.loads(text), pos
+
+
+_DOUBLE = struct.Struct('!d')
+# Array type codes of 2- and 4-byte sizes ('I' is 4 bytes where 'L' is 8)
+_SIZE_CODES = {2: 'H', 4: 'I' if array('I').itemsize == 4 else 'L'}
+
+# Field kind -> (encoder(out, value), decoder(data, pos) -> (value, pos))
+_FIELD_KINDS = {
+    'uint': (_put_uint, _get_varint),
+    'opt_uint': (_put_opt_uint, _get_opt_uint),
+    'str': (_put_str, _get_str),
+    'opt_str': (_put_opt_str, _get_opt_str),
+    'opt_float': (_put_opt_float, _get_opt_float),
+    'strs': (_put_strs, _get_strs),
+    'entries': (_put_entries, _get_entries),
+    'map': (_put_map, _get_map),
+    'changes': (_put_changes, _get_changes),
+    'json': (_put_json, _get_json),
+}
+
+# {message type: (type code, ((key, field kind), ...))}
+# Fields are build_message's arguments in order and parse_message's keys
+BINARY_SCHEMAS = {
+    # Client -> Server
+    MessageType.HELLO: (1, (('hostname', 'str'), ('port', 'uint'), ('version', 'opt_uint'))),
+    MessageType.PUBLISH: (2, (('fname', 'str'), ('hostname', 'opt_str'),
+                              ('size', 'opt_uint'), ('piece_size', 'opt_uint'), ('root', 'opt_str'))),
+    MessageType.UPDATE: (3, (('hostname', 'str'), ('files', 'strs'))),
+    MessageType.UPDATE_DELTA: (4, (('hostname', 'str'), ('seq', 'uint'), ('added', 'strs'), ('removed', 'strs'))),
+    MessageType.FETCH: (5, (('fname', 'str'),)),
+    MessageType.FETCH_MANY: (6, (('fnames', 'strs'),)),
+    MessageType.PING: (7, (('hostname', 'opt_str'), ('uploads', 'opt_uint'), ('upload_rate', 'opt_uint'))),
+    MessageType.REPORT_FAILURE: (8, (('hostname', 'str'),)),
+    MessageType.DISCOVER: (9, (('hostname', 'opt_str'),)),
+    MessageType.DISCOVER_PAGE: (10, (('limit', 'uint'), ('cursor', 'opt_str'))),
+    MessageType.DISCOVER_DELTA: (11, (('epoch', 'opt_str'), ('version', 'uint'))),
+    MessageType.SEARCH: (12, (('mode', 'str'), ('limit', 'uint'), ('offset', 'uint'), ('query', 'str'))),
+    MessageType.SHARDS: (13, ()),
+    MessageType.MUTATIONS: (14, (('origin', 'str'), ('records', 'json'))),
+    MessageType.SUBSCRIBE: (15, (('pattern', 'opt_str'),)),
+    MessageType.STATS: (16, ()),
+    MessageType.BYE: (17, ()),
+    MessageType.INFO: (18, (('fname', 'str'),)),
+    MessageType.REPLICA_HELLO: (19, (('replica_id', 'str'),)),
+
+    # Server -> Client
+    MessageType.OK: (32, (('message', 'str'),)),
+    MessageType.ERROR: (33, (('code', 'str'), ('description', 'str'), ('retry_after', 'opt_float'))),
+    MessageType.RESULT: (34, (('hostnames', 'strs'),)),
+    MessageType.RESULTS: (35, (('providers', 'map'),)),
+    MessageType.ALIVE: (36, ()),
+    MessageType.PAGE: (37, (('cursor', 'opt_str'), ('files', 'entries'))),
+    MessageType.DELTA: (38, (('epoch', 'opt_str'), ('version', 'uint'), ('changes', 'changes'))),
+    MessageType.SNAPSHOT: (39, (('epoch', 'opt_str'), ('version', 'uint'))),
+    MessageType.MATCHES: (40, (('next_offset', 'opt_uint'), ('files', 'entries'))),
+    MessageType.SHARD_MAP: (41, (('index', 'uint'), ('addresses', 'strs'))),
+    MessageType.EVENTS: (42, (('changes', 'changes'),)),
+    MessageType.METRICS: (43, (('stats', 'json'),)),
+    MessageType.FILE_INFO: (44, (('fname', 'str'), ('size', 'uint'), ('piece_size', 'uint'), ('root', 'str'))),
+}
+
+# Lookup tables derived from BINARY_SCHEMAS
+_BINARY_ENCODERS = {
+    msg_type: (BINARY_HEADER.pack(BINARY_VERSION, code), tuple(_FIELD_KINDS[kind][0] for _, kind in fields))
+    for msg_type, (code, fields) in BINARY_SCHEMAS.items()
+}
+_BINARY_DECODERS = {
+    code: (msg_type, tuple((key, _FIELD_KINDS[kind][1]) for key, kind in fields))
+    for msg_type, (code, fields) in BINARY_SCHEMAS.items()
+}
+
+
+class BinaryProtocol:
+    """
+    Binary control protocol (version 2)
+    
+    A payload is BINARY_HEADER (version byte, message type code) followed
+    by the fields listed in BINARY_SCHEMAS: integers as varints, strings
+    length-prefixed, and string lists as a varint count plus one
+    length-prefixed block of NUL-separated items (one decode and split,
+    as fast as the text protocol's split but unambiguous). Fields may
+    contain spaces and "|||", which the text protocol splits on.
+    
+    build_message and parse_message take and return the same arguments
+    and dictionaries as Protocol's, so code written against one works
+    with the other. Clients offer version 2 in HELLO; everything else
+    keeps speaking text, and servers answer each request in its codec.
+    """
+    
+    VERSION = BINARY_VERSION
+    
+    @staticmethod
+    def build_message(msg_type, *args):
+        """
+        Build a binary protocol message
+        
+        Args:
+            msg_type: Message type from MessageType
+            *args: Same arguments as Protocol.build_message
+            
+        Returns:
+            bytes: Message payload
+        """
+        try:
+            header, encoders = _BINARY_ENCODERS[msg_type]
+        except KeyError:
+            raise ValueError(f"Unknown message type: {msg_type}") from None
+        if len(args) > len(encoders):
+            raise ValueError(f"Too many arguments for {msg_type}")
+        
+        out = bytearray(header)
+        # Missing trailing arguments are encoded as None (absent/empty)
+        pairs = zip(encoders, args) if len(args) == len(encoders) else zip_longest(encoders, args)
+        for encode, value in pairs:
+            encode(out, value)
+        return bytes(out)
+    
+    @staticmethod
+    def parse_message(payload):
+        """
+        Parse a binary protocol message
+        
+        Args:
+            payload: Message payload
+            
+        Returns:
+            tuple: (message_type, parsed_data) as for Protocol.parse_message,
+                   or (None, None) if the payload is malformed
+        """
+        try:
+            version, code = BINARY_HEADER.unpack_from(payload)
+            if version != BINARY_VERSION:
+                return None, None
+            msg_type, decoders = _BINARY_DECODERS[code]
+            
+            data = {}
+            pos = BINARY_HEADER.size
+            for key, decode in decoders:
+                data[key], pos = decode(payload, pos)
+        except (KeyError, IndexError, ValueError, struct.error):
+            # UnicodeDecodeError and json errors are ValueErrors
+            return None, None
+        return msg_type, data
+    
+    @staticmethod
+    def message_type(payload):
+        """Get the message type from the header (None if unknown)"""
+        if len(payload) < BINARY_HEADER.size or payload[0] != BINARY_VERSION:
+            return None
+        decoder = _BINARY_DECODERS.get(payload[1])
+        return decoder[0] if decoder else None
+    
+    @staticmethod
+    def to_text(payload):
+        """
+        Re-encode a binary message for a peer that only speaks text
+        
+        Args:
+            payload: Message payload
+            
+        Returns:
+            str: The same message in the text protocol
+        """
+        msg_type, data = BinaryProtocol.parse_message(payload)
+        if msg_type is None:
+            raise ProtocolError("Malformed binary message")
+        args = [data[key] for key, _ in BINARY_SCHEMAS[msg_type][1]]
+        # Trailing optional arguments are omitted rather than passed as None
+        while args and args[-1] is None:
+            args.pop()
+        return Protocol.build_message(msg_type, *args)
+
+
+class FrameDecoder:
+    """
+    Incremental frame decoder for non-blocking sockets
+    
+    Bytes are fed in as they arrive; complete messages come out in order,
+    so several pipelined requests in one segment are all recovered.
+    """
+    
+    def __init__(self):
+        self.buffer = bytearray()
+    
+    def feed(self, data):
+        """
+        Append received bytes and extract complete messages
+        
+        Args:
+            data: Bytes read from the socket
+            
+        Returns:
+            list: Decoded messages (possibly empty): strings, or bytes
+                  for binary payloads
+        """
+        self.buffer += data
+        messages = []
+        offset = 0
+        header_size = FRAME_HEADER.size
+        
+        while len(self.buffer) - offset >= header_size:
+            (length,) = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_MESSAGE_SIZE:
+                raise ProtocolError(f"Frame too large: {length} bytes")
+            end = offset + header_size + length
+            if len(self.buffer) < end:
+                break
+            messages.append(Protocol.decode_payload(bytes(self.buffer[offset + header_size:end])))
+            offset = end
+        
+        if offset:
+            del self.buffer[:offset]
+        return messages
+
+
+class MessageStream:
+    """
+    Buffered, blocking message reader/writer over a connected socket
+    
+    Reads are buffered so bytes that arrive together with a frame (the next
+    pipelined message, or raw file data after a DATA header) are kept for
+    the following call instead of being lost.
+    """
+    
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+    
+    def send(self, message):
+        """
+        Send one framed message
+        
+        Args:
+            message: Message string or binary payload
+        """
+        self.sock.sendall(Protocol.frame(message))
+    
+    def _fill(self, size):
+        """Read from the socket until at least `size` bytes are buffered"""
+        while len(self.buffer) < size:
+            chunk = self.sock.recv(max(BUFFER_SIZE, size - len(self.buffer)))
+            if not chunk:
+                return False
+            self.buffer += chunk
+        return True
+    
+    def recv(self):
+        """
+        Receive one framed message
+        
+        Returns:
+            str: Message string (bytes for a binary payload), or None
+                 if the connection closed
+        """
+        header_size = FRAME_HEADER.size
+        if not self._fill(header_size):
+            return None
+        
+        (length,) = FRAME_HEADER.unpack_from(self.buffer, 0)
+        if length > MAX_MESSAGE_SIZE:
+            raise ProtocolError(f"Frame too large: {length} bytes")
+        if not self._fill(header_size + length):
+            return None
+        
+        payload = bytes(self.buffer[header_size:header_size + length])
+        del self.buffer[:header_size + length]
+        return Protocol.decode_payload(payload)
+    
+    def recv_raw(self, max_bytes):
+        """
+        Receive unframed bytes, draining buffered data first
+        
+        Args:
+            max_bytes: Maximum number of bytes to return
+            
+        Returns:
+            bytes: Received bytes (empty if the connection closed)
+        """
+        if self.buffer:
+            data = bytes(self.buffer[:max_bytes])
+            del self.buffer[:max_bytes]
+            return data
+        return self.sock.recv(max_bytes)
+    
+    def recv_into(self, view):
+        """
+        Receive unframed bytes into a caller's buffer, draining buffered data first
+        
+        Args:
+            view: Writable buffer (e.g. a memoryview of a reused bytearray)
+            
+        Returns:
+            int: Number of bytes received (0 if the connection closed)
+        """
+        if self.buffer:
+            count = min(len(view), len(self.buffer))
+            view[:count] = self.buffer[:count]
+            del self.buffer[:count]
+            return count
+        return self.sock.recv_into(view)
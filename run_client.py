@@ -50,10 +50,11 @@ def main():
         print(f"{'='*60}\n")
         print("Commands:")
         print("  publish <lname> [fname]  - Publish a file")
-        print("  fetch <fname>            - Fetch a file from network")
+        print("  fetch <fname...>         - Fetch files from network")
         print("  discover                 - List all files in network")
         print("  list                     - List local files")
         print("  ping                     - Ping server")
+        print("  stats                    - Show server metrics")
         print("  add <path> [fname]       - Add file to repository")
         print("  quit                     - Exit")
         print()
@@ -84,7 +85,14 @@ def main():
                 
                 elif command == 'fetch':
                     if len(parts) < 2:
-                        print("Usage: fetch <fname>")
+                        print("Usage: fetch <fname...>")
+                    elif len(parts) > 2:
+                        results = client.fetch_many(parts[1:])
+                        for fname, success in results.items():
+                            if success:
+                                print(f"✓ Downloaded: {fname}")
+                            else:
+                                print(f"✗ Failed to download: {fname}")
                     else:
                         fname = parts[1]
                         if client.fetch(fname):
@@ -120,6 +128,17 @@ def main():
                     else:
                         print("✗ Server is not responding")
                 
+                elif command == 'stats':
+                    for stats in client.server_stats():
+                        index = stats['index']
+                        print(f"\nShard {stats['shard']}: {index['files']} files, {index['providers']} providers, "
+                              f"{index['clients']} clients, {stats['connections']['open']} connections")
+                        print(f"  {'type':<15} {'count':>8} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+                        for msg_type, hist in stats['requests'].items():
+                            print(f"  {msg_type:<15} {hist['count']:>8} {hist['errors']:>7} "
+                                  f"{hist['p50'] * 1000:>8.3f} {hist['p99'] * 1000:>8.3f}")
+                    print()
+                
                 elif command == 'add':
                     if len(parts) < 2:
                         print("Usage: add <path> [fname]")
@@ -135,10 +154,11 @@ def main():
                 elif command == 'help':
                     print("\nAvailable commands:")
                     print("  publish <lname> [fname]  - Publish a file to the network")
-                    print("  fetch <fname>            - Download a file from network")
+                    print("  fetch <fname...>         - Download files from network")
                     print("  discover                 - List all files in network")
                     print("  list                     - List files in local repository")
                     print("  ping                     - Check server connectivity")
+                    print("  stats                    - Show request counts and latencies on the server")
                     print("  add <path> [fname]       - Add external file to repository")
                     print("  quit/exit                - Exit the application")
                     print()
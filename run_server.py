@@ -1,27 +1,85 @@
 """
 Script to run the centralized server
+
+Usage:
+    python run_server.py [--host HOST] [--port PORT] [--mode threaded|event] [--loops N]
+                         [--data-dir DIR] [--shards N] [--advertise-host HOST]
+                         [--peers HOST:PORT ...] [--replica-id HOST:PORT]
+                         [--metrics-port PORT] [--max-connections N]
 """
 
 import sys
 import os
+import argparse
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from server import Server
+from server import Server, EventLoopServer, ShardedServer
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_MODE, SERVER_EVENT_LOOPS, SERVER_SHARDS, PERSIST_DIR,
+    REPLICA_PEERS, METRICS_PORT, SERVER_MAX_CONNECTIONS
+)
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Centralized index server")
+    parser.add_argument('--host', default=SERVER_HOST, help="Address to listen on")
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help="Port to listen on")
+    parser.add_argument('--mode', choices=['threaded', 'event'], default=SERVER_MODE,
+                        help="Connection engine: thread per connection or selector loops")
+    parser.add_argument('--loops', type=int, default=SERVER_EVENT_LOOPS,
+                        help="Number of selector loops in event mode")
+    parser.add_argument('--data-dir', default=PERSIST_DIR,
+                        help="Directory for index snapshots and write-ahead log (default: in-memory only)")
+    parser.add_argument('--shards', type=int, default=SERVER_SHARDS,
+                        help="Number of index server processes; shard i listens on PORT+i")
+    parser.add_argument('--advertise-host', default=None,
+                        help="Host clients use to reach the shards (default: --host)")
+    parser.add_argument('--peers', nargs='*', default=REPLICA_PEERS, metavar='HOST:PORT',
+                        help="Other replicas to stream index mutations to")
+    parser.add_argument('--replica-id', default=None,
+                        help="Name of this replica in the mesh, as the other replicas list it "
+                             "in --peers (default: HOST:PORT)")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="Serve Prometheus metrics at http://HOST:PORT/metrics "
+                             "(shard i uses PORT+i; default: disabled)")
+    parser.add_argument('--max-connections', type=int, default=SERVER_MAX_CONNECTIONS,
+                        help="Concurrent connections per server process before new ones "
+                             "are rejected with ERROR BUSY (0 = unlimited)")
+    return parser.parse_args()
 
 
 def main():
     """Main entry point"""
+    args = parse_args()
+    
     print("="*60)
     print("File Sharing Application - Centralized Server")
     print("="*60)
     print()
     
-    server = Server()
+    if args.shards > 1:
+        server = ShardedServer(args.host, args.port, shards=args.shards, mode=args.mode,
+                               loops=args.loops, persist_dir=args.data_dir,
+                               advertise_host=args.advertise_host, metrics_port=args.metrics_port,
+                               max_connections=args.max_connections)
+    elif args.mode == 'event':
+        server = EventLoopServer(args.host, args.port, loops=args.loops, persist_dir=args.data_dir,
+                                 replica_id=args.replica_id, replica_peers=args.peers,
+                                 metrics_port=args.metrics_port, max_connections=args.max_connections)
+    else:
+        server = Server(args.host, args.port, persist_dir=args.data_dir,
+                        replica_id=args.replica_id, replica_peers=args.peers,
+                        metrics_port=args.metrics_port, max_connections=args.max_connections)
     
     try:
-        print("Starting server...")
+        if args.shards > 1:
+            print(f"Starting {args.shards} shards ({args.mode} mode) on ports "
+                  f"{args.port}-{args.port + args.shards - 1}...")
+        else:
+            print(f"Starting server ({args.mode} mode)...")
         server.start()
     except KeyboardInterrupt:
         print("\n\nShutting down server...")
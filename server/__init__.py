@@ -2,5 +2,7 @@
 
 from server.server import Server
 from server.index_manager import IndexManager
+from server.event_server import EventLoopServer
+from server.sharding import ShardedServer
 
-__all__ = ['Server', 'IndexManager']
+__all__ = ['Server', 'EventLoopServer', 'ShardedServer', 'IndexManager']
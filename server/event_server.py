@@ -0,0 +1,397 @@
+"""
+Event-loop Server Implementation
+Multiplexes all control connections on a small fixed set of selector loops
+"""
+
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from server.server import Server
+from protocol import Protocol, MessageType, FrameDecoder, ProtocolError
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_EVENT_LOOPS, SERVER_OUTBUF_LIMIT, BUFFER_SIZE, PERSIST_DIR,
+    REPLICA_PEERS, SUBSCRIBE_COALESCE_DELAY, METRICS_PORT, SERVER_MAX_CONNECTIONS
+)
+
+
+class _Connection:
+    """Per-connection state kept by an event loop"""
+
+    __slots__ = ('sock', 'address', 'hostname', 'decoder', 'outbuf', 'closing',
+                 'subscription', 'push_waiting', 'reading')
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.hostname = None
+        self.decoder = FrameDecoder()
+        self.outbuf = bytearray()
+        self.closing = False
+        self.subscription = None
+        self.push_waiting = False
+        self.reading = True
+
+
+class _EventLoop:
+    """
+    A single selector loop running in its own thread
+
+    New sockets are handed over from the acceptor through a queue and a
+    wakeup socket pair, so the selector is only ever touched by its own thread.
+    Subscribers are woken the same way when index events are queued for
+    them, and their events are pushed SUBSCRIBE_COALESCE_DELAY later.
+
+    A connection whose unsent responses exceed SERVER_OUTBUF_LIMIT is not
+    read from until half of them are written, so a client that pipelines
+    requests without reading the responses cannot grow the buffer without
+    bound: its requests wait in the kernel buffers, then in its own.
+    """
+
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.selector = selectors.DefaultSelector()
+        self.pending = deque()
+        self.connections = {}
+        self.thread = None
+
+        # Subscribers with queued events: notified from any thread, then
+        # pushed by this loop once their coalescing delay has passed
+        self.push_ready = deque()
+        self.push_due = deque()
+
+        # Wakeup channel for cross-thread notifications
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+
+    def start(self):
+        """Start the loop thread"""
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def add_connection(self, sock, address):
+        """
+        Hand an accepted socket over to this loop (thread-safe)
+
+        Args:
+            sock: Accepted client socket
+            address: Client address tuple
+        """
+        self.pending.append((sock, address))
+        self.wakeup()
+
+    def wakeup(self):
+        """Interrupt a blocking select() call"""
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            # Buffer full means a wakeup is already pending
+            pass
+
+    def run(self):
+        """Loop until the server stops"""
+        while self.server.running:
+            timeout = 1.0
+            if self.push_due:
+                timeout = min(timeout, max(0.0, self.push_due[0][0] - time.monotonic()))
+            try:
+                events = self.selector.select(timeout=timeout)
+            except OSError as e:
+                self.server.logger.error(f"Selector error in {self.name}: {e}")
+                break
+
+            for key, mask in events:
+                if key.data is None:
+                    self._drain_wakeup()
+                    continue
+
+                conn = key.data
+                if mask & selectors.EVENT_READ:
+                    self._on_readable(conn)
+                if mask & selectors.EVENT_WRITE and not conn.closing:
+                    self._flush(conn)
+
+            if self.push_due:
+                self._push_due_events()
+
+        self.close_all()
+
+    def _drain_wakeup(self):
+        """Consume wakeup bytes and register pending sockets"""
+        try:
+            while self._wakeup_recv.recv(BUFFER_SIZE):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+        while self.pending:
+            sock, address = self.pending.popleft()
+            sock.setblocking(False)
+            conn = _Connection(sock, address)
+            self.connections[sock] = conn
+            self.selector.register(sock, selectors.EVENT_READ, conn)
+
+        due = time.monotonic() + SUBSCRIBE_COALESCE_DELAY
+        while self.push_ready:
+            self.push_due.append((due, self.push_ready.popleft()))
+
+    def request_push(self, conn):
+        """
+        Schedule a subscriber's queued events for pushing (thread-safe)
+
+        Args:
+            conn: Subscribed connection
+        """
+        self.push_ready.append(conn)
+        self.wakeup()
+
+    def _push_due_events(self):
+        """Push the events of every subscriber whose delay has passed"""
+        now = time.monotonic()
+        while self.push_due and self.push_due[0][0] <= now:
+            _, conn = self.push_due.popleft()
+            if conn.closing:
+                continue
+            if conn.outbuf:
+                # Slow subscriber: keep coalescing until the last push is written
+                conn.push_waiting = True
+                continue
+            for message in conn.subscription.build_messages(self.server.index_manager):
+                conn.outbuf += Protocol.frame(message)
+            if conn.outbuf:
+                self._flush(conn)
+
+    def _on_readable(self, conn):
+        """
+        Read from a connection and dispatch every complete message
+
+        Args:
+            conn: Connection state
+        """
+        try:
+            data = conn.sock.recv(BUFFER_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except Exception as e:
+            self.server.logger.info("Client connection error: %s", e)
+            self._close(conn)
+            return
+
+        if not data:
+            self.server.logger.info("Client closed connection: %s", conn.address)
+            self._close(conn)
+            return
+
+        try:
+            messages = conn.decoder.feed(data)
+        except ProtocolError as e:
+            self.server.logger.error(f"Protocol error from {conn.address}: {e}")
+            self._close(conn)
+            return
+
+        if messages and conn.subscription:
+            # Subscribers do not send requests: anything else ends the subscription
+            self._close(conn)
+            return
+
+        # Several pipelined requests may arrive in one read
+        for message in messages:
+            if isinstance(message, str):
+                message = message.strip()
+            self.server.logger.debug("Received from %s: %s", conn.address, message)
+
+            try:
+                msg_type, response, registered = self.server._handle_message(
+                    message, conn.sock, conn.hostname or conn.address[0]
+                )
+            except Exception as e:
+                self.server.logger.error(f"Error handling client {conn.address}: {e}")
+                self._close(conn)
+                return
+
+            if registered:
+                conn.hostname = registered
+
+            if msg_type == MessageType.BYE:
+                self.server.logger.info("Client %s sent BYE", conn.hostname)
+                self._close(conn)
+                return
+
+            if response:
+                conn.outbuf += Protocol.frame(response)
+
+            if msg_type == MessageType.SUBSCRIBE and conn.sock in self.server.subscriptions:
+                # The connection now only carries pushed events
+                conn.subscription = self.server.subscriptions[conn.sock]
+                conn.subscription.notify = lambda: self.request_push(conn)
+                self.request_push(conn)
+                break
+
+        if conn.outbuf:
+            self._flush(conn)
+
+    def _flush(self, conn):
+        """
+        Write as much buffered output as the socket accepts
+
+        Args:
+            conn: Connection state
+        """
+        try:
+            while conn.outbuf:
+                sent = conn.sock.send(conn.outbuf)
+                del conn.outbuf[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except Exception as e:
+            self.server.logger.error(f"Error sending message: {e}")
+            self._close(conn)
+            return
+
+        # Stop reading requests while too many responses are unsent
+        if conn.reading and len(conn.outbuf) > SERVER_OUTBUF_LIMIT:
+            conn.reading = False
+        elif not conn.reading and len(conn.outbuf) <= SERVER_OUTBUF_LIMIT // 2:
+            conn.reading = True
+
+        # Only watch for writability while output is pending
+        events = selectors.EVENT_READ if conn.reading else 0
+        if conn.outbuf:
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(conn.sock).events != events:
+            self.selector.modify(conn.sock, events, conn)
+
+        if conn.push_waiting and not conn.outbuf:
+            conn.push_waiting = False
+            self.push_due.append((time.monotonic(), conn))
+
+    def _close(self, conn):
+        """
+        Unregister and close a connection
+
+        Args:
+            conn: Connection state
+        """
+        if conn.closing:
+            return
+        conn.closing = True
+
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        self.connections.pop(conn.sock, None)
+
+        self.server._close_subscription(conn.sock)
+        self.server._close_replica(conn.sock)
+        self.server._handle_disconnect(conn.hostname, conn.address)
+        self.server._release_connection()
+
+        try:
+            conn.sock.close()
+        except:
+            pass
+
+        self.server.logger.info("Connection closed: %s", conn.address)
+
+    def close_all(self):
+        """Close every connection and the selector itself"""
+        for conn in list(self.connections.values()):
+            self._close(conn)
+
+        try:
+            self.selector.close()
+        except:
+            pass
+
+        for sock in (self._wakeup_recv, self._wakeup_send):
+            try:
+                sock.close()
+            except:
+                pass
+
+
+class EventLoopServer(Server):
+    """
+    Centralized Index Server using event-driven I/O
+
+    Instead of one thread per connection, accepted sockets are spread
+    round-robin across a fixed number of selector loops. Requests are
+    dispatched into the same IndexManager as the threaded server.
+    """
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, loops=SERVER_EVENT_LOOPS,
+                 persist_dir=PERSIST_DIR, shard_index=0, shard_addresses=None,
+                 replica_id=None, replica_peers=REPLICA_PEERS, metrics_port=METRICS_PORT,
+                 max_connections=SERVER_MAX_CONNECTIONS):
+        super().__init__(host, port, persist_dir, shard_index, shard_addresses,
+                         replica_id, replica_peers, metrics_port, max_connections)
+        self.num_loops = max(1, loops)
+        self.loops = []
+
+    def start(self):
+        """Start the server"""
+        try:
+            self._open_listener()
+
+            # Start cleanup thread
+            cleanup_thread = threading.Thread(target=self._cleanup_worker, daemon=True)
+            cleanup_thread.start()
+
+            self.loops = [_EventLoop(self, f"EventLoop-{i}") for i in range(self.num_loops)]
+            for loop in self.loops:
+                loop.start()
+
+            self.logger.info(f"Event-loop mode with {self.num_loops} loop(s)")
+
+            # Accept client connections and distribute them
+            next_loop = 0
+            while self.running:
+                try:
+                    client_socket, client_address = self.server_socket.accept()
+                    if not self._admit_connection(client_socket, client_address):
+                        continue
+                    self.logger.info("New connection from %s", client_address)
+
+                    self.loops[next_loop].add_connection(client_socket, client_address)
+                    next_loop = (next_loop + 1) % self.num_loops
+
+                except Exception as e:
+                    if self.running:
+                        self.logger.error(f"Error accepting connection: {e}")
+
+        except Exception as e:
+            self.logger.error(f"Server error: {e}")
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stop the server"""
+        self.running = False
+
+        # As in Server.stop: detach the replicas and persist before the
+        # loops close their connections, so the departing clients'
+        # deregistrations reach neither the peers nor the saved index
+        self.replicator.stop()
+        self._close_store()
+
+        for loop in self.loops:
+            loop.wakeup()
+        for loop in self.loops:
+            if loop.thread and loop.thread is not threading.current_thread():
+                loop.thread.join(timeout=2)
+
+        super().stop()
+
+    def connection_count(self):
+        """
+        Get number of open control connections
+
+        Returns:
+            int: Connections across all loops
+        """
+        return sum(len(loop.connections) for loop in self.loops)
@@ -3,9 +3,30 @@ Index Manager for Server
 Manages file metadata and client registry
 """
 
+import bisect
+import heapq
+import random
 import threading
 import time
-from utils import setup_logger
+import uuid
+from collections import deque
+from itertools import count, islice
+from server.search_index import SearchIndex
+from config import (
+    CHANGE_LOG_SIZE, INDEX_WRITE_BATCH, CLIENT_TIMEOUT, PING_INTERVAL,
+    FETCH_PROVIDER_LIMIT, PROVIDER_SHUFFLE, PROVIDER_RATE_STEP, PROVIDER_FAILURE_HALF_LIFE
+)
+from utils import setup_logger, ReadWriteLock
+
+
+class ProviderEntry:
+    """A provider of one file: hostname and time of its last publish"""
+    
+    __slots__ = ('hostname', 'timestamp')
+    
+    def __init__(self, hostname, timestamp):
+        self.hostname = hostname
+        self.timestamp = timestamp
 
 
 class IndexManager:
@@ -13,104 +34,237 @@ class IndexManager:
     Manages the centralized index of files and clients
     
     Attributes:
-        file_index: Dict mapping filename -> list of (hostname, last_update_time)
-        client_registry: Dict mapping hostname -> {port, last_seen, files}
+        file_index: Dict mapping filename -> {hostname: ProviderEntry}
+        file_hashes: Dict mapping filename -> (size, piece size, Merkle root hex)
+        client_registry: Dict mapping hostname -> {port, last_seen, files, timeout}
+        expiry_heap: Liveness deadlines of registered clients
+        version: Monotonic counter bumped on every provider add/remove
+        change_log: Bounded log of (version, op, filename, hostname) events
     """
     
-    def __init__(self):
+    def __init__(self, change_log_size=CHANGE_LOG_SIZE, write_batch=INDEX_WRITE_BATCH, store=None,
+                 provider_limit=FETCH_PROVIDER_LIMIT, shuffle_providers=PROVIDER_SHUFFLE):
         self.logger = setup_logger('IndexManager')
         
-        # File index: {filename: [(hostname, timestamp), ...]}
+        # File index: {filename: {hostname: ProviderEntry}}
+        # Hash maps keep provider lookup, insert and removal O(1)
         self.file_index = {}
         
-        # Client registry: {hostname: {'port': port, 'last_seen': timestamp, 'files': [...]}}
+        # Content advertised by publishers, for downloaders to verify pieces
+        # against: {filename: (size, piece size, Merkle root hex)}. Dropped
+        # with the file's last provider.
+        self.file_hashes = {}
+        
+        # Sorted filenames, so DISCOVER pages can be walked by cursor
+        self.sorted_files = []
+        
+        # Case-insensitive prefix/substring search over the same filenames
+        self.search_index = SearchIndex()
+        
+        # Client registry: {hostname: {'port': port, 'last_seen': timestamp,
+        #                              'files': set(), 'update_seq': n,
+        #                              'timeout': seconds, 'expiry_seq': n,
+        #                              'uploads': n, 'upload_rate': bytes/s,
+        #                              'assigned': n, 'failures': weight,
+        #                              'failure_time': t}}
         self.client_registry = {}
         
-        # Thread lock for thread-safe operations
-        self.lock = threading.RLock()
+        # Provider ranking for lookups: at most provider_limit providers
+        # (0 = all), ties between equally loaded providers shuffled
+        self.provider_limit = provider_limit
+        self.shuffle_providers = shuffle_providers
+        
+        # Index version and change log for delta DISCOVER.
+        # The epoch identifies this index instance, so versions handed out
+        # before a server restart are never mistaken for current ones.
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.change_log = deque(maxlen=change_log_size)
+        
+        # Reader/writer lock: lookups run concurrently and only wait for
+        # one write batch at a time (bulk updates release between batches)
+        self.lock = ReadWriteLock()
+        self.write_batch = write_batch
+        
+        # Optional persistence (snapshot + write-ahead log)
+        self.store = store
+        
+        # Clients restored from disk that have not contacted this server yet
+        self.unconfirmed_clients = set()
+        
+        # Provider load ('uploads', 'upload_rate', 'assigned') and the
+        # unconfirmed flag change under the read lock (PING, lookups);
+        # this lock keeps each update and each ranking consistent
+        self.load_lock = threading.Lock()
+        
+        # Liveness deadlines: min-heap of (deadline, seq, hostname) with lazy
+        # deletion. PINGs only touch last_seen; an entry whose client was seen
+        # since it was pushed is re-pushed when it reaches the top, and entries
+        # of departed clients (seq no longer matches) are dropped.
+        self.expiry_heap = []
+        self.expiry_seq = count()
+        
+        # Replication: callbacks receiving every locally originated mutation
+        # record. Clients registered through a peer replica carry that
+        # replica's id as 'owner' (None = registered here); only the owner
+        # deregisters or expires them.
+        self.replica_listeners = []
+        self.applying_replica = False
+        
+        # SUBSCRIBE: callbacks receiving every provider change as
+        # (op, filename, hostname), whatever replica it originated on
+        self.change_listeners = []
     
-    def register_client(self, hostname, port):
+    def register_client(self, hostname, port, timeout=CLIENT_TIMEOUT):
         """
         Register a new client or update existing client
         
         Args:
             hostname: Client hostname (format: "host:port")
             port: Client listening port
+            timeout: Seconds without contact before the client expires
             
         Returns:
             bool: True if successful
         """
-        with self.lock:
-            if hostname not in self.client_registry:
-                self.client_registry[hostname] = {
-                    'port': port,
-                    'last_seen': time.time(),
-                    'files': []
-                }
-                self.logger.info(f"New client registered: {hostname} (port: {port})")
+        with self.lock.write_lock():
+            info = self.client_registry.get(hostname)
+            if info is None:
+                self.client_registry[hostname] = self._new_client_entry(hostname, port, time.time(), timeout)
+                self._journal(['C', hostname, port])
+                self.logger.info("New client registered: %s (port: %s)", hostname, port)
             else:
-                self.client_registry[hostname]['last_seen'] = time.time()
-                self.client_registry[hostname]['port'] = port
-                self.logger.info(f"Client updated: {hostname}")
+                if info['owner'] is not None or hostname in self.unconfirmed_clients:
+                    # Client failed over from another replica (or is back
+                    # after a restart): take it over and announce it, with
+                    # its files, to every replica
+                    info['owner'] = None
+                    self._announce_client(hostname, info)
+                elif info['port'] != port:
+                    self._journal(['C', hostname, port])
+                info['last_seen'] = time.time()
+                info['port'] = port
+                self.logger.info("Client updated: %s", hostname)
             
+            self.unconfirmed_clients.discard(hostname)
             return True
     
+    def _new_client_entry(self, hostname, port, now, timeout, owner=None):
+        """Create a registry entry and schedule its expiry (caller holds the write lock)"""
+        seq = next(self.expiry_seq)
+        heapq.heappush(self.expiry_heap, (now + timeout, seq, hostname))
+        return {
+            'port': port,
+            'last_seen': now,
+            'files': set(),
+            'update_seq': 0,
+            'timeout': timeout,
+            'expiry_seq': seq,
+            'owner': owner,
+            'uploads': 0,
+            'upload_rate': 0,
+            'assigned': 0,
+            'failures': 0.0,
+            'failure_time': 0.0
+        }
+    
     def deregister_client(self, hostname):
         """
         Deregister a client and remove all its files from index
         
+        The client leaves the registry immediately; its provider entries are
+        then removed in batches so lookups are not stalled by a large client.
+        
         Args:
             hostname: Client hostname
             
         Returns:
             bool: True if successful
         """
-        with self.lock:
-            if hostname in self.client_registry:
-                # Remove all files published by this client
-                files_to_remove = self.client_registry[hostname]['files'].copy()
-                for fname in files_to_remove:
-                    self.remove_file_provider(fname, hostname)
-                
-                del self.client_registry[hostname]
-                self.logger.info(f"Client deregistered: {hostname}")
-                return True
-            
-            return False
+        with self.lock.write_lock():
+            info = self.client_registry.pop(hostname, None)
+            if info is None:
+                return False
+            self.unconfirmed_clients.discard(hostname)
+            self._journal(['D', hostname])
+        
+        self._remove_providers_batched(hostname, list(info['files']))
+        self.logger.info(f"Client deregistered: {hostname}")
+        return True
     
-    def register_file(self, fname, hostname):
+    def register_file(self, fname, hostname, content=None):
         """
         Register a file in the index
         
         Args:
             fname: Filename
             hostname: Client hostname that owns the file
+            content: (size, piece size, Merkle root hex) of the publisher's
+                     copy, or None if not advertised
             
         Returns:
             bool: True if successful
         """
-        with self.lock:
-            if fname not in self.file_index:
-                self.file_index[fname] = []
-            
-            # Check if this hostname already has this file
-            for i, (h, _) in enumerate(self.file_index[fname]):
-                if h == hostname:
-                    # Update timestamp
-                    self.file_index[fname][i] = (hostname, time.time())
-                    self.logger.info(f"File updated: {fname} by {hostname}")
-                    return True
-            
+        with self.lock.write_lock():
+            return self._register_file(fname, hostname, content)
+    
+    def _register_file(self, fname, hostname, content=None):
+        """Register a file in the index (caller holds the write lock)"""
+        providers = self.file_index.get(fname)
+        if providers is None:
+            providers = self.file_index[fname] = {}
+            bisect.insort(self.sorted_files, fname)
+            self.search_index.add(fname)
+        
+        # Check if this hostname already has this file
+        info = self.client_registry.get(hostname)
+        entry = providers.get(hostname)
+        if entry is not None:
+            # Update timestamp
+            entry.timestamp = time.time()
+            if info is not None and fname not in info['files']:
+                # Left over from a deregistration still being removed in
+                # batches, whose 'D' already dropped it from the log and peers
+                self._journal(['+', fname, hostname])
+            self.logger.debug("File updated: %s by %s", fname, hostname)
+        else:
             # Add new provider
-            self.file_index[fname].append((hostname, time.time()))
-            
-            # Update client's file list
-            if hostname in self.client_registry:
-                if fname not in self.client_registry[hostname]['files']:
-                    self.client_registry[hostname]['files'].append(fname)
+            providers[hostname] = ProviderEntry(hostname, time.time())
+            self._record_change('+', fname, hostname)
+            self.logger.debug("File registered: %s by %s", fname, hostname)
+        
+        # Update client's file list, also for an existing entry: a batched
+        # removal only spares the files the client claims again
+        if info is not None:
+            info['files'].add(fname)
+        
+        # Journaled after the provider, so replay finds the file indexed
+        if content is not None:
+            self._set_file_hash(fname, tuple(content))
+        return True
+    
+    def _set_file_hash(self, fname, content):
+        """Record the advertised content of a file (caller holds the write lock)"""
+        previous = self.file_hashes.get(fname)
+        if previous == content:
+            return
+        if previous is not None:
+            self.logger.info("Content of %s replaced: root %s", fname, content[2])
+        self.file_hashes[fname] = content
+        self._journal(['H', fname, *content])
+    
+    def get_file_hash(self, fname):
+        """
+        Get the advertised content of a file
+        
+        Args:
+            fname: Filename
             
-            self.logger.info(f"File registered: {fname} by {hostname}")
-            return True
+        Returns:
+            tuple: (size, piece size, Merkle root hex), or None if unknown
+        """
+        with self.lock.read_lock():
+            return self.file_hashes.get(fname)
     
     def sync_client_files(self, hostname, files):
         """
@@ -123,31 +277,121 @@ class IndexManager:
         Returns:
             bool: True if successful
         """
-        with self.lock:
-            if hostname not in self.client_registry:
+        new_files = set(files)
+        
+        with self.lock.write_lock():
+            info = self.client_registry.get(hostname)
+            if info is None:
                 self.logger.warning(f"Cannot sync: client {hostname} not registered")
                 return False
             
             # Get current files
-            current_files = set(self.client_registry[hostname]['files'])
-            new_files = set(files)
+            current_files = info['files']
             
-            # Files to add
-            to_add = new_files - current_files
-            for fname in to_add:
-                self.register_file(fname, hostname)
+            # Files to add / remove
+            to_add = list(new_files - current_files)
+            to_remove = list(current_files - new_files)
+            
+            # A full sync restarts the delta sequence
+            info['update_seq'] = 0
+            info['last_seen'] = time.time()
+        
+        # register_file/remove_file_provider keep the file set current
+        if not self._apply_batched(hostname, info, to_add, to_remove):
+            return False
+        
+        self.logger.info(f"Synced files for {hostname}: +{len(to_add)} -{len(to_remove)}")
+        return True
+    
+    def apply_file_delta(self, hostname, seq, added, removed):
+        """
+        Apply an incremental change to a client's file list
+        
+        Deltas must arrive in sequence; after a gap the client's view of
+        what the server holds is unknown and it has to send a full UPDATE.
+        
+        Args:
+            hostname: Client hostname
+            seq: Delta sequence number (1 after a full sync, then +1 each)
+            added: Filenames added since the previous delta
+            removed: Filenames removed since the previous delta
             
-            # Files to remove
-            to_remove = current_files - new_files
-            for fname in to_remove:
-                self.remove_file_provider(fname, hostname)
+        Returns:
+            bool: True if applied, False if the client is unknown or seq has a gap
+        """
+        with self.lock.write_lock():
+            info = self.client_registry.get(hostname)
+            if info is None:
+                self.logger.warning(f"Cannot apply delta: client {hostname} not registered")
+                return False
             
-            # Update client's file list
-            self.client_registry[hostname]['files'] = list(new_files)
-            self.client_registry[hostname]['last_seen'] = time.time()
+            if seq != info['update_seq'] + 1:
+                self.logger.warning(f"Delta sequence gap for {hostname}: "
+                                    f"expected {info['update_seq'] + 1}, got {seq}")
+                return False
             
-            self.logger.info(f"Synced files for {hostname}: +{len(to_add)} -{len(to_remove)}")
-            return True
+            info['update_seq'] = seq
+            info['last_seen'] = time.time()
+        
+        if not self._apply_batched(hostname, info, list(added), list(removed)):
+            return False
+        
+        self.logger.info(f"Delta for {hostname} (seq {seq}): +{len(added)} -{len(removed)}")
+        return True
+    
+    def _apply_batched(self, hostname, info, to_add, to_remove):
+        """
+        Apply provider additions and removals for one client in batches
+        
+        The write lock is released between batches so concurrent lookups
+        only ever wait for one batch. Stops if the client deregisters or
+        re-registers in the meantime.
+        
+        Args:
+            hostname: Client hostname
+            info: Registry entry the changes belong to
+            to_add: Filenames to register
+            to_remove: Filenames to remove
+            
+        Returns:
+            bool: True if every change was applied
+        """
+        ops = [(True, fname) for fname in to_add] + [(False, fname) for fname in to_remove]
+        batch = self.write_batch or len(ops) or 1
+        
+        for start in range(0, len(ops), batch):
+            with self.lock.write_lock():
+                if self.client_registry.get(hostname) is not info:
+                    self.logger.warning(f"Client {hostname} changed during update, stopping")
+                    return False
+                
+                for add, fname in ops[start:start + batch]:
+                    if add:
+                        self._register_file(fname, hostname)
+                    else:
+                        self._remove_file_provider(fname, hostname)
+        
+        return True
+    
+    def _remove_providers_batched(self, hostname, files):
+        """
+        Remove a departed client's provider entries in batches
+        
+        If the same hostname registers again while this runs, files the
+        new registration already claims are left alone.
+        
+        Args:
+            hostname: Client hostname
+            files: Filenames the client provided
+        """
+        batch = self.write_batch or len(files) or 1
+        
+        for start in range(0, len(files), batch):
+            with self.lock.write_lock():
+                current = self.client_registry.get(hostname)
+                for fname in files[start:start + batch]:
+                    if current is None or fname not in current['files']:
+                        self._remove_file_provider(fname, hostname)
     
     def lookup_providers(self, fname):
         """
@@ -159,15 +403,131 @@ class IndexManager:
         Returns:
             list: List of hostnames that have the file
         """
-        with self.lock:
-            if fname in self.file_index:
-                # Return only hostnames (not timestamps)
-                providers = [hostname for hostname, _ in self.file_index[fname]]
-                self.logger.info(f"Lookup {fname}: found {len(providers)} provider(s)")
-                return providers
-            
-            self.logger.info(f"Lookup {fname}: no providers found")
+        with self.lock.read_lock():
+            providers = self._providers_of(fname, time.time()) if fname in self.file_index else None
+        
+        # Logged after releasing the lock
+        if providers is None:
+            self.logger.debug("Lookup %s: no providers found", fname)
             return []
+        
+        self.logger.debug("Lookup %s: found %d provider(s)", fname, len(providers))
+        return providers
+    
+    def lookup_many(self, fnames):
+        """
+        Lookup the providers of many files under one read lock
+        
+        Args:
+            fnames: Filenames to lookup
+            
+        Returns:
+            dict: {filename: [hostnames]} for every requested filename
+                  (empty list when nobody provides it)
+        """
+        with self.lock.read_lock():
+            now = time.time()
+            result = {fname: self._providers_of(fname, now) if fname in self.file_index else []
+                      for fname in fnames}
+        
+        self.logger.debug("Lookup of %d file(s)", len(result))
+        return result
+    
+    def _providers_of(self, fname, now):
+        """
+        Hostnames providing an indexed file, best first (caller holds lock)
+        
+        Returns at most provider_limit providers, grouped by the health tier
+        of _provider_rank. Within a tier the order is a weighted shuffle:
+        a provider with load L comes first with weight 1 / (1 + L), so
+        requests for a hot file spread across all its providers, favouring
+        idle ones, instead of piling onto the first publisher. With
+        shuffling off the order is by load, then publish order.
+        
+        Load reports are up to PING_INTERVAL old, so the provider put first
+        is also charged one 'assigned' download until its next PING;
+        otherwise every request would go to whichever provider reported
+        the least load last time.
+        """
+        providers = self.file_index[fname]
+        if len(providers) == 1:
+            return list(providers)
+        
+        # Rank and charge in one step, so concurrent lookups see each
+        # other's assignments and a PING cannot reset the load in between
+        with self.load_lock:
+            ranked = []
+            for i, hostname in enumerate(providers):
+                tier, load = self._provider_rank(hostname, now)
+                if self.shuffle_providers:
+                    # Efraimidis-Spirakis weighted random key
+                    order = -random.random() ** (1 + load)
+                else:
+                    order = (load, i)
+                ranked.append((tier, order, hostname))
+            
+            if self.provider_limit and len(ranked) > self.provider_limit:
+                ranked = heapq.nsmallest(self.provider_limit, ranked)
+            else:
+                ranked.sort()
+            
+            first = self.client_registry.get(ranked[0][2])
+            if first is not None:
+                first['assigned'] += 1
+        return [hostname for _, _, hostname in ranked]
+    
+    def _provider_rank(self, hostname, now):
+        """
+        Health tier and load of a provider (caller holds lock and load_lock)
+        
+        Returns:
+            tuple: (tier, load) - the tier orders, most significant first:
+                   restored from disk but not seen since, recently reported
+                   as failing by other peers, missed its last PING. The load
+                   is what the provider reported with PING (active uploads
+                   plus its upload rate in PROVIDER_RATE_STEP steps) plus
+                   the downloads sent its way since.
+        """
+        info = self.client_registry.get(hostname)
+        if info is None:
+            return (True, True, True), 0
+        
+        failing = info['failures'] > 0 and self._failure_weight(info, now) >= 0.5
+        
+        # Liveness of clients owned by another replica is tracked there
+        stale = info['owner'] is None and now - info['last_seen'] > 2 * PING_INTERVAL
+        
+        tier = (hostname in self.unconfirmed_clients, failing, stale)
+        return tier, info['uploads'] + info['upload_rate'] // PROVIDER_RATE_STEP + info['assigned']
+    
+    def _failure_weight(self, info, now):
+        """Failure reports of a client, decayed by PROVIDER_FAILURE_HALF_LIFE"""
+        if not info['failures']:
+            return 0.0
+        return info['failures'] * 0.5 ** ((now - info['failure_time']) / PROVIDER_FAILURE_HALF_LIFE)
+    
+    def report_failure(self, hostname):
+        """
+        Record that a provider failed to serve a download
+        
+        A provider with a recent failure is ranked behind healthy ones
+        until the report decays (one half-life for a single report).
+        
+        Args:
+            hostname: Provider hostname
+            
+        Returns:
+            bool: True if the client is known
+        """
+        with self.lock.write_lock():
+            info = self.client_registry.get(hostname)
+            if info is None:
+                return False
+            now = time.time()
+            info['failures'] = self._failure_weight(info, now) + 1
+            info['failure_time'] = now
+            self.logger.info(f"Failure reported for {hostname} (weight {info['failures']:.1f})")
+            return True
     
     def remove_file_provider(self, fname, hostname):
         """
@@ -180,24 +540,32 @@ class IndexManager:
         Returns:
             bool: True if successful
         """
-        with self.lock:
-            if fname in self.file_index:
-                # Remove the provider
-                self.file_index[fname] = [(h, t) for h, t in self.file_index[fname] if h != hostname]
-                
-                # If no providers left, remove the file entry
-                if not self.file_index[fname]:
-                    del self.file_index[fname]
-                    self.logger.info(f"File removed from index: {fname}")
-                
-                # Update client's file list
-                if hostname in self.client_registry:
-                    if fname in self.client_registry[hostname]['files']:
-                        self.client_registry[hostname]['files'].remove(fname)
-                
-                return True
+        with self.lock.write_lock():
+            return self._remove_file_provider(fname, hostname)
+    
+    def _remove_file_provider(self, fname, hostname):
+        """Remove a provider from a file (caller holds the write lock)"""
+        providers = self.file_index.get(fname)
+        if providers is not None:
+            # Remove the provider
+            if providers.pop(hostname, None) is not None:
+                self._record_change('-', fname, hostname)
             
-            return False
+            # If no providers left, remove the file entry
+            if not providers:
+                del self.file_index[fname]
+                self.file_hashes.pop(fname, None)
+                self._remove_sorted(fname)
+                self.search_index.remove(fname)
+                self.logger.debug("File removed from index: %s", fname)
+            
+            # Update client's file list
+            if hostname in self.client_registry:
+                self.client_registry[hostname]['files'].discard(fname)
+            
+            return True
+        
+        return False
     
     def get_all_files(self, hostname=None):
         """
@@ -209,32 +577,422 @@ class IndexManager:
         Returns:
             list or dict: List of filenames or dict of {filename: [providers]}
         """
-        with self.lock:
+        with self.lock.read_lock():
             if hostname:
                 # Return files for specific client
                 if hostname in self.client_registry:
-                    return self.client_registry[hostname]['files'].copy()
+                    return list(self.client_registry[hostname]['files'])
                 return []
             else:
                 # Return all files with providers
                 result = {}
                 for fname, providers in self.file_index.items():
-                    result[fname] = [h for h, _ in providers]
+                    result[fname] = list(providers)
                 return result
     
-    def update_client_liveness(self, hostname):
+    def get_files_page(self, cursor=None, limit=500):
+        """
+        Get one page of the index in filename order
+        
+        Only the requested page is materialized, so the lock is held for
+        O(log n + limit) regardless of index size.
+        
+        Args:
+            cursor: Filename to resume after (None to start from the beginning)
+            limit: Maximum number of files in the page
+            
+        Returns:
+            tuple: (list of (filename, [providers]), next_cursor or None when done)
+        """
+        with self.lock.read_lock():
+            if cursor is None:
+                start = 0
+            else:
+                start = bisect.bisect_right(self.sorted_files, cursor)
+            
+            names = self.sorted_files[start:start + limit]
+            page = [(fname, list(self.file_index[fname])) for fname in names]
+            
+            has_more = start + len(names) < len(self.sorted_files)
+            next_cursor = names[-1] if names and has_more else None
+            return page, next_cursor
+    
+    def search_files(self, query, mode=SearchIndex.SUBSTRING, limit=100, offset=0):
+        """
+        Search filenames without materializing the whole index
+        
+        Args:
+            query: Text to match (case-insensitive)
+            mode: SearchIndex.PREFIX or SearchIndex.SUBSTRING
+            limit: Maximum number of files to return
+            offset: Number of matches to skip
+            
+        Returns:
+            tuple: (list of (filename, [providers]), next offset or None when done)
+        """
+        with self.lock.read_lock():
+            names, next_offset = self.search_index.search(query, mode, limit, offset)
+            return [(fname, list(self.file_index[fname])) for fname in names], next_offset
+    
+    def get_changes_since(self, epoch, version):
+        """
+        Get index changes after a version the caller has already seen
+        
+        Args:
+            epoch: Index epoch the version belongs to
+            version: Last version seen by the caller
+            
+        Returns:
+            tuple: (current_version, list of (op, filename, hostname)), where the
+                   list is None if the caller must reload a full snapshot
+        """
+        with self.lock.read_lock():
+            if epoch != self.epoch or version > self.version:
+                return self.version, None
+            
+            # Versions are consecutive, so the log covers (oldest - 1, current]
+            oldest = self.version - len(self.change_log)
+            if version < oldest:
+                return self.version, None
+            
+            changes = [(op, fname, hostname)
+                       for _, op, fname, hostname in islice(self.change_log, version - oldest, None)]
+            return self.version, changes
+    
+    def _record_change(self, op, fname, hostname):
+        """
+        Bump the index version and log a provider change (caller holds lock)
+        
+        Args:
+            op: '+' for provider added, '-' for provider removed
+            fname: Filename
+            hostname: Provider hostname
+        """
+        self.version += 1
+        self.change_log.append((self.version, op, fname, hostname))
+        self._journal([op, fname, hostname])
+        for listener in self.change_listeners:
+            listener(op, fname, hostname)
+    
+    def _journal(self, record):
+        """
+        Append a mutation to the write-ahead log and hand it to the
+        replica listeners (caller holds the write lock)
+        
+        Records applied from a peer replica are logged but not forwarded:
+        every replica streams only the mutations it originated.
+        """
+        if self.store:
+            self.store.append(record)
+        if self.replica_listeners and not self.applying_replica:
+            for listener in self.replica_listeners:
+                listener(record)
+    
+    def _announce_client(self, hostname, info):
+        """Journal a client and all its files (caller holds the write lock)"""
+        self._journal(['C', hostname, info['port']])
+        for fname in info['files']:
+            self._journal(['+', fname, hostname])
+            if fname in self.file_hashes:
+                self._journal(['H', fname, *self.file_hashes[fname]])
+    
+    def add_replica_listener(self, listener):
+        """
+        Start streaming local mutations to a peer replica
+        
+        The records describing the current state of the locally owned
+        clients are captured under the write lock together with the
+        registration, so no mutation falls between the two.
+        
+        Args:
+            listener: Callable receiving each subsequent mutation record
+            
+        Returns:
+            list: Records that rebuild this replica's own clients and files
+        """
+        with self.lock.write_lock():
+            records = []
+            for hostname, info in self.client_registry.items():
+                if info['owner'] is None:
+                    records.append(['C', hostname, info['port']])
+                    records.extend(['+', fname, hostname] for fname in info['files'])
+                    records.extend(['H', fname, *self.file_hashes[fname]]
+                                   for fname in info['files'] if fname in self.file_hashes)
+            self.replica_listeners.append(listener)
+            return records
+    
+    def remove_replica_listener(self, listener):
+        """Stop streaming mutations to a listener added by add_replica_listener"""
+        with self.lock.write_lock():
+            if listener in self.replica_listeners:
+                self.replica_listeners.remove(listener)
+    
+    def add_change_listener(self, listener):
+        """
+        Receive every subsequent provider change
+        
+        The listener is called with the write lock held, so it must only
+        queue the change and return.
+        
+        Args:
+            listener: Callable(op, filename, hostname)
+        """
+        with self.lock.write_lock():
+            self.change_listeners.append(listener)
+    
+    def remove_change_listener(self, listener):
+        """Stop calling a listener added by add_change_listener"""
+        with self.lock.write_lock():
+            if listener in self.change_listeners:
+                self.change_listeners.remove(listener)
+    
+    def apply_replicated(self, origin, records):
+        """
+        Apply mutation records streamed by a peer replica
+        
+        A record only touches clients owned by `origin`, so a client that
+        has since moved to another replica is left alone.
+        
+        Args:
+            origin: Id of the replica that originated the records
+            records: List of records (see IndexStore)
+            
+        Returns:
+            int: Number of records applied
+        """
+        applied = 0
+        removed_clients = []
+        
+        with self.lock.write_lock():
+            self.applying_replica = True
+            try:
+                for record in records:
+                    op = record[0]
+                    if op == 'C':
+                        applied += self._apply_replicated_client(origin, record[1], record[2])
+                        continue
+                    
+                    if op == 'H':
+                        # Content is per file, not per client
+                        if record[1] in self.file_index:
+                            self._set_file_hash(record[1], tuple(record[2:]))
+                            applied += 1
+                        continue
+                    
+                    info = self.client_registry.get(record[1 if op == 'D' else 2])
+                    if info is not None and info['owner'] != origin:
+                        if op == 'D' and info['owner'] is None:
+                            # The peer dropped a client that is connected here
+                            # (it moved); re-assert ownership to every replica
+                            self.applying_replica = False
+                            self._announce_client(record[1], info)
+                            self.applying_replica = True
+                        continue
+                    
+                    if op == '+' and info is not None:
+                        self._register_file(record[1], record[2])
+                    elif op == '-':
+                        self._remove_file_provider(record[1], record[2])
+                    elif op == 'D' and info is not None:
+                        del self.client_registry[record[1]]
+                        self.unconfirmed_clients.discard(record[1])
+                        self._journal(record)
+                        removed_clients.append((record[1], list(info['files'])))
+                    else:
+                        continue
+                    applied += 1
+            finally:
+                self.applying_replica = False
+        
+        for hostname, files in removed_clients:
+            self._remove_providers_batched(hostname, files)
+        
+        return applied
+    
+    def _apply_replicated_client(self, origin, hostname, port):
+        """Apply a replicated client registration (caller holds the write lock)"""
+        info = self.client_registry.get(hostname)
+        if info is None:
+            self.client_registry[hostname] = self._new_client_entry(
+                hostname, port, time.time(), CLIENT_TIMEOUT, owner=origin)
+        elif info['owner'] is None and hostname not in self.unconfirmed_clients:
+            # Connected here: this replica stays the owner
+            return 0
+        else:
+            info['owner'] = origin
+            info['port'] = port
+            info['last_seen'] = time.time()
+            self.unconfirmed_clients.discard(hostname)
+        
+        self._journal(['C', hostname, port])
+        return 1
+    
+    def adopt_clients(self, origin):
         """
-        Update client's last seen timestamp
+        Take over the clients of a replica that stopped streaming
+        
+        They get a fresh inactivity timeout here and stay unconfirmed: those
+        that fail over to this replica are confirmed by their HELLO, the
+        rest expire.
+        
+        Args:
+            origin: Id of the silent replica
+            
+        Returns:
+            int: Number of clients adopted
+        """
+        with self.lock.write_lock():
+            now = time.time()
+            adopted = 0
+            for hostname, info in self.client_registry.items():
+                if info['owner'] == origin:
+                    info['owner'] = None
+                    info['last_seen'] = now
+                    self.unconfirmed_clients.add(hostname)
+                    adopted += 1
+            return adopted
+    
+    def restore(self):
+        """
+        Load the index from the persistent store and start logging to it
+        
+        Restored clients are kept but marked unconfirmed until they send
+        HELLO or PING; their last_seen is the restore time, so clients that
+        never come back expire through the normal inactivity timeout.
+        
+        Returns:
+            tuple: (number of clients, number of files) restored
+        """
+        if not self.store:
+            return 0, 0
+        
+        start = time.time()
+        snapshot, records = self.store.load()
+        
+        with self.lock.write_lock():
+            now = time.time()
+            
+            def add_client(hostname, port):
+                if hostname not in self.client_registry:
+                    self.client_registry[hostname] = self._new_client_entry(hostname, port, now, CLIENT_TIMEOUT)
+                else:
+                    self.client_registry[hostname]['port'] = port
+            
+            def add_provider(fname, hostname):
+                providers = self.file_index.get(fname)
+                if providers is None:
+                    providers = self.file_index[fname] = {}
+                providers[hostname] = ProviderEntry(hostname, now)
+                info = self.client_registry.get(hostname)
+                if info is not None:
+                    info['files'].add(fname)
+            
+            def remove_provider(fname, hostname):
+                providers = self.file_index.get(fname)
+                if providers is not None:
+                    providers.pop(hostname, None)
+                    if not providers:
+                        del self.file_index[fname]
+                        self.file_hashes.pop(fname, None)
+                info = self.client_registry.get(hostname)
+                if info is not None:
+                    info['files'].discard(fname)
+            
+            if snapshot:
+                for hostname, port in snapshot['clients'].items():
+                    add_client(hostname, port)
+                for entry in snapshot['files']:
+                    fname, hostnames = entry[:2]
+                    for hostname in hostnames:
+                        add_provider(fname, hostname)
+                    if len(entry) > 2 and fname in self.file_index:
+                        self.file_hashes[fname] = tuple(entry[2])
+            
+            for record in records:
+                op = record[0]
+                if op == '+':
+                    add_provider(record[1], record[2])
+                elif op == '-':
+                    remove_provider(record[1], record[2])
+                elif op == 'C':
+                    add_client(record[1], record[2])
+                elif op == 'H':
+                    if record[1] in self.file_index:
+                        self.file_hashes[record[1]] = tuple(record[2:])
+                elif op == 'D':
+                    info = self.client_registry.pop(record[1], None)
+                    if info is not None:
+                        for fname in list(info['files']):
+                            remove_provider(fname, record[1])
+            
+            self.sorted_files = sorted(self.file_index)
+            self.search_index.rebuild(self.sorted_files)
+            self.unconfirmed_clients = set(self.client_registry)
+            self.store.open()
+        
+        self.logger.info(f"Index restored in {time.time() - start:.2f}s: "
+                         f"{len(self.client_registry)} client(s), {len(self.file_index)} file(s), "
+                         f"{len(records)} log record(s) replayed")
+        return len(self.client_registry), len(self.file_index)
+    
+    def snapshot(self):
+        """
+        Write a compact snapshot of the index and truncate the log
+        
+        Writers are blocked only while the state is copied; lookups keep
+        running, and the copy is serialized after the lock is released.
+        
+        Returns:
+            bool: True if a snapshot was written
+        """
+        if not self.store:
+            return False
+        
+        with self.lock.read_lock():
+            gen = self.store.rotate()
+            clients = {hostname: info['port'] for hostname, info in self.client_registry.items()}
+            files = [[fname, list(providers), list(self.file_hashes[fname])] if fname in self.file_hashes
+                     else [fname, list(providers)]
+                     for fname, providers in self.file_index.items()]
+        
+        self.store.write_snapshot(gen, clients, files)
+        return True
+    
+    def close_store(self):
+        """Write a final snapshot and stop logging (safe to call twice)"""
+        if self.store and self.store.running:
+            self.snapshot()
+            self.store.close()
+    
+    def _remove_sorted(self, fname):
+        """Remove a filename from the sorted filename list"""
+        i = bisect.bisect_left(self.sorted_files, fname)
+        if i < len(self.sorted_files) and self.sorted_files[i] == fname:
+            del self.sorted_files[i]
+    
+    def update_client_liveness(self, hostname, uploads=None, upload_rate=None):
+        """
+        Update client's last seen timestamp and reported upload load
         
         Args:
             hostname: Client hostname
+            uploads: Uploads the client is serving right now (None = not reported)
+            upload_rate: Bytes/s the client recently uploaded (None = not reported)
             
         Returns:
             bool: True if client exists
         """
-        with self.lock:
-            if hostname in self.client_registry:
-                self.client_registry[hostname]['last_seen'] = time.time()
+        with self.lock.read_lock():
+            info = self.client_registry.get(hostname)
+            if info is not None:
+                info['last_seen'] = time.time()
+                with self.load_lock:
+                    info['assigned'] = 0
+                    if uploads is not None:
+                        info['uploads'] = uploads
+                    if upload_rate is not None:
+                        info['upload_rate'] = upload_rate
+                    self.unconfirmed_clients.discard(hostname)
                 return True
             return False
     
@@ -248,7 +1006,7 @@ class IndexManager:
         Returns:
             dict: Client info or None
         """
-        with self.lock:
+        with self.lock.read_lock():
             return self.client_registry.get(hostname, None)
     
     def get_all_clients(self):
@@ -258,31 +1016,105 @@ class IndexManager:
         Returns:
             dict: Copy of client registry
         """
-        with self.lock:
+        with self.lock.read_lock():
             return self.client_registry.copy()
     
-    def cleanup_inactive_clients(self, timeout=300):
+    def get_stats(self):
+        """
+        Get index sizes for STATS / metrics
+        
+        Providers are summed over the client registry, so the cost is
+        O(clients) rather than a walk of the whole file index.
+        
+        Returns:
+            dict: files, providers, clients, version and index lock
+                  acquisitions per mode
+        """
+        with self.lock.read_lock():
+            return {
+                'files': len(self.file_index),
+                'providers': sum(len(info['files']) for info in self.client_registry.values()),
+                'clients': len(self.client_registry),
+                'version': self.version,
+                'lock_acquisitions': {
+                    'read': self.lock.read_acquisitions,
+                    'write': self.lock.write_acquisitions,
+                },
+            }
+    
+    def cleanup_inactive_clients(self, now=None):
         """
-        Remove clients that haven't been seen for timeout seconds
+        Remove clients whose liveness deadline has passed
+        
+        Only heap entries that are due are examined, so the cost is
+        O((expired + rescheduled) * log n) rather than a registry scan.
         
         Args:
-            timeout: Timeout in seconds (default: 5 minutes)
+            now: Current time (default: time.time())
             
         Returns:
             int: Number of clients removed
         """
-        with self.lock:
-            current_time = time.time()
-            inactive_clients = []
+        if now is None:
+            now = time.time()
+        
+        removed = 0
+        while True:
+            with self.lock.write_lock():
+                expired = self._pop_expired(now)
+            if expired is None:
+                break
             
-            for hostname, info in self.client_registry.items():
-                if current_time - info['last_seen'] > timeout:
-                    inactive_clients.append(hostname)
+            hostname, info = expired
+            self._remove_providers_batched(hostname, list(info['files']))
+            self.logger.info(f"Client expired: {hostname}")
+            removed += 1
+        
+        if removed:
+            self.logger.info(f"Cleaned up {removed} inactive client(s)")
+        
+        return removed
+    
+    def _pop_expired(self, now):
+        """
+        Pop heap entries until one client is actually expired (caller holds the write lock)
+        
+        Returns:
+            tuple: (hostname, registry entry) of the expired client, already
+                   removed from the registry, or None if nothing is due
+        """
+        heap = self.expiry_heap
+        while heap and heap[0][0] <= now:
+            _, seq, hostname = heapq.heappop(heap)
+            info = self.client_registry.get(hostname)
+            if info is None or info['expiry_seq'] != seq:
+                # Client left (or re-registered with a new entry)
+                continue
             
-            for hostname in inactive_clients:
-                self.deregister_client(hostname)
+            if info['owner'] is not None:
+                # The owning replica decides when its clients leave
+                heapq.heappush(heap, (now + info['timeout'], seq, hostname))
+                continue
             
-            if inactive_clients:
-                self.logger.info(f"Cleaned up {len(inactive_clients)} inactive client(s)")
+            deadline = info['last_seen'] + info['timeout']
+            if deadline > now:
+                # Seen since the entry was pushed: reschedule
+                heapq.heappush(heap, (deadline, seq, hostname))
+                continue
             
-            return len(inactive_clients)
+            del self.client_registry[hostname]
+            self.unconfirmed_clients.discard(hostname)
+            self._journal(['D', hostname])
+            return hostname, info
+        
+        return None
+    
+    def next_expiry(self):
+        """
+        Get the earliest pending liveness deadline
+        
+        Returns:
+            float: Deadline timestamp, or None if no client is registered
+        """
+        with self.lock.read_lock():
+            return self.expiry_heap[0][0] if self.expiry_heap else None
@@ -0,0 +1,308 @@
+"""
+Server Metrics
+Request counters, latency histograms and the Prometheus/HTTP exposition
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from protocol import MessageType
+
+# Histogram bucket upper bounds in seconds (Prometheus style, +Inf implied)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Message types tracked under their own name; anything else a client sends
+# is counted as UNKNOWN so it cannot create unbounded label values
+MESSAGE_TYPES = frozenset(value for name, value in vars(MessageType).items() if name.isupper())
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations
+
+    Not thread-safe on its own; ServerMetrics serializes access.
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """
+        Record one duration
+
+        Args:
+            value: Duration in seconds
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by interpolating inside its bucket
+
+        Args:
+            q: Quantile in [0, 1]
+
+        Returns:
+            float: Estimated duration in seconds (0.0 when empty)
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, n in zip(self.bounds, self.counts):
+            if n and seen + n >= rank:
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+            lower = upper
+        # In the +Inf bucket: the largest observation is the best bound
+        return self.max
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: count, sum, max, p50/p90/p99 and cumulative buckets as
+                  [[upper bound, count], ...] ending with "+Inf"
+        """
+        buckets = []
+        cumulative = 0
+        for upper, n in zip(self.bounds, self.counts):
+            cumulative += n
+            buckets.append([upper, cumulative])
+        buckets.append(['+Inf', self.count])
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': buckets,
+        }
+
+
+class ServerMetrics:
+    """
+    Counters and histograms collected by one index server
+
+    Requests are timed around Server._handle_message, so the latencies are
+    server processing time (parse, index work, response encoding) for both
+    serving modes; socket I/O is not included. Index lock waits are only
+    recorded when an acquisition actually had to block.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+        # {message type: Histogram} and {message type: error responses}
+        self.requests = {}
+        self.errors = {}
+
+        self.connections_opened = 0
+        self.connections_closed = 0
+
+        # {'rate' | 'connections': requests or connections rejected with BUSY}
+        self.rejections = {'rate': 0, 'connections': 0}
+
+        # {'read' | 'write': Histogram} of blocked index lock acquisitions
+        self.lock_waits = {'read': Histogram(), 'write': Histogram()}
+
+    def observe_request(self, msg_type, seconds, error=False):
+        """
+        Record one handled control message
+
+        Args:
+            msg_type: Message type (None for unparseable messages)
+            seconds: Processing time
+            error: True if the response was an ERROR
+        """
+        if not msg_type:
+            msg_type = 'INVALID'
+        elif msg_type not in MESSAGE_TYPES:
+            msg_type = 'UNKNOWN'
+        with self.lock:
+            histogram = self.requests.get(msg_type)
+            if histogram is None:
+                histogram = self.requests[msg_type] = Histogram()
+                self.errors[msg_type] = 0
+            histogram.observe(seconds)
+            if error:
+                self.errors[msg_type] += 1
+
+    def observe_lock_wait(self, mode, seconds):
+        """
+        Record time spent blocked on the index lock (ReadWriteLock observer)
+
+        Args:
+            mode: 'read' or 'write'
+            seconds: Time waited
+        """
+        with self.lock:
+            self.lock_waits[mode].observe(seconds)
+
+    def observe_rejection(self, reason):
+        """
+        Count an ERROR BUSY rejection
+
+        Args:
+            reason: 'rate' (rate limited request) or 'connections' (over the cap)
+        """
+        with self.lock:
+            self.rejections[reason] += 1
+
+    def connection_opened(self):
+        """Count an accepted control connection"""
+        with self.lock:
+            self.connections_opened += 1
+
+    def connection_closed(self):
+        """Count a closed control connection"""
+        with self.lock:
+            self.connections_closed += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Uptime, per-type request histograms and error counts,
+                  connection counters, index lock waits and BUSY rejections
+        """
+        with self.lock:
+            return {
+                'uptime': time.time() - self.started,
+                'requests': {msg_type: dict(histogram.snapshot(), errors=self.errors[msg_type])
+                             for msg_type, histogram in sorted(self.requests.items())},
+                'connections': {
+                    'open': self.connections_opened - self.connections_closed,
+                    'total': self.connections_opened,
+                },
+                'lock_waits': {mode: histogram.snapshot() for mode, histogram in self.lock_waits.items()},
+                'rejections': dict(self.rejections),
+            }
+
+
+def _format_histogram(lines, name, labels, histogram):
+    """Append the _bucket/_sum/_count samples of one histogram snapshot"""
+    prefix = f"{labels}," if labels else ""
+    for upper, cumulative in histogram['buckets']:
+        lines.append(f'{name}_bucket{{{prefix}le="{upper}"}} {cumulative}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram['sum']:.6f}")
+    lines.append(f"{name}_count{suffix} {histogram['count']}")
+
+
+def format_prometheus(stats):
+    """
+    Render Server.get_stats() in the Prometheus text exposition format
+
+    Args:
+        stats: Stats dict as returned by Server.get_stats()
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+
+    def metric(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    metric('p2p_uptime_seconds', 'gauge', "Seconds since the server started")
+    lines.append(f"p2p_uptime_seconds {stats['uptime']:.3f}")
+
+    requests = stats['requests']
+    metric('p2p_requests_total', 'counter', "Control messages handled, by type")
+    for msg_type, histogram in requests.items():
+        lines.append(f'p2p_requests_total{{type="{msg_type}"}} {histogram["count"]}')
+    metric('p2p_request_errors_total', 'counter', "Control messages answered with ERROR, by type")
+    for msg_type, histogram in requests.items():
+        lines.append(f'p2p_request_errors_total{{type="{msg_type}"}} {histogram["errors"]}')
+    metric('p2p_request_duration_seconds', 'histogram', "Server processing time per control message")
+    for msg_type, histogram in requests.items():
+        _format_histogram(lines, 'p2p_request_duration_seconds', f'type="{msg_type}"', histogram)
+
+    connections = stats['connections']
+    metric('p2p_connections_open', 'gauge', "Open control connections")
+    lines.append(f"p2p_connections_open {connections['open']}")
+    metric('p2p_connections_total', 'counter', "Control connections accepted")
+    lines.append(f"p2p_connections_total {connections['total']}")
+    metric('p2p_connections_registered', 'gauge', "Open control connections that sent HELLO")
+    lines.append(f"p2p_connections_registered {connections['registered']}")
+    metric('p2p_rejections_total', 'counter', "Requests and connections rejected with ERROR BUSY, by reason")
+    for reason, count in stats['rejections'].items():
+        lines.append(f'p2p_rejections_total{{reason="{reason}"}} {count}')
+    metric('p2p_subscribers', 'gauge', "Connections receiving SUBSCRIBE events")
+    lines.append(f"p2p_subscribers {connections['subscribers']}")
+
+    index = stats['index']
+    for key, help_text in (('files', "Distinct filenames in the index"),
+                           ('providers', "Provider entries (filename, client pairs) in the index"),
+                           ('clients', "Registered clients")):
+        metric(f'p2p_index_{key}', 'gauge', help_text)
+        lines.append(f"p2p_index_{key} {index[key]}")
+    metric('p2p_index_version', 'counter', "Index changes since the server started")
+    lines.append(f"p2p_index_version {index['version']}")
+
+    cache = stats['discover_cache']
+    metric('p2p_discover_cache_requests_total', 'counter', "DISCOVER requests served from / building the cache")
+    lines.append(f'p2p_discover_cache_requests_total{{result="hit"}} {cache["hits"]}')
+    lines.append(f'p2p_discover_cache_requests_total{{result="miss"}} {cache["misses"]}')
+    metric('p2p_discover_cache_bytes', 'gauge', "Size of the cached DISCOVER responses")
+    lines.append(f"p2p_discover_cache_bytes {cache['bytes']}")
+
+    metric('p2p_index_lock_acquisitions_total', 'counter', "Index lock acquisitions, by mode")
+    for mode, acquisitions in index['lock_acquisitions'].items():
+        lines.append(f'p2p_index_lock_acquisitions_total{{mode="{mode}"}} {acquisitions}')
+    metric('p2p_index_lock_wait_seconds', 'histogram', "Time blocked acquiring the index lock, by mode")
+    for mode, histogram in stats['lock_waits'].items():
+        _format_histogram(lines, 'p2p_index_lock_wait_seconds', f'mode="{mode}"', histogram)
+
+    return "\n".join(lines) + "\n"
+
+
+def start_http_endpoint(server, host, port):
+    """
+    Serve format_prometheus(server.get_stats()) over HTTP at /metrics
+
+    Args:
+        server: Server whose stats are exposed
+        host: Address to listen on
+        port: HTTP port
+
+    Returns:
+        ThreadingHTTPServer: Running endpoint (call shutdown() and
+                             server_close() to stop it)
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = format_prometheus(server.get_stats()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            server.logger.debug(f"Metrics request from {self.address_string()}: {format % args}")
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name='MetricsHTTP', daemon=True).start()
+    return httpd
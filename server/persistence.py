@@ -0,0 +1,179 @@
+"""
+Index persistence for Server
+Periodic compact snapshots plus an append-only log of index mutations
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from config import PERSIST_FLUSH_INTERVAL
+from utils import setup_logger
+
+
+class IndexStore:
+    """
+    Snapshot + write-ahead log storage for IndexManager
+
+    Every mutation is appended to the current log generation
+    (wal.<gen>.log, one JSON array per line). A snapshot records the
+    generation it was taken at; restoring loads the snapshot and replays
+    every log from that generation on. Replaying an op twice is harmless,
+    so a crash between writing a snapshot and deleting old logs is safe.
+
+    Log records:
+        ["C", hostname, port]      client registered
+        ["D", hostname]            client deregistered
+        ["+", fname, hostname]     provider added
+        ["-", fname, hostname]     provider removed
+        ["H", fname, size, piece_size, root]
+                                   content advertised (Merkle root hex)
+    """
+
+    SNAPSHOT_NAME = 'snapshot.json'
+
+    def __init__(self, directory, flush_interval=PERSIST_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.logger = setup_logger('IndexStore')
+
+        os.makedirs(directory, exist_ok=True)
+
+        # The current log always has the highest generation on disk
+        gens = self._log_gens()
+        self.gen = gens[-1] if gens else 0
+        self.log_file = None
+        self.io_lock = threading.Lock()
+        self.running = False
+
+    def _log_path(self, gen):
+        """Path of the log file for a generation"""
+        return os.path.join(self.directory, f"wal.{gen}.log")
+
+    def _log_gens(self):
+        """Sorted generations of the log files on disk"""
+        gens = []
+        for path in glob.glob(os.path.join(self.directory, 'wal.*.log')):
+            try:
+                gens.append(int(os.path.basename(path).split('.')[1]))
+            except ValueError:
+                continue
+        return sorted(gens)
+
+    def load(self):
+        """
+        Read the persisted state
+
+        Returns:
+            tuple: (snapshot dict or None, list of log records to replay)
+        """
+        snapshot = None
+        path = os.path.join(self.directory, self.SNAPSHOT_NAME)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+
+        start_gen = snapshot['gen'] if snapshot else 0
+        self.gen = max(self.gen, start_gen)
+        records = []
+        for gen in self._log_gens():
+            if gen < start_gen:
+                continue
+            with open(self._log_path(gen), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Torn last line from a crash mid-write
+                        self.logger.warning(f"Skipping corrupt log record in generation {gen}")
+        return snapshot, records
+
+    def open(self):
+        """Start a fresh log generation and the background flusher"""
+        with self.io_lock:
+            self.gen += 1
+            self.log_file = open(self._log_path(self.gen), 'a', encoding='utf-8')
+
+        self.running = True
+        threading.Thread(target=self._flush_worker, daemon=True).start()
+
+    def close(self):
+        """Flush and close the current log"""
+        self.running = False
+        with self.io_lock:
+            if self.log_file:
+                self.log_file.close()
+                self.log_file = None
+
+    def append(self, record):
+        """
+        Append one mutation record (buffered; flushed in the background)
+
+        Args:
+            record: List as described in the class docstring
+        """
+        with self.io_lock:
+            if self.log_file:
+                self.log_file.write(json.dumps(record, ensure_ascii=False))
+                self.log_file.write('\n')
+
+    def rotate(self):
+        """
+        Switch to a new log generation
+
+        Must be called while index mutations are blocked, together with
+        capturing the state that the next snapshot will contain.
+
+        Returns:
+            int: Generation the snapshot should record
+        """
+        with self.io_lock:
+            if self.log_file:
+                self.log_file.close()
+            self.gen += 1
+            self.log_file = open(self._log_path(self.gen), 'a', encoding='utf-8')
+            return self.gen
+
+    def write_snapshot(self, gen, clients, files):
+        """
+        Atomically write a snapshot and drop the logs it covers
+
+        Args:
+            gen: Generation returned by rotate()
+            clients: Dict of {hostname: port}
+            files: List of [filename, [hostnames]] or
+                   [filename, [hostnames], [size, piece size, root]]
+        """
+        path = os.path.join(self.directory, self.SNAPSHOT_NAME)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'gen': gen, 'clients': clients, 'files': files},
+                               ensure_ascii=False, separators=(',', ':')))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        for old_gen in self._log_gens():
+            if old_gen < gen:
+                try:
+                    os.remove(self._log_path(old_gen))
+                except OSError:
+                    pass
+
+        self.logger.info(f"Snapshot written: {len(clients)} client(s), {len(files)} file(s)")
+
+    def flush(self):
+        """Flush buffered log records to the OS"""
+        with self.io_lock:
+            if self.log_file:
+                self.log_file.flush()
+
+    def _flush_worker(self):
+        """Background group commit of buffered log records"""
+        while self.running:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"Log flush error: {e}")
@@ -0,0 +1,118 @@
+"""
+Admission control for Server
+Per-client token buckets for control messages
+"""
+
+import time
+import threading
+from protocol import MessageType
+from config import RATE_LIMITS, RATE_LIMIT_DEFAULT
+
+# Replication streams and disconnects are never throttled
+UNLIMITED = frozenset({MessageType.REPLICA_HELLO, MessageType.MUTATIONS, MessageType.BYE})
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second up to `burst`"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now):
+        """
+        Take one token
+
+        Args:
+            now: Current monotonic time
+
+        Returns:
+            float: 0.0 if a token was taken, else seconds until one is available
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full(self, now):
+        """True once the bucket has refilled completely (safe to forget)"""
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """
+    Per-client, per-message-type request limits
+
+    Each (client, message type) pair gets its own bucket, so a client
+    looping on DISCOVER is throttled without slowing down its own FETCHes
+    or anybody else. The variants of a request (DISCOVER_PAGE,
+    UPDATE_DELTA, ...) need their own entries: a type without one falls
+    back to `default`. Clients are keyed by registered hostname (by IP
+    address before HELLO), which survives reconnects.
+    """
+
+    def __init__(self, limits=RATE_LIMITS, default=RATE_LIMIT_DEFAULT):
+        """
+        Args:
+            limits: {message type: (rate per second, burst) or None for unlimited}
+            default: Limit of message types not in `limits` (None = unlimited)
+        """
+        self.limits = dict(limits)
+        self.default = default
+        self.enabled = default is not None or any(self.limits.values())
+
+        # {(client, message type): TokenBucket}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def check(self, client, msg_type, now=None):
+        """
+        Admit or reject one request
+
+        Args:
+            client: Client key (hostname or address)
+            msg_type: Message type
+            now: Current monotonic time (default: time.monotonic())
+
+        Returns:
+            float: 0.0 if admitted, else seconds the client should wait
+        """
+        if msg_type in UNLIMITED:
+            return 0.0
+        limit = self.limits.get(msg_type, self.default)
+        if not limit:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+
+        key = (client, msg_type)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                rate, burst = limit
+                bucket = self.buckets[key] = TokenBucket(rate, burst, now)
+            return bucket.take(now)
+
+    def prune(self, now=None):
+        """
+        Forget buckets that have refilled, bounding memory by active clients
+
+        Args:
+            now: Current monotonic time (default: time.monotonic())
+
+        Returns:
+            int: Number of buckets removed
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            idle = [key for key, bucket in self.buckets.items() if bucket.full(now)]
+            for key in idle:
+                del self.buckets[key]
+        return len(idle)
@@ -0,0 +1,239 @@
+"""
+Index replication for Server
+Streams locally originated index mutations to peer replicas
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+from protocol import Protocol, MessageType, MessageStream
+from config import (
+    REPLICA_BATCH, REPLICA_QUEUE_LIMIT, REPLICA_HEARTBEAT_INTERVAL,
+    REPLICA_TIMEOUT, REPLICA_RETRY_INTERVAL
+)
+from utils import setup_logger
+
+
+class _PeerLink:
+    """
+    Outgoing mutation stream to one peer replica
+
+    On every (re)connect the stream identifies itself (REPLICA_HELLO) and
+    then starts with records rebuilding this replica's own clients,
+    followed by live mutations. A peer that falls
+    more than REPLICA_QUEUE_LIMIT records behind is disconnected and
+    resynchronized from a fresh snapshot instead of buffering forever.
+    """
+
+    def __init__(self, replicator, address):
+        self.replicator = replicator
+        self.address = address
+        self.pending = deque()
+        self.ready = threading.Event()
+        self.overflow = False
+        self.connected = False
+        self.thread = None
+
+    def start(self):
+        """Start the sender thread"""
+        self.thread = threading.Thread(target=self.run, name=f"Replica-{self.address}", daemon=True)
+        self.thread.start()
+
+    def on_record(self, record):
+        """Queue a mutation record (called under the index write lock)"""
+        if len(self.pending) >= REPLICA_QUEUE_LIMIT:
+            self.overflow = True
+        else:
+            self.pending.append(record)
+        self.ready.set()
+
+    def run(self):
+        """Connect, send the snapshot, then stream mutations until stopped"""
+        index_manager = self.replicator.index_manager
+        logger = self.replicator.logger
+
+        while self.replicator.running:
+            sock = None
+            registered = False
+            try:
+                host, port = Protocol.parse_hostname(self.address)
+                sock = socket.create_connection((host, port), timeout=REPLICA_TIMEOUT)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                stream = MessageStream(sock)
+                self._identify(stream)
+
+                self.pending.clear()
+                self.overflow = False
+                records = index_manager.add_replica_listener(self.on_record)
+                registered = True
+                self.connected = True
+                logger.info(f"Replicating to {self.address}: {len(records)} snapshot record(s)")
+                self._send(stream, records)
+
+                while self.replicator.running and not self.overflow:
+                    self.ready.wait(REPLICA_HEARTBEAT_INTERVAL)
+                    self.ready.clear()
+
+                    # An empty batch doubles as a heartbeat
+                    batch = []
+                    while self.pending and len(batch) < REPLICA_BATCH:
+                        batch.append(self.pending.popleft())
+                    self._send(stream, batch, heartbeat=True)
+                    if self.pending:
+                        self.ready.set()
+
+                if self.overflow:
+                    logger.warning(f"Replica {self.address} fell behind, resynchronizing")
+
+            except Exception as e:
+                if self.replicator.running:
+                    logger.warning(f"Replication to {self.address} failed: {e}")
+            finally:
+                self.connected = False
+                if registered:
+                    index_manager.remove_replica_listener(self.on_record)
+                if sock:
+                    try:
+                        sock.close()
+                    except:
+                        pass
+
+            if self.replicator.running:
+                time.sleep(REPLICA_RETRY_INTERVAL)
+
+    def _identify(self, stream):
+        """
+        Introduce this replica to the peer, which must accept it before
+        taking any MUTATIONS from the connection
+        """
+        stream.send(Protocol.build_message(MessageType.REPLICA_HELLO, self.replicator.replica_id))
+        response = stream.recv()
+        if response is None:
+            raise ConnectionError("connection closed")
+        msg_type, _ = Protocol.parse_message(response)
+        if msg_type != MessageType.OK:
+            raise ConnectionError(f"rejected as replica: {Protocol.as_text(response)}")
+
+    def _send(self, stream, records, heartbeat=False):
+        """Send records in REPLICA_BATCH sized MUTATIONS messages"""
+        origin = self.replicator.replica_id
+        if not records and heartbeat:
+            stream.send(Protocol.build_message(MessageType.MUTATIONS, origin, []))
+            return
+        for start in range(0, len(records), REPLICA_BATCH):
+            stream.send(Protocol.build_message(MessageType.MUTATIONS, origin,
+                                               records[start:start + REPLICA_BATCH]))
+
+
+class Replicator:
+    """
+    Mutation replication between index server replicas
+
+    Every replica streams the mutations it originates (clients that sent
+    HELLO to it, and their files) to every peer, forming a full mesh;
+    records applied from a peer are never forwarded again. A peer that
+    stays silent for REPLICA_TIMEOUT is presumed down and its clients are
+    adopted, so they either fail over here or expire normally.
+
+    Only configured peers may stream mutations here: a connection must
+    first send REPLICA_HELLO with a replica id listed in `peers` (ids are
+    the "host:port" addresses replicas list each other under), and come
+    from an address that host resolves to.
+    """
+
+    def __init__(self, index_manager, replica_id, peers=()):
+        self.index_manager = index_manager
+        self.replica_id = replica_id
+        self.logger = setup_logger('Replicator')
+        self.peers = [address for address in peers if address != replica_id]
+        self.links = [_PeerLink(self, address) for address in self.peers]
+        self.running = False
+
+        # Last time each peer's stream delivered anything: {origin: timestamp}
+        self.last_heard = {}
+        self.heard_lock = threading.Lock()
+
+    def start(self):
+        """Start streaming to every peer"""
+        self.running = True
+        for link in self.links:
+            link.start()
+        if self.links:
+            self.logger.info(f"Replica {self.replica_id} streaming to {len(self.links)} peer(s)")
+
+    def stop(self):
+        """Stop streaming"""
+        self.running = False
+        for link in self.links:
+            # Detach now, so deregistrations during shutdown are not
+            # streamed: peers should keep this replica's clients for failover
+            self.index_manager.remove_replica_listener(link.on_record)
+            link.ready.set()
+
+    def accept_peer(self, replica_id, remote_ip):
+        """
+        Check a replica connection's claimed identity
+
+        Args:
+            replica_id: Id sent in REPLICA_HELLO
+            remote_ip: IP address the connection came from
+
+        Returns:
+            bool: True if `replica_id` is a configured peer whose host
+                  resolves to `remote_ip`
+        """
+        if replica_id not in self.peers:
+            return False
+        try:
+            host, port = Protocol.parse_hostname(replica_id)
+            addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+        except (OSError, ValueError):
+            return False
+        return remote_ip in addresses
+
+    def on_mutations(self, origin, records):
+        """
+        Apply a batch received from a peer
+
+        Args:
+            origin: Id of the sending replica
+            records: Mutation records
+
+        Returns:
+            int: Number of records applied
+        """
+        with self.heard_lock:
+            self.last_heard[origin] = time.time()
+        if not records:
+            return 0
+        return self.index_manager.apply_replicated(origin, records)
+
+    def check_peers(self, now=None):
+        """
+        Adopt the clients of peers whose stream went silent
+
+        Args:
+            now: Current time (default: time.time())
+        """
+        if now is None:
+            now = time.time()
+
+        with self.heard_lock:
+            silent = [origin for origin, heard in self.last_heard.items()
+                      if now - heard > REPLICA_TIMEOUT]
+            for origin in silent:
+                del self.last_heard[origin]
+
+        for origin in silent:
+            adopted = self.index_manager.adopt_clients(origin)
+            self.logger.warning(f"Replica {origin} went silent, adopted {adopted} client(s)")
+
+    def peer_status(self):
+        """
+        Get the state of the outgoing streams
+
+        Returns:
+            dict: {peer address: True if connected}
+        """
+        return {link.address: link.connected for link in self.links}
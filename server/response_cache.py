@@ -0,0 +1,89 @@
+"""
+Response cache for Server
+Encoded DISCOVER responses reused until the index changes
+"""
+
+import threading
+from collections import OrderedDict
+from protocol import Protocol, EncodedFrame
+from config import DISCOVER_CACHE_ENTRIES
+
+
+class ResponseCache:
+    """
+    Framed responses keyed by request, valid for one index version
+
+    Every provider change bumps IndexManager.version, so an entry built at
+    an older version is stale: the first lookup after a change drops them
+    all. Entries are EncodedFrame bytes, so a hit is written to the socket
+    without re-encoding. Builds run under the cache lock, so a crowd of
+    clients asking right after a change waits for one build instead of
+    each walking the index.
+    """
+
+    def __init__(self, index_manager, max_entries=DISCOVER_CACHE_ENTRIES):
+        """
+        Args:
+            index_manager: IndexManager whose version validates entries
+            max_entries: Entries kept (least recently used evicted; 0 = no caching)
+        """
+        self.index_manager = index_manager
+        self.max_entries = max_entries
+
+        # {key: EncodedFrame} built at self.version, in LRU order
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """
+        Get the framed response for a request, building it on a miss
+
+        Args:
+            key: Request key (e.g. None for the full listing, a hostname
+                 for one client's files)
+            build: Callable returning the response message string
+
+        Returns:
+            EncodedFrame: Framed response
+        """
+        if not self.max_entries:
+            return EncodedFrame(Protocol.frame(build()))
+
+        with self.lock:
+            # Read the version before building: the response then reflects
+            # at least this version, and a change made meanwhile only causes
+            # one extra rebuild rather than a stale entry
+            version = self.index_manager.version
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+            frame = self.entries.get(key)
+            if frame is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return frame
+
+            self.misses += 1
+            frame = EncodedFrame(Protocol.frame(build()))
+            self.entries[key] = frame
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return frame
+
+    def stats(self):
+        """
+        Returns:
+            dict: hits, misses, cached entries and their total size in bytes
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'bytes': sum(len(frame) for frame in self.entries.values()),
+            }
@@ -0,0 +1,163 @@
+"""
+Filename search index for Server
+Case-insensitive prefix and substring matching over the indexed filenames
+"""
+
+import bisect
+from itertools import islice
+
+
+class SearchIndex:
+    """
+    Incrementally maintained filename search structure
+
+    Keys are (lowercased name, name) tuples kept in a sorted list, so a
+    prefix query is a bisect followed by a contiguous walk. Substring
+    queries use a trigram index: every key is listed under each 3-character
+    substring of its lowercased name, and only the keys under the query's
+    rarest trigram are checked. Queries shorter than a trigram are first
+    checked against the trigram vocabulary, so absent ones cost no scan.
+    Results always come back in key order.
+
+    Not thread-safe; IndexManager calls it under its own lock.
+    """
+
+    PREFIX = 'prefix'
+    SUBSTRING = 'substring'
+
+    def __init__(self):
+        self.keys = []
+        self.trigrams = {}
+        # Names too short to have a trigram
+        self.short_keys = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def _trigrams(text):
+        """Distinct 3-character substrings of a lowercased name"""
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, fname):
+        """
+        Index a filename
+
+        Args:
+            fname: Filename that was not indexed before
+        """
+        key = (fname.lower(), fname)
+        bisect.insort(self.keys, key)
+        if len(key[0]) < 3:
+            self.short_keys.add(key)
+        for gram in self._trigrams(key[0]):
+            postings = self.trigrams.get(gram)
+            if postings is None:
+                postings = self.trigrams[gram] = set()
+            postings.add(key)
+
+    def remove(self, fname):
+        """
+        Drop a filename from the index
+
+        Args:
+            fname: Indexed filename
+        """
+        key = (fname.lower(), fname)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+        self.short_keys.discard(key)
+        for gram in self._trigrams(key[0]):
+            postings = self.trigrams.get(gram)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self.trigrams[gram]
+
+    def rebuild(self, names):
+        """
+        Replace the index contents in one pass
+
+        Args:
+            names: Iterable of every filename to index
+        """
+        self.keys = sorted((fname.lower(), fname) for fname in names)
+        self.trigrams = {}
+        self.short_keys = {key for key in self.keys if len(key[0]) < 3}
+        trigrams = self.trigrams
+        for key in self.keys:
+            for gram in self._trigrams(key[0]):
+                postings = trigrams.get(gram)
+                if postings is None:
+                    postings = trigrams[gram] = set()
+                postings.add(key)
+
+    def search(self, query, mode=SUBSTRING, limit=100, offset=0):
+        """
+        Find filenames matching a query
+
+        Args:
+            query: Text to match (case-insensitive)
+            mode: PREFIX or SUBSTRING
+            limit: Maximum number of names to return
+            offset: Number of matches to skip
+
+        Returns:
+            tuple: (list of filenames, next offset or None when there are no more)
+        """
+        query = query.lower()
+        if mode == self.PREFIX or not query:
+            keys = self._search_prefix(query, limit, offset)
+        else:
+            keys = self._search_substring(query, limit, offset)
+
+        # One extra match is fetched to tell whether another page exists
+        next_offset = offset + limit if len(keys) > limit else None
+        return [fname for _, fname in keys[:limit]], next_offset
+
+    def _search_prefix(self, query, limit, offset):
+        """Matches of a prefix query, up to limit + 1 after offset"""
+        keys = self.keys
+        start = bisect.bisect_left(keys, (query,)) + offset
+        result = []
+        for i in range(start, min(start + limit + 1, len(keys))):
+            if not keys[i][0].startswith(query):
+                break
+            result.append(keys[i])
+        return result
+
+    def _search_substring(self, query, limit, offset):
+        """Matches of a substring query, up to limit + 1 after offset"""
+        wanted = offset + limit + 1
+
+        candidates = None
+        if len(query) >= 3:
+            for gram in self._trigrams(query):
+                postings = self.trigrams.get(gram)
+                if postings is None:
+                    return []
+                if candidates is None or len(postings) < len(candidates):
+                    candidates = postings
+        elif not any(query in gram for gram in self.trigrams):
+            # Only names shorter than a trigram can still match
+            matches = sorted(key for key in self.short_keys if query in key[0])
+            return matches[offset:wanted]
+
+        # A dense match set is usually found faster by walking the sorted keys
+        # and stopping early (about wanted * n / len(candidates) steps) than
+        # by filtering and sorting every candidate. Matches can be clustered
+        # late in key order, so the walk gives up after len(candidates) steps.
+        if candidates is None or wanted * len(self.keys) < len(candidates) ** 2:
+            budget = len(self.keys) if candidates is None else len(candidates)
+            result = []
+            for key in islice(self.keys, budget):
+                if query in key[0]:
+                    result.append(key)
+                    if len(result) == wanted:
+                        break
+            if len(result) == wanted or budget >= len(self.keys):
+                return result[offset:]
+
+        matches = sorted(key for key in candidates if query in key[0])
+        return matches[offset:wanted]
@@ -4,11 +4,24 @@ Centralized Index Server for Hybrid P2P File Sharing
 """
 
 import socket
+import select
 import threading
 import time
+import random
 from server.index_manager import IndexManager
-from protocol import Protocol, MessageType
-from config import SERVER_HOST, SERVER_PORT, BUFFER_SIZE, ENCODING
+from server.persistence import IndexStore
+from server.search_index import SearchIndex
+from server.replication import Replicator
+from server.subscriptions import Subscription
+from server.metrics import ServerMetrics, start_http_endpoint
+from server.rate_limit import RateLimiter
+from server.response_cache import ResponseCache
+from protocol import Protocol, MessageType, MessageStream, EncodedFrame
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_BACKLOG, MAX_DISCOVER_PAGE_SIZE, MAX_SEARCH_LIMIT, MAX_FETCH_MANY,
+    PERSIST_DIR, PERSIST_SNAPSHOT_INTERVAL, CLEANUP_MAX_SLEEP, REPLICA_PEERS,
+    SUBSCRIBE_COALESCE_DELAY, METRICS_PORT, SERVER_MAX_CONNECTIONS, BUSY_RETRY_AFTER, PROTOCOL_VERSION
+)
 from utils import setup_logger
 
 
@@ -19,17 +32,33 @@ class Server:
     Responsibilities:
     - Accept client connections
     - Maintain file index and client registry
-    - Handle client requests (HELLO, PUBLISH, UPDATE, FETCH, PING, DISCOVER)
+    - Handle client requests (HELLO, PUBLISH, UPDATE, FETCH, FETCH_MANY, INFO, PING, DISCOVER, SEARCH)
+    - Rank providers by liveness, reported load and failure reports
+    - Push index changes to SUBSCRIBE connections
     - Monitor client liveness
+    - Collect request metrics (STATS message, optional HTTP /metrics endpoint)
+    - Rate limit clients and cap concurrent connections (ERROR BUSY)
+    - Speak the text protocol and, with clients that offer it in HELLO, binary protocol v2
     """
     
-    def __init__(self, host=SERVER_HOST, port=SERVER_PORT):
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, persist_dir=PERSIST_DIR,
+                 shard_index=0, shard_addresses=None, replica_id=None, replica_peers=REPLICA_PEERS,
+                 metrics_port=METRICS_PORT, max_connections=SERVER_MAX_CONNECTIONS):
         self.host = host
         self.port = port
-        self.logger = setup_logger('Server')
+        self.logger = setup_logger('Server' if not shard_addresses else f'Server-{shard_index}')
         
-        # Index manager
-        self.index_manager = IndexManager()
+        # Sharded deployment: this server owns the filenames whose
+        # Protocol.shard_of() equals shard_index; clients route by filename
+        self.shard_index = shard_index
+        self.shard_addresses = list(shard_addresses or [])
+        
+        # Index manager (optionally persisted to disk)
+        store = IndexStore(persist_dir) if persist_dir else None
+        self.index_manager = IndexManager(store=store)
+        
+        # Replication: mutations stream to (and arrive from) peer replicas
+        self.replicator = Replicator(self.index_manager, replica_id or f"{host}:{port}", replica_peers)
         
         # Server socket
         self.server_socket = None
@@ -39,16 +68,31 @@ class Server:
         self.client_connections = {}
         self.connections_lock = threading.Lock()
         
+        # Subscribed connections: {socket: Subscription}
+        self.subscriptions = {}
+        
+        # Connections accepted as peer replicas (REPLICA_HELLO): {socket: replica id}
+        self.replica_connections = {}
+        
+        # Encoded DISCOVER responses, valid until the index version changes
+        self.discover_cache = ResponseCache(self.index_manager)
+        
+        # Request counters, latency histograms and index lock waits;
+        # served over HTTP in Prometheus format when metrics_port is set
+        self.metrics = ServerMetrics()
+        self.index_manager.lock.wait_observer = self.metrics.observe_lock_wait
+        self.metrics_port = metrics_port
+        self.metrics_http = None
+        
+        # Admission control: per-client token buckets, and a cap on open
+        # connections so a reconnect storm is turned away cheaply
+        self.rate_limiter = RateLimiter()
+        self.connection_slots = threading.Semaphore(max_connections) if max_connections else None
+        
     def start(self):
         """Start the server"""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
-            
-            self.running = True
-            self.logger.info(f"Server started on {self.host}:{self.port}")
+            self._open_listener()
             
             # Start cleanup thread
             cleanup_thread = threading.Thread(target=self._cleanup_worker, daemon=True)
@@ -58,7 +102,9 @@ class Server:
             while self.running:
                 try:
                     client_socket, client_address = self.server_socket.accept()
-                    self.logger.info(f"New connection from {client_address}")
+                    if not self._admit_connection(client_socket, client_address):
+                        continue
+                    self.logger.info("New connection from %s", client_address)
                     
                     # Handle client in a new thread
                     client_thread = threading.Thread(
@@ -77,10 +123,41 @@ class Server:
         finally:
             self.stop()
     
+    def _open_listener(self):
+        """Restore the persisted index, then create, bind and listen on the server socket"""
+        if self.index_manager.store:
+            clients, files = self.index_manager.restore()
+            self.logger.info(f"Restored {clients} client(s) and {files} file(s) from disk")
+            threading.Thread(target=self._snapshot_worker, daemon=True).start()
+        
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(SERVER_BACKLOG)
+        
+        self.running = True
+        self.replicator.start()
+        self.logger.info(f"Server started on {self.host}:{self.port}")
+        
+        if self.metrics_port:
+            self.metrics_http = start_http_endpoint(self, self.host, self.metrics_port)
+            self.logger.info(f"Metrics endpoint on http://{self.host}:{self.metrics_port}/metrics")
+    
     def stop(self):
         """Stop the server"""
         self.running = False
         
+        # Persist and stop replicating before connections close, so the
+        # departing clients' deregistrations neither empty the saved index
+        # nor reach the peers (the clients are expected to fail over)
+        self.replicator.stop()
+        self._close_store()
+        
+        metrics_http, self.metrics_http = self.metrics_http, None
+        if metrics_http:
+            metrics_http.shutdown()
+            metrics_http.server_close()
+        
         # Close all client connections
         with self.connections_lock:
             for hostname, sock in list(self.client_connections.items()):
@@ -107,102 +184,258 @@ class Server:
             client_socket: Client socket
             client_address: Client address tuple
         """
-        self.logger.info(f"🔗 New connection from {client_address}")
+        self.logger.info("🔗 New connection from %s", client_address)
         hostname = None
+        stream = MessageStream(client_socket)
         
         try:
             while self.running:
-                # Receive message (blocking)
+                # Receive one framed message (blocking)
                 try:
-                    data = client_socket.recv(BUFFER_SIZE)
+                    message = stream.recv()
                     
-                    if not data:
+                    if message is None:
                         # Client closed connection gracefully
-                        self.logger.info(f"Client closed connection: {client_address}")
+                        self.logger.info("Client closed connection: %s", client_address)
                         break
                         
-                    message = data.decode(ENCODING).strip()
-                    self.logger.debug(f"Received from {client_address}: {message}")
+                    if isinstance(message, str):
+                        message = message.strip()
+                    self.logger.debug("Received from %s: %s", client_address, message)
                     
                 except Exception as e:
                     # Socket error - client disconnected
-                    self.logger.info(f"Client connection error: {e}")
+                    self.logger.info("Client connection error: %s", e)
                     break
                 
-                # Parse message
-                msg_type, msg_data = Protocol.parse_message(message)
-                
-                if not msg_type:
-                    self._send_error(client_socket, "INVALID", "Invalid message format")
-                    continue
-                
-                # Handle different message types
-                if msg_type == MessageType.HELLO:
-                    response = self._handle_hello(msg_data, client_socket)
-                    # Use full hostname with port for tracking
-                    hostname = f"{msg_data['hostname']}:{msg_data['port']}"
-                    self.logger.info(f"✓ Hostname registered: {hostname}")
-                
-                elif msg_type == MessageType.PUBLISH:
-                    response = self._handle_publish(msg_data)
-                
-                elif msg_type == MessageType.UPDATE:
-                    response = self._handle_update(msg_data)
-                
-                elif msg_type == MessageType.FETCH:
-                    response = self._handle_fetch(msg_data)
+                msg_type, response, registered = self._handle_message(
+                    message, client_socket, hostname or client_address[0]
+                )
+                if registered:
+                    hostname = registered
                 
-                elif msg_type == MessageType.PING:
-                    response = self._handle_ping(msg_data)
-                
-                elif msg_type == MessageType.DISCOVER:
-                    response = self._handle_discover(msg_data)
-                
-                elif msg_type == MessageType.BYE:
+                if msg_type == MessageType.BYE:
                     # Client is disconnecting gracefully
-                    self.logger.info(f"Client {hostname} sent BYE")
+                    self.logger.info("Client %s sent BYE", hostname)
                     break
                 
-                else:
-                    response = Protocol.build_message(MessageType.ERROR, "UNKNOWN", "Unknown command")
-                
                 # Send response
                 if response:
                     self._send_message(client_socket, response)
+                
+                if msg_type == MessageType.SUBSCRIBE and client_socket in self.subscriptions:
+                    # The connection now only carries pushed events
+                    self._push_events(client_socket)
+                    break
         
         except Exception as e:
             self.logger.error(f"Error handling client {client_address}: {e}")
         
         finally:
-            # Clean up
-            if hostname:
-                with self.connections_lock:
-                    if hostname in self.client_connections:
-                        del self.client_connections[hostname]
-                
-                # Deregister client from index (they need to re-HELLO if reconnecting)
-                result = self.index_manager.deregister_client(hostname)
-                if result:
-                    self.logger.info(f"✓ Client deregistered successfully: {hostname}")
-                else:
-                    self.logger.warning(f"⚠️ Failed to deregister client (not found): {hostname}")
-            else:
-                self.logger.warning(f"⚠️ Connection closed but hostname was None: {client_address}")
+            self._close_subscription(client_socket)
+            self._close_replica(client_socket)
+            self._handle_disconnect(hostname, client_address)
+            self._release_connection()
             
             try:
                 client_socket.close()
             except:
                 pass
             
-            self.logger.info(f"Connection closed: {client_address}")
+            self.logger.info("Connection closed: %s", client_address)
     
-    def _handle_hello(self, data, client_socket):
+    def _admit_connection(self, client_socket, client_address):
+        """
+        Take a connection slot, or turn the connection away
+        
+        Over the cap the client is sent ERROR BUSY with a jittered
+        retry-after hint (so rejected clients do not all return at once)
+        and the socket is closed without spawning a handler.
+        
+        Args:
+            client_socket: Accepted socket
+            client_address: Client address tuple
+            
+        Returns:
+            bool: True if the connection may be served
+        """
+        if self.connection_slots is None or self.connection_slots.acquire(blocking=False):
+            self.metrics.connection_opened()
+            return True
+        
+        self.metrics.observe_rejection('connections')
+        self.logger.debug("Connection limit reached, rejecting %s", client_address)
+        retry_after = BUSY_RETRY_AFTER * random.uniform(0.5, 1.5)
+        busy_msg = Protocol.build_message(MessageType.ERROR, "BUSY", "Too many connections", retry_after)
+        try:
+            client_socket.setblocking(False)
+            client_socket.send(Protocol.frame(busy_msg))
+        except OSError:
+            pass
+        try:
+            client_socket.close()
+        except:
+            pass
+        return False
+    
+    def _release_connection(self):
+        """Give back the slot of a closed connection"""
+        self.metrics.connection_closed()
+        if self.connection_slots is not None:
+            self.connection_slots.release()
+    
+    def _handle_message(self, message, client_socket, client_key=None):
+        """
+        Parse and dispatch a single control message, recording its metrics
+        
+        Shared by the threaded and event-loop serving modes. Requests over
+        the client's rate limit are answered with ERROR BUSY before they are
+        parsed or touch the index.
+        
+        Args:
+            message: Decoded message string, or a binary (v2) payload;
+                     the response is built in the same codec
+            client_socket: Socket the message arrived on
+            client_key: Rate limiting key of the sender (hostname, or address
+                        before HELLO; None = not limited)
+            
+        Returns:
+            tuple: (msg_type, response, hostname) - hostname is set only when
+                   the message registered the connection (HELLO)
+        """
+        start = time.perf_counter()
+        if client_key and self.rate_limiter.enabled:
+            # Only the type is read (first token or binary header); the body is not parsed yet
+            msg_type = Protocol.message_type(message)
+            retry_after = self.rate_limiter.check(client_key, msg_type)
+            if retry_after:
+                self.metrics.observe_rejection('rate')
+                codec = Protocol.codec_of(message)
+                response = codec.build_message(MessageType.ERROR, "BUSY", f"Rate limit exceeded for {msg_type}",
+                                               retry_after)
+                self.metrics.observe_request(msg_type, time.perf_counter() - start, True)
+                return msg_type, response, None
+        
+        msg_type, response, hostname = self._dispatch_message(message, client_socket)
+        self.metrics.observe_request(msg_type, time.perf_counter() - start, Protocol.is_error(response))
+        return msg_type, response, hostname
+    
+    def _dispatch_message(self, message, client_socket):
+        """
+        Parse a control message and run its handler
+        
+        Args:
+            message: Decoded message string or binary payload
+            client_socket: Socket the message arrived on
+            
+        Returns:
+            tuple: (msg_type, response, hostname) as for _handle_message
+        """
+        # Parse message; the response uses the request's codec
+        codec = Protocol.codec_of(message)
+        msg_type, msg_data = codec.parse_message(message)
+        
+        if not msg_type:
+            return None, codec.build_message(MessageType.ERROR, "INVALID", "Invalid message format"), None
+        
+        hostname = None
+        
+        # Handle different message types
+        if msg_type == MessageType.HELLO:
+            response = self._handle_hello(msg_data, client_socket, codec)
+            # Use full hostname with port for tracking
+            hostname = f"{msg_data['hostname']}:{msg_data['port']}"
+            self.logger.info("✓ Hostname registered: %s", hostname)
+        
+        elif msg_type == MessageType.PUBLISH:
+            response = self._handle_publish(msg_data, codec)
+        
+        elif msg_type == MessageType.UPDATE:
+            response = self._handle_update(msg_data, codec)
+        
+        elif msg_type == MessageType.UPDATE_DELTA:
+            response = self._handle_update_delta(msg_data, codec)
+        
+        elif msg_type == MessageType.FETCH:
+            response = self._handle_fetch(msg_data, codec)
+        
+        elif msg_type == MessageType.FETCH_MANY:
+            response = self._handle_fetch_many(msg_data, codec)
+        
+        elif msg_type == MessageType.INFO:
+            response = self._handle_info(msg_data, codec)
+        
+        elif msg_type == MessageType.PING:
+            response = self._handle_ping(msg_data, codec)
+        
+        elif msg_type == MessageType.REPORT_FAILURE:
+            response = self._handle_report_failure(msg_data, codec)
+        
+        elif msg_type == MessageType.DISCOVER:
+            response = self._handle_discover(msg_data, codec)
+        
+        elif msg_type == MessageType.DISCOVER_PAGE:
+            response = self._handle_discover_page(msg_data, codec)
+        
+        elif msg_type == MessageType.SEARCH:
+            response = self._handle_search(msg_data, codec)
+        
+        elif msg_type == MessageType.DISCOVER_DELTA:
+            response = self._handle_discover_delta(msg_data, codec)
+        
+        elif msg_type == MessageType.SHARDS:
+            response = codec.build_message(MessageType.SHARD_MAP, self.shard_index, self.shard_addresses)
+        
+        elif msg_type == MessageType.REPLICA_HELLO:
+            response = self._handle_replica_hello(msg_data, client_socket, codec)
+        
+        elif msg_type == MessageType.MUTATIONS:
+            response = self._handle_mutations(msg_data, client_socket, codec)
+        
+        elif msg_type == MessageType.SUBSCRIBE:
+            response = self._handle_subscribe(msg_data, client_socket, codec)
+        
+        elif msg_type == MessageType.STATS:
+            response = codec.build_message(MessageType.METRICS, self.get_stats())
+        
+        elif msg_type == MessageType.BYE:
+            response = None
+        
+        else:
+            response = codec.build_message(MessageType.ERROR, "UNKNOWN", "Unknown command")
+        
+        return msg_type, response, hostname
+    
+    def _handle_disconnect(self, hostname, client_address):
+        """
+        Clean up after a control connection closes
+        
+        Args:
+            hostname: Registered hostname of the connection (None if never registered)
+            client_address: Client address tuple
+        """
+        if hostname:
+            with self.connections_lock:
+                if hostname in self.client_connections:
+                    del self.client_connections[hostname]
+            
+            # Deregister client from index (they need to re-HELLO if reconnecting)
+            result = self.index_manager.deregister_client(hostname)
+            if result:
+                self.logger.info("✓ Client deregistered successfully: %s", hostname)
+            else:
+                self.logger.warning(f"⚠️ Failed to deregister client (not found): {hostname}")
+        else:
+            self.logger.warning(f"⚠️ Connection closed but hostname was None: {client_address}")
+    
+    def _handle_hello(self, data, client_socket, codec=Protocol):
         """
         Handle HELLO message - client registration
         
         Args:
             data: Parsed message data
             client_socket: Client socket
+            codec: Codec of the request (Protocol or BinaryProtocol)
             
         Returns:
             str: Response message
@@ -220,15 +453,72 @@ class Server:
         with self.connections_lock:
             self.client_connections[full_hostname] = client_socket
         
-        self.logger.info(f"Client registered: {full_hostname}")
-        return Protocol.build_message(MessageType.OK, "registered")
+        self.logger.info("Client registered: %s", full_hostname)
+        
+        # Agree on the highest protocol version both sides speak
+        version = min(data.get('version') or 1, PROTOCOL_VERSION)
+        if version > 1:
+            return codec.build_message(MessageType.OK, f"registered {version}")
+        return codec.build_message(MessageType.OK, "registered")
+    
+    def _handle_replica_hello(self, data, client_socket, codec=Protocol):
+        """
+        Handle REPLICA_HELLO message - a peer replica opening its mutation stream
+        
+        Args:
+            data: Parsed message data
+            client_socket: Client socket
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: Response message
+        """
+        replica_id = data['replica_id']
+        try:
+            remote_ip = client_socket.getpeername()[0]
+        except OSError:
+            remote_ip = None
+        
+        if not self.replicator.accept_peer(replica_id, remote_ip):
+            self.logger.warning(f"Rejected replica {replica_id} from {remote_ip}: not a configured peer")
+            return codec.build_message(MessageType.ERROR, "INVALID", "Not a replica peer")
+        
+        with self.connections_lock:
+            self.replica_connections[client_socket] = replica_id
+        self.logger.info("Replica connected: %s", replica_id)
+        return codec.build_message(MessageType.OK, "replica")
     
-    def _handle_publish(self, data):
+    def _handle_mutations(self, data, client_socket, codec=Protocol):
+        """
+        Handle MUTATIONS message - one-way replication stream from a peer replica
+        
+        Only accepted on a connection that identified as that replica.
+        
+        Args:
+            data: Parsed message data
+            client_socket: Client socket
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: None (no response), or an error response
+        """
+        with self.connections_lock:
+            replica_id = self.replica_connections.get(client_socket)
+        
+        if replica_id is None or replica_id != data['origin']:
+            self.logger.warning(f"Rejected MUTATIONS from {data['origin']}: not a replica connection")
+            return codec.build_message(MessageType.ERROR, "INVALID", "Not a replica connection")
+        
+        self.replicator.on_mutations(replica_id, data['records'])
+        return None
+    
+    def _handle_publish(self, data, codec=Protocol):
         """
         Handle PUBLISH message - register file
         
         Args:
             data: Parsed message data
+            codec: Codec of the request (Protocol or BinaryProtocol)
             
         Returns:
             str: Response message
@@ -236,21 +526,29 @@ class Server:
         fname = data['fname']
         hostname = data['hostname']
         
-        # Register file in index
-        success = self.index_manager.register_file(fname, hostname)
+        wrong_shard = self._check_shard(fname, codec)
+        if wrong_shard:
+            return wrong_shard
+        
+        # Register file in index, with the content hashes if advertised
+        content = None
+        if data.get('root'):
+            content = (data['size'], data['piece_size'], data['root'])
+        success = self.index_manager.register_file(fname, hostname, content)
         
         if success:
-            self.logger.info(f"File published: {fname} by {hostname}")
-            return Protocol.build_message(MessageType.OK, "published")
+            self.logger.info("File published: %s by %s", fname, hostname)
+            return codec.build_message(MessageType.OK, "published")
         else:
-            return Protocol.build_message(MessageType.ERROR, "PUBLISH_FAILED", "Failed to publish file")
+            return codec.build_message(MessageType.ERROR, "PUBLISH_FAILED", "Failed to publish file")
     
-    def _handle_update(self, data):
+    def _handle_update(self, data, codec=Protocol):
         """
         Handle UPDATE message - sync file list
         
         Args:
             data: Parsed message data
+            codec: Codec of the request (Protocol or BinaryProtocol)
             
         Returns:
             str: Response message
@@ -262,35 +560,132 @@ class Server:
         success = self.index_manager.sync_client_files(hostname, files)
         
         if success:
-            self.logger.info(f"File list updated for {hostname}: {len(files)} file(s)")
-            return Protocol.build_message(MessageType.OK, "synchronized")
+            self.logger.info("File list updated for %s: %d file(s)", hostname, len(files))
+            return codec.build_message(MessageType.OK, "synchronized")
         else:
-            return Protocol.build_message(MessageType.ERROR, "UPDATE_FAILED", "Client not registered")
+            return codec.build_message(MessageType.ERROR, "UPDATE_FAILED", "Client not registered")
     
-    def _handle_fetch(self, data):
+    def _handle_update_delta(self, data, codec=Protocol):
+        """
+        Handle UPDATE_DELTA message - incremental file list change
+        
+        Args:
+            data: Parsed message data
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: Response message (ERROR RESYNC asks for a full UPDATE)
+        """
+        if not data:
+            return codec.build_message(MessageType.ERROR, "INVALID", "Invalid delta")
+        
+        success = self.index_manager.apply_file_delta(
+            data['hostname'], data['seq'], data['added'], data['removed'])
+        
+        if success:
+            return codec.build_message(MessageType.OK, "synchronized")
+        else:
+            return codec.build_message(MessageType.ERROR, "RESYNC", "Full UPDATE required")
+    
+    def _handle_fetch(self, data, codec=Protocol):
         """
         Handle FETCH message - lookup file providers
         
         Args:
             data: Parsed message data
+            codec: Codec of the request (Protocol or BinaryProtocol)
             
         Returns:
             str: Response message with provider list
         """
         fname = data['fname']
         
+        wrong_shard = self._check_shard(fname, codec)
+        if wrong_shard:
+            return wrong_shard
+        
         # Lookup providers
         providers = self.index_manager.lookup_providers(fname)
         
-        self.logger.info(f"Fetch request for {fname}: {len(providers)} provider(s)")
-        return Protocol.build_message(MessageType.RESULT, providers)
+        self.logger.debug("Fetch request for %s: %d provider(s)", fname, len(providers))
+        return codec.build_message(MessageType.RESULT, providers)
+    
+    def _handle_info(self, data, codec=Protocol):
+        """
+        Handle INFO message - advertised content (size, Merkle root) of a file
+        
+        Args:
+            data: Parsed message data
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: FILE_INFO response, or ERROR NOT_FOUND if no publisher
+                 advertised the file's hashes
+        """
+        fname = data['fname']
+        
+        wrong_shard = self._check_shard(fname, codec)
+        if wrong_shard:
+            return wrong_shard
+        
+        content = self.index_manager.get_file_hash(fname)
+        if content is None:
+            return codec.build_message(MessageType.ERROR, "NOT_FOUND", "No content hashes for file")
+        return codec.build_message(MessageType.FILE_INFO, fname, *content)
+    
+    def _handle_fetch_many(self, data, codec=Protocol):
+        """
+        Handle FETCH_MANY message - lookup the providers of many files
+        
+        Args:
+            data: Parsed message data (fnames)
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: RESULTS response with one provider list per filename
+        """
+        fnames = data.get('fnames') if data else None
+        if not fnames:
+            return codec.build_message(MessageType.ERROR, "INVALID", "No filenames")
+        
+        if len(fnames) > MAX_FETCH_MANY:
+            return codec.build_message(MessageType.ERROR, "INVALID", f"At most {MAX_FETCH_MANY} filenames")
+        
+        for fname in fnames:
+            wrong_shard = self._check_shard(fname, codec)
+            if wrong_shard:
+                return wrong_shard
+        
+        providers = self.index_manager.lookup_many(fnames)
+        
+        found = sum(1 for hostnames in providers.values() if hostnames)
+        self.logger.debug("Fetch request for %d file(s): %d available", len(fnames), found)
+        return codec.build_message(MessageType.RESULTS, providers)
+    
+    def _check_shard(self, fname, codec=Protocol):
+        """
+        Reject a filename that belongs to another shard
+        
+        Args:
+            fname: Filename of the request
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: ERROR response, or None if this server owns the filename
+        """
+        if len(self.shard_addresses) > 1:
+            owner = Protocol.shard_of(fname, len(self.shard_addresses))
+            if owner != self.shard_index:
+                return codec.build_message(MessageType.ERROR, "WRONG_SHARD", self.shard_addresses[owner])
+        return None
     
-    def _handle_ping(self, data):
+    def _handle_ping(self, data, codec=Protocol):
         """
         Handle PING message - liveness check
         
         Args:
             data: Parsed message data
+            codec: Codec of the request (Protocol or BinaryProtocol)
             
         Returns:
             str: Response message
@@ -298,41 +693,238 @@ class Server:
         hostname = data.get('hostname')
         
         if hostname:
-            # Update client's last seen
-            self.index_manager.update_client_liveness(hostname)
-            self.logger.debug(f"Ping from {hostname}")
+            # Update client's last seen and the upload load it reports
+            self.index_manager.update_client_liveness(hostname, data.get('uploads'), data.get('upload_rate'))
+            self.logger.debug("Ping from %s", hostname)
         
-        return Protocol.build_message(MessageType.ALIVE)
+        return codec.build_message(MessageType.ALIVE)
     
-    def _handle_discover(self, data):
+    def _handle_report_failure(self, data, codec=Protocol):
+        """
+        Handle REPORT_FAILURE message - a peer could not download from a provider
+        
+        Args:
+            data: Parsed message data (hostname of the failing provider)
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: Response message
+        """
+        if not data:
+            return codec.build_message(MessageType.ERROR, "INVALID", "Missing hostname")
+        
+        if self.index_manager.report_failure(data['hostname']):
+            return codec.build_message(MessageType.OK, "reported")
+        return codec.build_message(MessageType.ERROR, "NOT_FOUND", "Unknown client")
+    
+    def _handle_discover(self, data, codec=Protocol):
         """
         Handle DISCOVER message - get file list
         
         Args:
             data: Parsed message data
+            codec: Codec of the request (Protocol or BinaryProtocol)
             
+        Responses are served from discover_cache until the index changes,
+        so repeated DISCOVERs skip the index walk and the encoding.
+        
         Returns:
-            str: Response message with file list
+            EncodedFrame: Framed response with file list
         """
         hostname = data.get('hostname')
         
         if hostname:
             # Get files for specific client
-            files = self.index_manager.get_all_files(hostname)
-            file_list = ' '.join(files) if files else ''
-            self.logger.info(f"Discover request from {hostname}: {len(files)} file(s)")
-            return f"RESULT {file_list}".strip()
+            self.logger.debug("Discover request from %s", hostname)
+            return self.discover_cache.get((codec.VERSION, hostname),
+                                           lambda: self._build_client_listing(hostname, codec))
         else:
             # Get all files in the system
-            all_files = self.index_manager.get_all_files()
-            result_lines = []
-            for fname, providers in all_files.items():
-                result_lines.append(f"{fname}: {', '.join(providers)}")
+            return self.discover_cache.get((codec.VERSION, None), lambda: self._build_listing(codec))
+    
+    def _build_client_listing(self, hostname, codec=Protocol):
+        """Build the DISCOVER response listing one client's files"""
+        files = self.index_manager.get_all_files(hostname)
+        self.logger.info(f"Discover listing for {hostname}: {len(files)} file(s)")
+        return codec.build_message(MessageType.RESULT, files)
+    
+    def _build_listing(self, codec=Protocol):
+        """
+        Build the DISCOVER response listing every file and its providers
+        
+        Binary clients get a PAGE without a next cursor (the whole listing
+        is the last page); text clients get the original RESULT lines.
+        """
+        all_files = self.index_manager.get_all_files()
+        if codec is not Protocol:
+            return codec.build_message(MessageType.PAGE, None, all_files.items())
+        result_lines = Protocol.format_file_entries(all_files.items())
+        
+        if result_lines:
+            return "RESULT\n" + "\n".join(result_lines)
+        else:
+            return "RESULT"
+    
+    def _handle_discover_page(self, data, codec=Protocol):
+        """
+        Handle DISCOVER_PAGE message - one page of the file list
+        
+        Args:
+            data: Parsed message data (limit, cursor)
+            codec: Codec of the request (Protocol or BinaryProtocol)
             
-            if result_lines:
-                return "RESULT\n" + "\n".join(result_lines)
-            else:
-                return "RESULT"
+        Returns:
+            str: PAGE response with the next cursor and the page entries
+        """
+        if not data:
+            return codec.build_message(MessageType.ERROR, "INVALID", "Missing page size")
+        
+        limit = max(1, min(data['limit'], MAX_DISCOVER_PAGE_SIZE))
+        page, next_cursor = self.index_manager.get_files_page(data['cursor'], limit)
+        
+        self.logger.debug("Discover page: %d file(s)", len(page))
+        return codec.build_message(MessageType.PAGE, next_cursor, page)
+    
+    def _handle_search(self, data, codec=Protocol):
+        """
+        Handle SEARCH message - filenames matching a prefix or substring
+        
+        Args:
+            data: Parsed message data (mode, limit, offset, query)
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: MATCHES response with the next offset and the matching entries
+        """
+        if not data:
+            return codec.build_message(MessageType.ERROR, "INVALID", "Malformed search")
+        
+        if data['mode'] not in (SearchIndex.PREFIX, SearchIndex.SUBSTRING):
+            return codec.build_message(MessageType.ERROR, "INVALID", f"Unknown search mode {data['mode']}")
+        
+        limit = max(1, min(data['limit'], MAX_SEARCH_LIMIT))
+        offset = max(0, data['offset'])
+        matches, next_offset = self.index_manager.search_files(data['query'], data['mode'], limit, offset)
+        
+        self.logger.debug("Search %s '%s': %d match(es)", data['mode'], data['query'], len(matches))
+        return codec.build_message(MessageType.MATCHES, next_offset, matches)
+    
+    def _handle_discover_delta(self, data, codec=Protocol):
+        """
+        Handle DISCOVER_DELTA message - index changes since a version
+        
+        Args:
+            data: Parsed message data (epoch, version)
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: DELTA with the changes, or SNAPSHOT if the client must reload
+        """
+        epoch = data.get('epoch') if data else None
+        version = data.get('version', 0) if data else 0
+        
+        current, changes = self.index_manager.get_changes_since(epoch, version)
+        
+        if changes is None:
+            self.logger.debug("Discover delta from %s: snapshot required", version)
+            return codec.build_message(MessageType.SNAPSHOT, self.index_manager.epoch, current)
+        
+        self.logger.debug("Discover delta from %s: %d change(s)", version, len(changes))
+        return codec.build_message(MessageType.DELTA, self.index_manager.epoch, current, changes)
+    
+    def _handle_subscribe(self, data, client_socket, codec=Protocol):
+        """
+        Handle SUBSCRIBE message - start pushing index changes
+        
+        Args:
+            data: Parsed message data (optional filename pattern)
+            client_socket: Socket to push the events on
+            codec: Codec of the request (Protocol or BinaryProtocol)
+            
+        Returns:
+            str: Response message
+        """
+        with self.connections_lock:
+            if client_socket in self.subscriptions:
+                return codec.build_message(MessageType.ERROR, "INVALID", "Already subscribed")
+            subscription = Subscription(data.get('pattern'), codec=codec)
+            self.subscriptions[client_socket] = subscription
+        
+        self.index_manager.add_change_listener(subscription.on_change)
+        self.logger.info(f"Subscriber added (pattern: {subscription.pattern or '*'})")
+        return codec.build_message(MessageType.OK, "subscribed")
+    
+    def _close_replica(self, client_socket):
+        """
+        Forget a closed replica connection
+        
+        Args:
+            client_socket: Socket (ignored if not a replica connection)
+        """
+        with self.connections_lock:
+            self.replica_connections.pop(client_socket, None)
+    
+    def _close_subscription(self, client_socket):
+        """
+        Stop pushing events to a connection
+        
+        Args:
+            client_socket: Subscribed socket (ignored if not subscribed)
+        """
+        with self.connections_lock:
+            subscription = self.subscriptions.pop(client_socket, None)
+        if subscription:
+            self.index_manager.remove_change_listener(subscription.on_change)
+    
+    def _push_events(self, client_socket):
+        """
+        Push coalesced index events to a subscriber until it disconnects
+        
+        One batch is written at a time: while a slow subscriber is being
+        written to, further events coalesce in its bounded queue and never
+        hold up the index or other connections.
+        
+        Args:
+            client_socket: Subscribed socket
+        """
+        with self.connections_lock:
+            subscription = self.subscriptions[client_socket]
+        wake = threading.Event()
+        subscription.notify = wake.set
+        wake.set()
+        
+        try:
+            while self.running:
+                if wake.wait(1.0):
+                    # Let a burst of changes gather into one message
+                    time.sleep(SUBSCRIBE_COALESCE_DELAY)
+                    wake.clear()
+                    for message in subscription.build_messages(self.index_manager):
+                        client_socket.sendall(Protocol.frame(message))
+                
+                # Subscribers do not send requests: readable means BYE or EOF
+                readable, _, _ = select.select([client_socket], [], [], 0)
+                if readable:
+                    break
+        except OSError as e:
+            self.logger.info(f"Subscriber connection error: {e}")
+    
+    def get_stats(self):
+        """
+        Get the server's metrics (STATS response, HTTP /metrics)
+        
+        Returns:
+            dict: ServerMetrics.snapshot() plus index sizes, registered
+                  clients, subscribers and DISCOVER cache counters
+        """
+        stats = self.metrics.snapshot()
+        stats['index'] = self.index_manager.get_stats()
+        with self.connections_lock:
+            stats['connections']['registered'] = len(self.client_connections)
+            stats['connections']['subscribers'] = len(self.subscriptions)
+        stats['discover_cache'] = self.discover_cache.stats()
+        stats['shard'] = self.shard_index
+        return stats
     
     def _send_message(self, client_socket, message):
         """
@@ -343,8 +935,11 @@ class Server:
             message: Message string
         """
         try:
-            client_socket.send(message.encode(ENCODING))
-            self.logger.debug(f"Sent: {message}")
+            client_socket.sendall(Protocol.frame(message))
+            if isinstance(message, EncodedFrame):
+                self.logger.debug("Sent cached response (%d bytes)", len(message))
+            else:
+                self.logger.debug("Sent: %s", message)
         except Exception as e:
             self.logger.error(f"Error sending message: {e}")
     
@@ -360,12 +955,36 @@ class Server:
         error_msg = Protocol.build_message(MessageType.ERROR, code, description)
         self._send_message(client_socket, error_msg)
     
+    def _close_store(self):
+        """Write a final index snapshot and close the log"""
+        try:
+            self.index_manager.close_store()
+        except Exception as e:
+            self.logger.error(f"Error saving index: {e}")
+    
+    def _snapshot_worker(self):
+        """Background worker to snapshot the index periodically"""
+        while self.running:
+            time.sleep(PERSIST_SNAPSHOT_INTERVAL)
+            if not self.running:
+                break
+            try:
+                self.index_manager.snapshot()
+            except Exception as e:
+                self.logger.error(f"Snapshot error: {e}")
+    
     def _cleanup_worker(self):
-        """Background worker to cleanup inactive clients"""
+        """Background worker to expire inactive clients as their deadlines pass"""
         while self.running:
             try:
-                time.sleep(60)  # Run every minute
-                self.index_manager.cleanup_inactive_clients(timeout=300)
+                # Sleep until the next deadline (bounded, so clients registered
+                # with shorter timeouts are picked up promptly)
+                deadline = self.index_manager.next_expiry()
+                delay = CLEANUP_MAX_SLEEP if deadline is None else deadline - time.time()
+                time.sleep(min(max(delay, 0.01), CLEANUP_MAX_SLEEP))
+                self.index_manager.cleanup_inactive_clients()
+                self.replicator.check_peers()
+                self.rate_limiter.prune()
             except Exception as e:
                 self.logger.error(f"Cleanup error: {e}")
 
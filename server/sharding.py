@@ -0,0 +1,112 @@
+"""
+Sharded Server Deployment
+Runs one index server process per hash partition of the filename space
+"""
+
+import os
+import signal
+import multiprocessing
+from server.server import Server
+from server.event_server import EventLoopServer
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_MODE, SERVER_EVENT_LOOPS, PERSIST_DIR, METRICS_PORT,
+    SERVER_MAX_CONNECTIONS
+)
+from utils import setup_logger
+
+
+def _run_shard(index, host, port, addresses, mode, loops, persist_dir, metrics_port, max_connections):
+    """
+    Entry point of one shard process
+
+    Args:
+        index: Shard index
+        host: Address to listen on
+        port: Port of this shard
+        addresses: Advertised "host:port" of every shard, in shard order
+        mode: 'threaded' or 'event'
+        loops: Number of selector loops in event mode
+        persist_dir: Directory for this shard's index (None = memory only)
+        metrics_port: HTTP metrics port of this shard (None = disabled)
+        max_connections: Connection cap of this shard (0 = unlimited)
+    """
+    # The parent owns Ctrl+C handling and terminates the shards
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if mode == 'event':
+        server = EventLoopServer(host, port, loops=loops, persist_dir=persist_dir,
+                                 shard_index=index, shard_addresses=addresses,
+                                 metrics_port=metrics_port, max_connections=max_connections)
+    else:
+        server = Server(host, port, persist_dir=persist_dir,
+                        shard_index=index, shard_addresses=addresses,
+                        metrics_port=metrics_port, max_connections=max_connections)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    server.start()
+
+
+class ShardedServer:
+    """
+    Multi-process index server
+
+    Shard i is an independent Server process listening on port + i and
+    holding only the filenames with Protocol.shard_of(fname, shards) == i,
+    so FETCH/PUBLISH/UPDATE work spreads over one core per shard. Clients
+    ask any shard for the SHARD_MAP, route file requests by filename and
+    fan DISCOVER/SEARCH out to every shard. With metrics enabled, shard i
+    serves its /metrics endpoint on metrics_port + i.
+    """
+
+    def __init__(self, host=SERVER_HOST, port=SERVER_PORT, shards=None, mode=SERVER_MODE,
+                 loops=SERVER_EVENT_LOOPS, persist_dir=PERSIST_DIR, advertise_host=None,
+                 metrics_port=METRICS_PORT, max_connections=SERVER_MAX_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.shards = shards or os.cpu_count() or 1
+        self.mode = mode
+        self.loops = loops
+        self.persist_dir = persist_dir
+        self.metrics_port = metrics_port
+        self.max_connections = max_connections
+        self.logger = setup_logger('ShardedServer')
+
+        # Address clients use to reach the shards (the listen address may
+        # be a wildcard such as 0.0.0.0)
+        self.advertise_host = advertise_host or host
+        self.addresses = [f"{self.advertise_host}:{port + i}" for i in range(self.shards)]
+        self.processes = []
+
+    def start(self):
+        """Start every shard process and wait for them to exit"""
+        for index in range(self.shards):
+            persist_dir = None
+            if self.persist_dir:
+                persist_dir = os.path.join(self.persist_dir, f"shard-{index}")
+            metrics_port = self.metrics_port + index if self.metrics_port else None
+
+            process = multiprocessing.Process(
+                target=_run_shard,
+                args=(index, self.host, self.port + index, self.addresses,
+                      self.mode, self.loops, persist_dir, metrics_port, self.max_connections),
+                name=f"Shard-{index}",
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+        self.logger.info(f"Started {self.shards} shard(s): {', '.join(self.addresses)}")
+
+        for process in self.processes:
+            process.join()
+
+    def stop(self):
+        """Stop every shard process"""
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout=5)
+
+        self.processes = []
+        self.logger.info("Sharded server stopped")
@@ -0,0 +1,109 @@
+"""
+Index change subscriptions for Server
+Coalescing, bounded event queues for SUBSCRIBE connections
+"""
+
+import re
+import fnmatch
+import threading
+from protocol import Protocol, MessageType
+from config import SUBSCRIBE_QUEUE_LIMIT, SUBSCRIBE_BATCH
+
+
+class Subscription:
+    """
+    Undelivered index events of one subscriber
+
+    Events are keyed by (filename, hostname): a provider that is removed
+    and re-added (or the reverse) before the subscriber was sent the
+    first change cancels out, so a burst of churn costs one entry per
+    provider at most. When more than `limit` distinct events are waiting
+    the queue is dropped and the subscriber is sent a SNAPSHOT instead,
+    telling it to reload the index; the server never buffers without bound
+    for a slow reader.
+    """
+
+    def __init__(self, pattern=None, limit=SUBSCRIBE_QUEUE_LIMIT, codec=Protocol):
+        """
+        Args:
+            pattern: Optional case-insensitive filename glob ("*.mp3")
+            limit: Undelivered events kept before falling back to SNAPSHOT
+            codec: Codec of the SUBSCRIBE request, used for pushed messages
+        """
+        self.pattern = pattern
+        self.codec = codec
+        self.matcher = re.compile(fnmatch.translate(pattern), re.IGNORECASE).match if pattern else None
+        self.limit = limit
+
+        # {(filename, hostname): op} in arrival order
+        self.pending = {}
+        self.overflow = False
+        self.lock = threading.Lock()
+
+        # Called (without arguments) when the queue stops being empty;
+        # set by the connection that delivers the events
+        self.notify = None
+
+    def on_change(self, op, fname, hostname):
+        """
+        Queue one index change (IndexManager change listener)
+
+        Runs with the index write lock held, so it only touches the queue.
+
+        Args:
+            op: '+' provider added, '-' provider removed
+            fname: Filename
+            hostname: Provider hostname
+        """
+        if self.matcher and not self.matcher(fname):
+            return
+
+        with self.lock:
+            if self.overflow:
+                return
+            was_empty = not self.pending
+            key = (fname, hostname)
+            if key in self.pending:
+                if self.pending[key] != op:
+                    # Added then removed (or removed then re-added): no net change
+                    del self.pending[key]
+            elif len(self.pending) >= self.limit:
+                self.pending = {}
+                self.overflow = True
+            else:
+                self.pending[key] = op
+            wake = was_empty and (self.pending or self.overflow)
+
+        if wake and self.notify:
+            self.notify()
+
+    def drain(self):
+        """
+        Take every queued event
+
+        Returns:
+            tuple: (list of (op, filename, hostname), overflowed) - when
+                   overflowed the list is empty and the subscriber must reload
+        """
+        with self.lock:
+            pending, overflow = self.pending, self.overflow
+            self.pending = {}
+            self.overflow = False
+        return [(op, fname, hostname) for (fname, hostname), op in pending.items()], overflow
+
+    def build_messages(self, index_manager):
+        """
+        Drain the queue into push messages
+
+        Args:
+            index_manager: IndexManager the events come from
+
+        Returns:
+            list: EVENTS messages of at most SUBSCRIBE_BATCH changes, or a
+                  single SNAPSHOT message after an overflow
+        """
+        changes, overflow = self.drain()
+        if overflow:
+            return [self.codec.build_message(MessageType.SNAPSHOT, index_manager.epoch, index_manager.version)]
+        return [self.codec.build_message(MessageType.EVENTS, changes[start:start + SUBSCRIBE_BATCH])
+                for start in range(0, len(changes), SUBSCRIBE_BATCH)]
@@ -314,7 +314,7 @@ class ServerGUI:
         # Update files
         self.files_tree.delete(*self.files_tree.get_children())
         for filename, providers in idx_mgr.file_index.items():
-            provider_names = ', '.join([p[0] for p in providers])
+            provider_names = ', '.join(providers)
             self.files_tree.insert('', 'end', values=(
                 filename, provider_names, len(providers)
             ))
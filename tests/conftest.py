@@ -0,0 +1,62 @@
+"""
+Shared fixtures: in-process servers on free loopback ports
+"""
+
+import os
+import sys
+import time
+import socket
+import logging
+import threading
+
+import pytest
+
+# Add project root to path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from server import Server, EventLoopServer
+
+logging.disable(logging.CRITICAL)
+
+
+def free_port():
+    """A TCP port nothing listens on right now"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=5.0):
+    """Poll `condition` until it is true or `timeout` seconds pass"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture(params=['threaded', 'event'])
+def start_server(request):
+    """
+    Start servers in the serving mode of the test parameter
+
+    Returns a function taking Server keyword arguments (port defaults to a
+    free one) and returning the running server; all are stopped afterwards.
+    """
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault('port', free_port())
+        server_class = EventLoopServer if request.param == 'event' else Server
+        server = server_class('127.0.0.1', **kwargs)
+        threading.Thread(target=server.start, daemon=True).start()
+        assert wait_for(lambda: server.running)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        if server.running:
+            server.stop()
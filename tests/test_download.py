@@ -0,0 +1,92 @@
+"""
+Tests for whole-file downloads checked against published piece hashes
+"""
+
+import os
+import socket
+import threading
+
+from conftest import free_port
+from client.client import Client
+from client.file_manager import FileManager
+from client.peer_server import PeerServer
+from client.piece_map import PieceMap
+from protocol import Protocol, MessageType, MessageStream
+from utils import leaf_hash, merkle_root
+
+PIECE = 1024
+DATA = os.urandom(4 * PIECE + 100)
+LEAVES = [leaf_hash(DATA[offset:offset + PIECE]) for offset in range(0, len(DATA), PIECE)]
+CONTENT = (len(DATA), PIECE, merkle_root(LEAVES))
+
+
+def serve_whole_file(data, hashes=True, cut=None):
+    """
+    A peer that only sends whole files (no ranged GETs)
+
+    Args:
+        data: Bytes sent for the file
+        hashes: Answer GET_HASHES with the true leaves (else ERROR and close)
+        cut: Close the connection after this many bytes of the file
+
+    Returns:
+        str: Provider hostname
+    """
+    listener = socket.create_server(('127.0.0.1', 0))
+
+    def run():
+        while True:
+            sock, _ = listener.accept()
+            with sock:
+                stream = MessageStream(sock)
+                msg_type, msg_data = Protocol.parse_message(stream.recv())
+                if msg_type == MessageType.GET_HASHES:
+                    if not hashes:
+                        stream.send(Protocol.build_message(MessageType.ERROR, "INVALID", "Invalid request"))
+                        continue
+                    stream.send(Protocol.build_message(MessageType.HASHES, msg_data['fname'], PIECE, LEAVES))
+                    msg_type, msg_data = Protocol.parse_message(stream.recv())
+                stream.send(Protocol.build_message(MessageType.DATA, msg_data['fname'], len(data)))
+                sock.sendall(data[:cut])
+
+    threading.Thread(target=run, daemon=True).start()
+    return f"127.0.0.1:{listener.getsockname()[1]}"
+
+
+def saved_map(client, fname):
+    return PieceMap.load(client.file_manager.piece_map_path(fname))
+
+
+def test_corrupt_piece_is_refetched_alone(tmp_path):
+    client = Client('peer1', free_port(), str(tmp_path / 'client'))
+    corrupt = bytearray(DATA)
+    corrupt[PIECE + 7] ^= 0xFF
+
+    assert not client._download_from_peer('f.bin', serve_whole_file(bytes(corrupt)), CONTENT)
+    assert saved_map(client, 'f.bin').missing() == [1]
+
+    # An honest provider only has to send the bad piece
+    owner = FileManager(str(tmp_path / 'owner'))
+    with open(owner.get_file_path('f.bin'), 'wb') as f:
+        f.write(DATA)
+    peer = PeerServer('127.0.0.1', free_port(), owner)
+    peer.start()
+    try:
+        assert client._download_from_peer('f.bin', f"127.0.0.1:{peer.port}", CONTENT)
+    finally:
+        peer.stop()
+    with open(client.file_manager.get_file_path('f.bin'), 'rb') as f:
+        assert f.read() == DATA
+
+
+def test_unverified_pieces_are_not_resumed(tmp_path):
+    client = Client('peer1', free_port(), str(tmp_path / 'client'))
+
+    # No hashes from the peer: nothing counts as done until the file is whole
+    provider = serve_whole_file(DATA, hashes=False, cut=3 * PIECE)
+    assert not client._download_from_peer('f.bin', provider, CONTENT)
+    assert saved_map(client, 'f.bin').missing() == list(range(len(LEAVES)))
+
+    assert client._download_from_peer('f.bin', serve_whole_file(DATA, hashes=False), CONTENT)
+    with open(client.file_manager.get_file_path('f.bin'), 'rb') as f:
+        assert f.read() == DATA
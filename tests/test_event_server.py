@@ -0,0 +1,58 @@
+"""
+Tests for the event-loop server's output buffering
+"""
+
+import socket
+import threading
+
+from conftest import wait_for
+from server import event_server
+from protocol import Protocol, MessageType, FrameDecoder
+from config import BUFFER_SIZE
+
+LIMIT = 64 * 1024
+REQUESTS = 20000
+
+
+def test_pipelining_client_is_not_buffered_without_bound(monkeypatch, start_server):
+    monkeypatch.setattr(event_server, 'SERVER_OUTBUF_LIMIT', LIMIT)
+    server = start_server()
+    if not isinstance(server, event_server.EventLoopServer):
+        return  # A threaded handler blocks in send() instead of buffering
+
+    # Large responses, so the kernel buffers fill up quickly
+    for i in range(20):
+        hostname = f"provider-with-a-long-name-{i:02d}:{7000 + i}"
+        server.index_manager.register_client(hostname, 7000 + i)
+        server.index_manager.register_file('hot.bin', hostname)
+    request = Protocol.frame(Protocol.build_message(MessageType.FETCH, 'hot.bin'))
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect(('127.0.0.1', server.port))
+    sender = threading.Thread(target=sock.sendall, args=(request * REQUESTS,), daemon=True)
+    sender.start()
+
+    # Nobody reads the responses: the server must stop reading requests
+    def outbuf():
+        return sum(len(conn.outbuf) for loop in server.loops for conn in loop.connections.values())
+
+    assert wait_for(lambda: outbuf() > LIMIT)
+    largest = 0
+    for _ in range(20):
+        largest = max(largest, outbuf())
+        threading.Event().wait(0.02)
+    # Exceeded by at most the responses to one read's worth of requests
+    response = Protocol.frame(server._handle_message(Protocol.build_message(MessageType.FETCH, 'hot.bin'),
+                                                     None, None)[1])
+    assert largest <= LIMIT + (BUFFER_SIZE // len(request) + 1) * len(response)
+
+    # Reading resumes as the client drains its responses
+    decoder, responses = FrameDecoder(), 0
+    while responses < REQUESTS:
+        data = sock.recv(65536)
+        assert data
+        for message in decoder.feed(data):
+            assert Protocol.parse_message(message)[0] == MessageType.RESULT
+            responses += 1
+    sender.join(5)
+    sock.close()
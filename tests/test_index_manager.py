@@ -0,0 +1,83 @@
+"""
+Tests for IndexManager provider load accounting
+"""
+
+import threading
+
+from server.index_manager import IndexManager
+
+PROVIDERS = [f"peer{i}:600{i}" for i in range(4)]
+
+
+def make_index():
+    index = IndexManager()
+    for hostname in PROVIDERS:
+        index.register_client(hostname, int(hostname.rsplit(':', 1)[1]))
+        index.register_file('hot.bin', hostname)
+    return index
+
+
+def test_ping_waits_for_ranking_in_progress():
+    """A PING never lands between a lookup's ranking and its charge"""
+    index = make_index()
+    ranking, release = threading.Event(), threading.Event()
+    provider_rank = index._provider_rank
+
+    def paused_rank(hostname, now):
+        if not ranking.is_set():
+            ranking.set()
+            release.wait(5)
+        return provider_rank(hostname, now)
+
+    index._provider_rank = paused_rank
+    lookup = threading.Thread(target=index.lookup_providers, args=('hot.bin',))
+    lookup.start()
+    assert ranking.wait(5)
+
+    def pings():
+        for hostname in PROVIDERS:
+            index.update_client_liveness(hostname, uploads=2, upload_rate=0)
+
+    ping = threading.Thread(target=pings)
+    ping.start()
+    ping.join(0.2)
+    assert ping.is_alive()
+
+    release.set()
+    lookup.join()
+    ping.join()
+
+    # The PING came last: only the reported load is left
+    for hostname in PROVIDERS:
+        info = index.client_registry[hostname]
+        assert (info['uploads'], info['assigned']) == (2, 0)
+
+
+def test_lookup_charges_first_provider():
+    index = make_index()
+    for hostname in PROVIDERS:
+        index.update_client_liveness(hostname, uploads=0, upload_rate=0)
+
+    first = index.lookup_providers('hot.bin')[0]
+    assert index.client_registry[first]['assigned'] == 1
+    assert sum(index.client_registry[hostname]['assigned'] for hostname in PROVIDERS) == 1
+
+
+def test_reconnect_during_batched_removal_keeps_synced_files():
+    """Files re-synced before the old entries are removed stay indexed"""
+    index = IndexManager(write_batch=1)
+    index.register_client('peer9:6009', 6009)
+    assert index.sync_client_files('peer9:6009', ['a', 'b', 'c'])
+
+    # Deregistration as deregister_client does it, with the batches held back
+    with index.lock.write_lock():
+        old_files = list(index.client_registry.pop('peer9:6009')['files'])
+
+    index.register_client('peer9:6009', 6009)
+    assert index.sync_client_files('peer9:6009', ['a', 'b'])
+    index._remove_providers_batched('peer9:6009', old_files)
+
+    assert index.lookup_providers('a') == ['peer9:6009']
+    assert index.lookup_providers('b') == ['peer9:6009']
+    assert index.lookup_providers('c') == []
+    assert set(index.get_all_files('peer9:6009')) == {'a', 'b'}
@@ -0,0 +1,42 @@
+"""
+Tests for per-client admission control
+"""
+
+import socket
+
+from config import RATE_LIMITS
+from protocol import Protocol, MessageType, MessageStream
+from server.rate_limit import RateLimiter
+
+
+def test_every_index_request_is_limited():
+    limiter = RateLimiter()
+    for msg_type in (MessageType.DISCOVER, MessageType.DISCOVER_DELTA, MessageType.DISCOVER_PAGE,
+                     MessageType.UPDATE, MessageType.UPDATE_DELTA, MessageType.SEARCH,
+                     MessageType.FETCH_MANY):
+        rate, burst = RATE_LIMITS[msg_type]
+        assert [limiter.check('10.0.0.1', msg_type, now=0.0) for _ in range(burst)] == [0.0] * burst
+        assert limiter.check('10.0.0.1', msg_type, now=0.0) > 0
+
+
+def test_replication_is_not_limited():
+    limiter = RateLimiter(default=(1, 1))
+    for msg_type in (MessageType.REPLICA_HELLO, MessageType.MUTATIONS):
+        assert not any(limiter.check('10.0.0.1', msg_type, now=0.0) for _ in range(10))
+
+
+def test_discover_page_loop_gets_busy(start_server):
+    server = start_server()
+    _, burst = RATE_LIMITS[MessageType.DISCOVER_PAGE]
+    page = Protocol.build_message(MessageType.DISCOVER_PAGE, 10, None)
+
+    with socket.create_connection(('127.0.0.1', server.port)) as sock:
+        stream = MessageStream(sock)
+        for _ in range(burst * 2):
+            stream.send(page)
+            msg_type, data = Protocol.parse_message(stream.recv())
+            if msg_type == MessageType.ERROR:
+                break
+
+    assert msg_type == MessageType.ERROR
+    assert data['code'] == 'BUSY' and data['retry_after'] > 0
@@ -0,0 +1,156 @@
+"""
+Tests for replica failover and the replication stream
+"""
+
+import os
+import sys
+import socket
+import subprocess
+
+import pytest
+
+from conftest import ROOT, free_port, wait_for
+from client import client as client_module
+from client.client import Client
+from client.server_connection import ServerConnection
+from protocol import Protocol, MessageType
+
+HOSTNAME = Protocol.format_hostname('peer1', 6001)
+
+
+def launch_server(port, mode, *args):
+    """Run a server process and wait until it accepts connections"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'run_server.py'), '--host', '127.0.0.1',
+         '--port', str(port), '--mode', mode, *args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    def listening():
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            return False
+
+    assert wait_for(listening, timeout=10)
+    return process
+
+
+def register(server, files):
+    """Connect as HOSTNAME and publish `files`"""
+    conn = ServerConnection('127.0.0.1', server.port)
+    conn.hello_message = Protocol.build_message(MessageType.HELLO, 'peer1', 6001)
+    assert conn.connect()
+    response = conn.request(Protocol.build_message(MessageType.UPDATE, HOSTNAME, files))
+    assert Protocol.parse_message(response)[0] == MessageType.OK
+    return conn
+
+
+def indexed(server):
+    return set(server.index_manager.get_all_files(HOSTNAME))
+
+
+@pytest.mark.parametrize('mode', ['threaded', 'event'])
+def test_delta_after_failover_sends_full_list(tmp_path, monkeypatch, mode):
+    """Primary killed between two deltas: the survivor gets the whole list"""
+    primary_port, backup_port = free_port(), free_port()
+    primary = launch_server(primary_port, mode)
+    backup = launch_server(backup_port, mode)
+    client_port = free_port()
+    client = Client('peer1', client_port, str(tmp_path / 'repo'))
+    try:
+        # Start at the primary rather than a random replica
+        monkeypatch.setattr(client_module.random, 'randrange', lambda n: 0)
+        (tmp_path / 'repo' / 'f1.txt').write_text('one')
+        assert client.connect_to_server('127.0.0.1', primary_port, replicas=[f"127.0.0.1:{backup_port}"])
+        (tmp_path / 'repo' / 'f2.txt').write_text('two')
+        assert client.update_file_list()
+        assert client.servers[0].update_seq == 1
+
+        primary.kill()
+        primary.wait()
+
+        (tmp_path / 'repo' / 'f3.txt').write_text('three')
+        assert client.update_file_list()
+        server = client.servers[0]
+        assert server.port == backup_port
+        assert server.synced_files == {'f1.txt', 'f2.txt', 'f3.txt'}
+
+        # The backup has no peers: it only knows what the client sent it
+        probe = ServerConnection('127.0.0.1', backup_port)
+        assert probe.connect()
+        for fname in ('f1.txt', 'f2.txt', 'f3.txt'):
+            response = probe.request(Protocol.build_message(MessageType.FETCH, fname))
+            assert Protocol.parse_message(response) == (MessageType.RESULT, {'hostnames': [f"peer1:{client_port}"]})
+        probe.close()
+    finally:
+        client.disconnect_from_server()
+        for process in (primary, backup):
+            process.kill()
+            process.wait()
+
+
+def test_graceful_stop_keeps_clients_on_peers(start_server):
+    """Clients dropped by a stopping replica stay registered on its peers"""
+    ports = free_port(), free_port()
+    peers = [f"127.0.0.1:{port}" for port in ports]
+    first = start_server(port=ports[0], replica_peers=peers)
+    second = start_server(port=ports[1], replica_peers=peers)
+
+    conn = register(first, ['a.txt', 'b.txt'])
+    assert wait_for(lambda: indexed(second) == {'a.txt', 'b.txt'})
+
+    first.stop()
+    conn.close()
+    assert not wait_for(lambda: indexed(second) != {'a.txt', 'b.txt'}, timeout=1.0)
+
+
+def send(server, *messages):
+    """Send messages on one fresh connection, returning the last response"""
+    conn = ServerConnection('127.0.0.1', server.port)
+    assert conn.connect()
+    try:
+        for message in messages:
+            response = conn.request(message)
+        return Protocol.parse_message(response)
+    finally:
+        conn.close()
+
+
+FORGED = [['C', 'evil:1', 1], ['+', 'forged.txt', 'evil:1']]
+
+
+def test_mutations_rejected_without_replication(start_server):
+    server = start_server()
+    peer = f"127.0.0.1:{server.port}"
+
+    msg_type, data = send(server, Protocol.build_message(MessageType.MUTATIONS, peer, FORGED))
+    assert (msg_type, data['code']) == (MessageType.ERROR, 'INVALID')
+
+    msg_type, data = send(server, Protocol.build_message(MessageType.REPLICA_HELLO, peer))
+    assert (msg_type, data['code']) == (MessageType.ERROR, 'INVALID')
+    assert 'forged.txt' not in server.index_manager.get_all_files()
+
+
+def test_mutations_rejected_from_unidentified_connection(start_server):
+    port = free_port()
+    peer = f"127.0.0.1:{free_port()}"
+    server = start_server(port=port, replica_peers=[f"127.0.0.1:{port}", peer])
+
+    # Claiming a configured peer as origin is not enough
+    msg_type, data = send(server, Protocol.build_message(MessageType.MUTATIONS, peer, FORGED))
+    assert (msg_type, data['code']) == (MessageType.ERROR, 'INVALID')
+
+    # Nor is identifying as a replica that is not configured
+    msg_type, data = send(
+        server,
+        Protocol.build_message(MessageType.REPLICA_HELLO, '127.0.0.1:1'),
+        Protocol.build_message(MessageType.MUTATIONS, '127.0.0.1:1', FORGED)
+    )
+    assert (msg_type, data['code']) == (MessageType.ERROR, 'INVALID')
+
+    # The configured peer itself is accepted (MUTATIONS gets no response)
+    msg_type, data = send(server, Protocol.build_message(MessageType.REPLICA_HELLO, peer))
+    assert msg_type == MessageType.OK
+    assert 'forged.txt' not in server.index_manager.get_all_files()
@@ -4,13 +4,28 @@ Logging utilities for the application
 
 import logging
 import sys
-from config import LOG_LEVEL, LOG_FORMAT
+from config import LOG_LEVEL, LOG_FORMAT, LOG_ASYNC, LOG_QUEUE_SIZE, LOG_SAMPLE_PER_SECOND
+from utils.rwlock import ReadWriteLock
+from utils.async_logging import AsyncQueueHandler, SampleFilter
+from utils.merkle import leaf_hash, merkle_root, file_leaves
+
+__all__ = ['setup_logger', 'ReadWriteLock', 'leaf_hash', 'merkle_root', 'file_leaves']
+
+# Shared by every logger, so each call site has one sampling window
+_sample_filter = SampleFilter(LOG_SAMPLE_PER_SECOND)
 
 
 def setup_logger(name, level=None):
     """
     Setup logger with consistent formatting
     
+    With LOG_ASYNC the logger only queues records and a background thread
+    writes them to stdout, so request threads never wait on the console.
+    INFO/DEBUG records are sampled per call site (LOG_SAMPLE_PER_SECOND).
+    Pass arguments lazily (`logger.info("Lookup %s", fname)`) on hot
+    paths: they are then formatted by the writer thread, and not at all
+    when the level is disabled.
+    
     Args:
         name: Logger name
         level: Log level (default from config)
@@ -26,12 +41,15 @@ def setup_logger(name, level=None):
     
     # Avoid duplicate handlers
     if not logger.handlers:
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(getattr(logging, level))
-        
         formatter = logging.Formatter(LOG_FORMAT)
-        handler.setFormatter(formatter)
+        if LOG_ASYNC:
+            handler = AsyncQueueHandler(LOG_QUEUE_SIZE, formatter)
+        else:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(formatter)
+        handler.setLevel(getattr(logging, level))
         
         logger.addHandler(handler)
+        logger.addFilter(_sample_filter)
     
     return logger
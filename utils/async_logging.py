@@ -0,0 +1,138 @@
+"""
+Non-blocking logging pipeline
+Records are queued by the logging thread and written by a background listener
+"""
+
+import os
+import sys
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# Per-process queue and listener (recreated in forked children, whose
+# copy of the parent's queue has no listener draining it)
+_state_lock = threading.Lock()
+_queue = None
+_listener = None
+_pid = None
+
+
+def get_log_queue(formatter):
+    """
+    Get this process's log queue, starting its listener on first use
+
+    Args:
+        formatter: Formatter used by the listener's stdout handler
+
+    Returns:
+        queue.SimpleQueue: Queue drained by the listener thread
+    """
+    global _queue, _listener, _pid
+    if _pid == os.getpid():
+        return _queue
+
+    with _state_lock:
+        if _pid != os.getpid():
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(formatter)
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, handler)
+            listener.start()
+            atexit.register(_stop_listener, listener)
+            _queue, _listener, _pid = log_queue, listener, os.getpid()
+    return _queue
+
+
+def _stop_listener(listener):
+    """Flush queued records at interpreter exit"""
+    try:
+        listener.stop()
+    except Exception:
+        pass
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks or formats in the logging thread
+
+    Records are queued as they are (the listener merges their arguments,
+    so `logger.info("Lookup %s", fname)` is only formatted off the hot
+    path). The queue is a lock-free SimpleQueue bounded by checking its
+    length: when the writer falls behind by `size` records, new records
+    are dropped and counted, and a warning with the count is queued once
+    there is room again.
+    """
+
+    def __init__(self, size, formatter):
+        """
+        Args:
+            size: Queue capacity in records
+            formatter: Formatter for the listener's output
+        """
+        super().__init__(None)
+        self.size = size
+        self.output_formatter = formatter
+        self.dropped = 0
+
+    def prepare(self, record):
+        """Queue the record unformatted"""
+        return record
+
+    def enqueue(self, record):
+        """Queue a record without waiting; drop it if the queue is full"""
+        log_queue = get_log_queue(self.output_formatter)
+        if log_queue.qsize() >= self.size:
+            self.dropped += 1
+            return
+        if self.dropped:
+            notice = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                       "Log queue full: dropped %d record(s)", (self.dropped,), None)
+            log_queue.put(notice)
+            self.dropped = 0
+        log_queue.put(record)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Rate limit INFO/DEBUG records per call site
+
+    At most `per_second` records from one logging call (file and line)
+    pass per one-second window; the rest are counted, and the first
+    record of the next window reports how many were suppressed. Warnings
+    and errors always pass.
+    """
+
+    def __init__(self, per_second):
+        """
+        Args:
+            per_second: Records per call site per second (0 = no limit)
+        """
+        super().__init__()
+        self.per_second = per_second
+
+        # {(pathname, lineno): [window start, passed, suppressed]}
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.per_second or record.levelno > logging.INFO:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = record.created
+        with self.lock:
+            window = self.windows.get(key)
+            if window is not None and now - window[0] < 1.0:
+                if window[1] < self.per_second:
+                    window[1] += 1
+                    return True
+                window[2] += 1
+                return False
+            suppressed = window[2] if window else 0
+            self.windows[key] = [now, 1, 0]
+
+        if suppressed:
+            record.msg = f"{record.msg} (+{suppressed} similar suppressed)"
+        return True
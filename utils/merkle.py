@@ -0,0 +1,72 @@
+"""
+Merkle hashes of file pieces
+SHA-256 leaves per piece and the root that authenticates them
+"""
+
+import hashlib
+
+# Domain-separation prefixes (as in RFC 6962), so a leaf can never be
+# passed off as an interior node or the other way round
+_LEAF = b'\x00'
+_NODE = b'\x01'
+
+
+def leaf_hash(data):
+    """
+    Hash one piece
+
+    Args:
+        data: Piece bytes (any bytes-like object)
+
+    Returns:
+        bytes: 32-byte leaf digest
+    """
+    digest = hashlib.sha256(_LEAF)
+    digest.update(data)
+    return digest.digest()
+
+
+def merkle_root(leaves):
+    """
+    Compute the root over the leaf digests of a file's pieces
+
+    Pairs are hashed level by level; an odd node at the end of a level is
+    carried up unchanged. The root of a single piece is its leaf digest.
+
+    Args:
+        leaves: Leaf digests in piece order (at least one)
+
+    Returns:
+        bytes: 32-byte root digest
+    """
+    level = list(leaves)
+    while len(level) > 1:
+        paired = [hashlib.sha256(_NODE + level[i] + level[i + 1]).digest()
+                  for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0]
+
+
+def file_leaves(path, piece_size):
+    """
+    Hash every piece of a file
+
+    Args:
+        path: File path
+        piece_size: Bytes per piece
+
+    Returns:
+        list: Leaf digests in piece order (one leaf for an empty file)
+    """
+    leaves = []
+    with open(path, 'rb') as f:
+        while True:
+            piece = f.read(piece_size)
+            if not piece and leaves:
+                break
+            leaves.append(leaf_hash(piece))
+            if len(piece) < piece_size:
+                break
+    return leaves
@@ -0,0 +1,116 @@
+"""
+Reader/writer lock
+"""
+
+import time
+import threading
+
+
+class _Guard:
+    """Reusable context manager around an acquire/release pair"""
+
+    __slots__ = ('_acquire', '_release')
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._release()
+
+
+class ReadWriteLock:
+    """
+    Lock allowing many concurrent readers or a single writer
+
+    Phase-fair: a waiting writer blocks new readers, and when a writer
+    releases, every reader already waiting is admitted before the next
+    writer. Neither side can starve the other, and a writer that releases
+    between batches lets queued readers through after every batch.
+
+    Acquisitions are counted per mode, and `wait_observer(mode, seconds)`,
+    when set, is called after every acquisition that had to block, so
+    uncontended acquisitions never pay for timing.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._readers_waiting = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+        # Readers that were waiting when the last writer released are owed
+        # a turn before the next writer; the generation tells them apart
+        # from readers that arrived later
+        self._write_gen = 0
+        self._read_turn = 0
+
+        self.read_acquisitions = 0
+        self.write_acquisitions = 0
+        self.wait_observer = None
+
+        self._read_guard = _Guard(self.acquire_read, self.release_read)
+        self._write_guard = _Guard(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        """Acquire the lock for reading"""
+        waited = 0.0
+        with self._cond:
+            gen = self._write_gen
+            self._readers_waiting += 1
+            if self._writer or (self._writers_waiting and gen == self._write_gen):
+                start = time.perf_counter()
+                while self._writer or (self._writers_waiting and gen == self._write_gen):
+                    self._cond.wait()
+                waited = time.perf_counter() - start
+            self._readers_waiting -= 1
+            self._readers += 1
+            self.read_acquisitions += 1
+            if gen != self._write_gen:
+                self._read_turn -= 1
+        if waited and self.wait_observer:
+            self.wait_observer('read', waited)
+
+    def release_read(self):
+        """Release a read acquisition"""
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """Acquire the lock for writing"""
+        waited = 0.0
+        with self._cond:
+            self._writers_waiting += 1
+            if self._writer or self._readers or self._read_turn:
+                start = time.perf_counter()
+                while self._writer or self._readers or self._read_turn:
+                    self._cond.wait()
+                waited = time.perf_counter() - start
+            self._writers_waiting -= 1
+            self._writer = True
+            self.write_acquisitions += 1
+        if waited and self.wait_observer:
+            self.wait_observer('write', waited)
+
+    def release_write(self):
+        """Release a write acquisition"""
+        with self._cond:
+            self._writer = False
+            self._write_gen += 1
+            self._read_turn = self._readers_waiting
+            self._cond.notify_all()
+
+    def read_lock(self):
+        """Context manager for a read acquisition"""
+        return self._read_guard
+
+    def write_lock(self):
+        """Context manager for a write acquisition"""
+        return self._write_guard